@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.db.models import Q
 from django.http import HttpResponse
 from django.utils import timezone
 from django.contrib.auth.decorators import login_required
@@ -156,9 +157,17 @@ class AgentAdmin(admin.ModelAdmin):
         return response
     export_as_excel.short_description = "Export selected agents as Excel"
 
+def own_agent_ids(user):
+    """Agents a user with the agent role acts as: linked to the user, or with their email"""
+    match = Q(user=user)
+    if user.email:
+        match |= Q(email=user.email)
+    return Agent.objects.filter(match).values_list('pk', flat=True)
+
 class AgentContactAdmin(admin.ModelAdmin):
-    list_display = ('user_name', 'agentname', 'user_email', 'contact_date')
-    list_filter = ('agentname', 'contact_date')
+    list_display = ('user_name', 'agent', 'user_email', 'contact_date')
+    list_filter = ('agent', 'contact_date')
+    list_select_related = ('agent',)
     search_fields = ('user_name', 'user_email', 'agentname')
     ordering = ('-contact_date',)
     actions = ['export_as_csv', 'export_as_excel']
@@ -176,7 +185,7 @@ class AgentContactAdmin(admin.ModelAdmin):
                 return True
             # Employees can only view contacts for themselves
             elif agent_role.role == 'agent' and obj:
-                return obj.agentname == request.user.first_name + ' ' + request.user.last_name
+                return obj.agent_id in set(own_agent_ids(request.user))
             return False
         except AgentRole.DoesNotExist:
             return False
@@ -200,8 +209,7 @@ class AgentContactAdmin(admin.ModelAdmin):
                 return qs
             elif agent_role.role == 'agent':
                 # Employees can only see contacts for themselves
-                agent_name = request.user.first_name + ' ' + request.user.last_name
-                return qs.filter(agentname=agent_name)
+                return qs.filter(agent__in=own_agent_ids(request.user))
         except AgentRole.DoesNotExist:
             return qs.none()
         return qs
@@ -253,8 +261,11 @@ class AgentContactAdmin(admin.ModelAdmin):
     export_as_excel.short_description = "Export selected contacts as Excel"
 
 class AgentPropertyContactAdmin(admin.ModelAdmin):
-    list_display = ('user_name', 'agentname', 'property_title', 'user_email', 'contact_date')
-    list_filter = ('agentname', 'contact_date', 'property_title')
+    list_display = ('user_name', 'agent', 'property_title', 'user_email', 'contact_date')
+    # Only the listings that have enquiries, not every listing on the site
+    list_filter = ('agent', 'contact_date', ('listing', admin.RelatedOnlyFieldListFilter))
+    list_select_related = ('agent',)
+    raw_id_fields = ('listing',)
     search_fields = ('user_name', 'user_email', 'agentname', 'property_title')
     ordering = ('-contact_date',)
     actions = ['export_as_csv', 'export_as_excel']
@@ -272,7 +283,7 @@ class AgentPropertyContactAdmin(admin.ModelAdmin):
                 return True
             # Employees can only view contacts for themselves
             elif agent_role.role == 'agent' and obj:
-                return obj.agentname == request.user.first_name + ' ' + request.user.last_name
+                return obj.agent_id in set(own_agent_ids(request.user))
             return False
         except AgentRole.DoesNotExist:
             return False
@@ -296,8 +307,7 @@ class AgentPropertyContactAdmin(admin.ModelAdmin):
                 return qs
             elif agent_role.role == 'agent':
                 # Employees can only see contacts for themselves
-                agent_name = request.user.first_name + ' ' + request.user.last_name
-                return qs.filter(agentname=agent_name)
+                return qs.filter(agent__in=own_agent_ids(request.user))
         except AgentRole.DoesNotExist:
             return qs.none()
         return qs
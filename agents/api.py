@@ -0,0 +1,15 @@
+from shelter.api import CachedReadOnlyViewSet
+from .models import Agent
+from .serializers import AgentSerializer
+from .stats import with_listing_stats
+
+
+class AgentViewSet(CachedReadOnlyViewSet):
+    """Agents with their listing figures"""
+    serializer_class = AgentSerializer
+    lookup_url_kwarg = 'agent_id'
+    versions = ('agent', 'listing')
+
+    def get_queryset(self):
+        agents = Agent.objects.only(*AgentSerializer.model_fields(self.request)).order_by('pk')
+        return with_listing_stats(agents)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_agent_user'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
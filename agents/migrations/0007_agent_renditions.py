@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0006_agent_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='renditions',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Resized copies of the photos, see shelter.images'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0007_agent_renditions'),
+        ('shelter', '0013_leadtouch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agentcontact',
+            name='agent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='contacts', to='agents.agent'),
+        ),
+        migrations.AddField(
+            model_name='agentpropertycontact',
+            name='agent',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='property_contacts', to='agents.agent'),
+        ),
+        migrations.AddField(
+            model_name='agentpropertycontact',
+            name='listing',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agent_contacts', to='shelter.listening'),
+        ),
+    ]
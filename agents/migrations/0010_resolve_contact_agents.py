@@ -0,0 +1,66 @@
+from collections import defaultdict
+from django.db import migrations
+
+BATCH_SIZE = 2000
+
+
+def _unique(pairs):
+    # key -> value where the key names exactly one row, ambiguous keys dropped
+    found = defaultdict(set)
+    for key, value in pairs:
+        found[key].add(value)
+    return {key: values.pop() for key, values in found.items() if len(values) == 1}
+
+
+def _batches(queryset):
+    last = 0
+    while True:
+        batch = list(queryset.filter(pk__gt=last).order_by('pk')[:BATCH_SIZE])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1].pk
+
+
+def resolve_contacts(apps, schema_editor):
+    """Point existing enquiries at their agent and listing by the names they recorded"""
+    db = schema_editor.connection.alias
+    Agent = apps.get_model('agents', 'Agent')
+    Listening = apps.get_model('shelter', 'Listening')
+    agents = _unique((name.strip(), pk) for pk, name in Agent.objects.using(db).values_list('pk', 'name'))
+
+    AgentContact = apps.get_model('agents', 'AgentContact')
+    for batch in _batches(AgentContact.objects.using(db).only('pk', 'agentname')):
+        for contact in batch:
+            contact.agent_id = agents.get(contact.agentname.strip())
+        AgentContact.objects.using(db).bulk_update(batch, ['agent'])
+
+    AgentPropertyContact = apps.get_model('agents', 'AgentPropertyContact')
+    for batch in _batches(AgentPropertyContact.objects.using(db).only('pk', 'agentname', 'property_title')):
+        titles = {contact.property_title for contact in batch}
+        rows = list(Listening.objects.using(db).filter(title__in=titles).values_list('title', 'agent_id', 'pk'))
+        by_title_and_agent = _unique(((title, agent_id), pk) for title, agent_id, pk in rows)
+        by_title = _unique((title, pk) for title, agent_id, pk in rows)
+        listing_agents = {pk: agent_id for title, agent_id, pk in rows}
+        for contact in batch:
+            contact.agent_id = agents.get(contact.agentname.strip())
+            contact.listing_id = (
+                by_title_and_agent.get((contact.property_title, contact.agent_id))
+                or by_title.get(contact.property_title)
+            )
+            if contact.agent_id is None and contact.listing_id:
+                contact.agent_id = listing_agents[contact.listing_id]
+        AgentPropertyContact.objects.using(db).bulk_update(batch, ['agent', 'listing'])
+
+
+# Writing the new foreign keys queues constraint checks until commit, so this
+# runs in a migration of its own, apart from the index changes that follow
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0009_contact_agent_listing'),
+    ]
+
+    operations = [
+        migrations.RunPython(resolve_contacts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0010_resolve_contact_agents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agentcontact',
+            index=models.Index(fields=['agent', '-contact_date'], name='agents_agen_agent_i_ab0239_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='agentpropertycontact',
+            index=models.Index(fields=['agent', '-contact_date'], name='agents_agen_agent_i_aa7fe6_idx'),
+        ),
+    ]
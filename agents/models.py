@@ -35,6 +35,7 @@ class Agent(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True, related_name='agent_profile')
     name = models.CharField(max_length=200)
     photo = models.ImageField(upload_to='agents/%Y/%m/%d')
+    renditions = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of the photos, see shelter.images")
     title = models.CharField(max_length=100, default='Real Estate Agent')
     description = models.TextField(blank=True)
     phone = models.CharField(max_length=20)
@@ -48,6 +49,7 @@ class Agent(models.Model):
         help_text="Enter work experience points separated by the '|' character. Each point will be displayed as a separate bullet point on the frontend."
     )
     is_mvp = models.BooleanField(default=False, help_text="Whether this agent is an MVP (Most Valuable Player)")
+    updated = models.DateTimeField(auto_now=True)
 
     def work_experience_as_list(self):
         """Returns work_experience as a list of bullet points"""
@@ -65,6 +67,9 @@ class Agent(models.Model):
 
 
 class AgentContact(models.Model):
+    # The indexed (agent, contact_date) pair below serves inboxes and counts
+    agent = models.ForeignKey(Agent, on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='contacts')
+    # Name as shown on the form, kept for the record
     agentname = models.CharField(max_length=100)
     user_name = models.CharField(max_length=100)
     user_email = models.EmailField()
@@ -75,7 +80,13 @@ class AgentContact(models.Model):
     def __str__(self):
         return f"{self.user_name} - {self.agentname}"
 
+    class Meta:
+        indexes = [models.Index(fields=['agent', '-contact_date'])]
+
 class AgentPropertyContact(models.Model):
+    agent = models.ForeignKey(Agent, on_delete=models.SET_NULL, null=True, blank=True, db_index=False, related_name='property_contacts')
+    listing = models.ForeignKey('shelter.Listening', on_delete=models.SET_NULL, null=True, blank=True, related_name='agent_contacts')
+    # As shown on the form, kept for the record
     agentname = models.CharField(max_length=100)
     property_title = models.CharField(max_length=200)
     user_name = models.CharField(max_length=100)
@@ -87,6 +98,9 @@ class AgentPropertyContact(models.Model):
     def __str__(self):
         return f"{self.user_name} - {self.property_title} - {self.agentname}"
 
+    class Meta:
+        indexes = [models.Index(fields=['agent', '-contact_date'])]
+
 class WorkNote(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='work_notes')
     title = models.CharField(max_length=200)
@@ -0,0 +1,28 @@
+from rest_framework import serializers
+
+from shelter.serializers import SparseFieldsetMixin
+from .models import Agent
+
+
+class AgentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='agent_detail', lookup_field='pk', lookup_url_kwarg='agent_id')
+    photo = serializers.ImageField(use_url=True)
+    work_experience = serializers.ListField(source='work_experience_as_list', child=serializers.CharField())
+    # From agents.stats.with_listing_stats()
+    listing_count = serializers.IntegerField()
+    active_count = serializers.IntegerField()
+    average_price = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True)
+
+    class Meta:
+        model = Agent
+        fields = (
+            'id', 'url', 'name', 'title', 'photo', 'description', 'phone', 'email',
+            'whatsapp', 'instagram', 'linkedin', 'is_mvp', 'work_experience',
+            'listing_count', 'active_count', 'average_price', 'updated',
+        )
+        source_fields = {
+            'url': (),
+            'listing_count': (),
+            'active_count': (),
+            'average_price': (),
+        }
@@ -0,0 +1,29 @@
+from django.db.models import Avg, Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import AgentContact, AgentPropertyContact
+
+
+def _lead_count(model):
+    # A correlated count on the (agent, contact_date) index, joining the
+    # enquiry tables into the listing join would multiply its rows
+    return Coalesce(Subquery(
+        model.objects.filter(agent=OuterRef('pk')).order_by().values('agent').annotate(
+            total=Count('pk')
+        ).values('total'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def with_listing_stats(queryset):
+    """Annotate agents with listing and lead figures, all in the same query
+
+    listing_count, active_count and average_price (of available listings)
+    come from one join; lead_count adds up both enquiry tables.
+    """
+    return queryset.annotate(
+        listing_count=Count('listening'),
+        active_count=Count('listening', filter=Q(listening__available=True)),
+        average_price=Avg('listening__price', filter=Q(listening__available=True)),
+        lead_count=_lead_count(AgentContact) + _lead_count(AgentPropertyContact),
+    )
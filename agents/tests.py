@@ -1,3 +1,69 @@
-from django.test import TestCase
+from unittest import mock
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from shelter.models import Listening
+from .models import Agent, AgentContact, AgentPropertyContact
+from .stats import with_listing_stats
+
+
+def make_agent(**fields):
+    return Agent.objects.create(**{
+        'name': 'Test Agent', 'photo': 'agents/test.jpg', 'phone': '9812345678', 'email': 'agent@example.com',
+        'whatsapp': '9812345678', 'instagram': '', 'linkedin': '', **fields,
+    })
+
+
+class AgentDetailTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = make_agent(work_experience='Sales lead | Rentals desk')
+
+    def test_work_experience_is_split_once_per_change(self):
+        url = reverse('agent_detail', args=[self.agent.pk])
+        self.assertContains(self.client.get(url), '<li>Rentals desk</li>')
+        with mock.patch.object(Agent, 'work_experience_as_list') as split:
+            self.assertContains(self.client.get(url), '<li>Rentals desk</li>')
+        split.assert_not_called()
+
+        self.agent.work_experience = 'Lettings'
+        self.agent.save()
+        self.assertContains(self.client.get(url), '<li>Lettings</li>')
+
+
+@override_settings(RATE_LIMIT_CACHE='default', LEAD_OUTBOX=False)
+class EnquiryLinkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = make_agent()
+        self.other = make_agent(name='Other Agent', email='other@example.com')
+        self.listing = Listening.objects.create(
+            agent=self.agent, title='Sea view flat', slug='sea-view-flat', image='listings/test.jpg',
+            location='Goa', price=1000000, bedrooms=2, bathrooms=1, area='900 sq ft', kitchen=1, garage=0,
+        )
+
+    def test_property_enquiry_goes_to_the_listing_agent(self):
+        self.client.post(reverse('agent_property_contact'), {
+            'agentname': 'Other Agent', 'agent_id': self.other.pk, 'property_title': 'Sea view flat',
+            'property_slug': self.listing.slug, 'name': 'Asha', 'email': 'asha@example.com',
+            'number': '9812345678', 'textarea': 'Is it free?',
+        })
+        enquiry = AgentPropertyContact.objects.get()
+        self.assertEqual((enquiry.agent, enquiry.listing), (self.agent, self.listing))
+
+    def test_unknown_agent_id_is_not_linked(self):
+        self.client.post(reverse('agentcontact'), {
+            'agentname': 'Gone Agent', 'agent_id': '999999', 'name': 'Asha', 'email': 'asha@example.com',
+            'textarea': 'Hello',
+        })
+        self.assertIsNone(AgentContact.objects.get().agent)
+
+    def test_lead_count_follows_the_foreign_key(self):
+        AgentContact.objects.create(agent=self.agent, agentname='Renamed', user_name='A', user_email='a@example.com',
+                                    user_subject='Hi')
+        AgentPropertyContact.objects.create(agent=self.agent, listing=self.listing, agentname='Renamed',
+                                            property_title='Sea view flat', user_name='B', user_email='b@example.com',
+                                            user_phone='9812345678', user_subject='Hi')
+        counts = dict(with_listing_stats(Agent.objects.all()).values_list('pk', 'lead_count'))
+        self.assertEqual(counts, {self.agent.pk: 2, self.other.pk: 0})
@@ -1,30 +1,59 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import HttpResponse
-from .models import Agent, AgentContact, AgentPropertyContact
+from .models import Agent
 from django.core.paginator import Paginator
+from django.db.models import Count, Max
+from django.http import QueryDict
 from shelter.models import Listening
+from shelter.decorators import conditional_page
+from shelter.pagination import PAGE_SIZE, cached_page, next_page_query
+from shelter.leads import submit_lead
+from shelter.search import apply_filters
+from .stats import with_listing_stats
 
 def agent_list(request):
-    agents = Agent.objects.all()
+    agents = with_listing_stats(Agent.objects.all()).order_by('pk')
     return render(request, 'agents/agents_list.html', {'agents': agents})
 
+def _agent_validators(request, agent_id):
+    row = Agent.objects.filter(pk=agent_id).annotate(
+        listings_updated=Max('listening__updated'),
+        listing_count=Count('listening'),
+    ).values_list('updated', 'listings_updated', 'listing_count').first()
+    if row is None:
+        return None
+    updated, listings_updated, listing_count = row
+    # The page lists the agent's properties, a deleted one only shows in the count
+    last_modified = max(updated, listings_updated) if listings_updated else updated
+    return (agent_id, updated.isoformat(), listings_updated and listings_updated.isoformat(), listing_count), last_modified
+
+@conditional_page(_agent_validators)
 def agent_detail(request, agent_id):
     agent = get_object_or_404(Agent, pk=agent_id)
-    # Get all properties listed by this agent
-    agent_properties = Listening.objects.filter(agent=agent)
-      # Split work experience into points
-    if agent.work_experience:
-        work_experience_points = [point.strip() for point in agent.work_experience.split('|') if point.strip()]
-    else:
-        work_experience_points = []
-        
+    # One page of the agent's properties at a time, "Load More" fetches the rest
+    params = QueryDict(mutable=True)
+    params['agent'] = agent.pk
+    if request.GET.get('cursor'):
+        params['cursor'] = request.GET['cursor']
+    agent_properties, next_cursor = cached_page(
+        apply_filters(Listening.objects.filter(available=True), params), params, PAGE_SIZE
+    )
+
     return render(request, 'agents/agent_detail.html', {
         'agent': agent, 
         'agent_properties': agent_properties,
-        'work_experience_points': work_experience_points
+        'next_query': next_page_query(params, next_cursor),
+        # Only split when the cached fragment for this version of the agent is missing
+        'work_experience_points': agent.work_experience_as_list,
     })
 
+def existing_agent_id(value):
+    """The posted agent id if that agent exists, else None"""
+    if not str(value or '').isdigit():
+        return None
+    return Agent.objects.filter(pk=value).values_list('pk', flat=True).first()
+
 def agent_property_contact(request):
     if request.method == 'POST':
         agent_name = request.POST['agentname']
@@ -35,8 +64,15 @@ def agent_property_contact(request):
         user_subject = request.POST['textarea']
         agent_id = request.POST.get('agent_id')
         property_slug = request.POST.get('property_slug')
+        # The listing's own agent, whatever the form says
+        listing_id, listing_agent_id = Listening.objects.filter(slug=property_slug).values_list(
+            'pk', 'agent_id'
+        ).first() or (None, None)
         
-        contact = AgentPropertyContact.objects.create(
+        submit_lead(
+            'agentpropertycontact',
+            agent_id=listing_agent_id or existing_agent_id(agent_id),
+            listing_id=listing_id,
             agentname=agent_name,
             property_title=property_title,
             user_name=user_name,
@@ -58,7 +94,9 @@ def agentcontact(request):
         user_subject = request.POST['textarea']
         agent_id = request.POST.get('agent_id')
         
-        contact = AgentContact.objects.create(
+        submit_lead(
+            'agentcontact',
+            agent_id=existing_agent_id(agent_id),
             agentname=agent_name,
             user_name=user_name,
             user_email=user_email,
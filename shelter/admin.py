@@ -1,8 +1,16 @@
+from django.apps import apps
 from django.contrib import admin
+from django.db.models import Q
 from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import format_html
 import csv
 import xlwt
-from .models import Listening, Contact, Quickcontact, Newsletter
+from .models import Listening, Contact, Quickcontact, Newsletter, LeadTouch
+from .leads import LEAD_MODELS, normalize_email, normalize_phone
+from .cache import bump_listing_version
+from .ranking import refresh_rank_scores
 
 @admin.register(Listening)
 class ListingAdmin(admin.ModelAdmin):
@@ -52,11 +60,17 @@ class ListingAdmin(admin.ModelAdmin):
         return False
     
     def mark_as_featured(self, request, queryset):
-        queryset.update(is_featured=True)
+        # The changelist may filter on is_featured, re-read the rows by pk
+        pks = list(queryset.values_list('pk', flat=True))
+        Listening.objects.filter(pk__in=pks).update(is_featured=True, updated=timezone.now())
+        # update() skips save() and signals, refresh the rank and cached search results here
+        refresh_rank_scores(Listening.objects.filter(pk__in=pks))
+        bump_listing_version()
     mark_as_featured.short_description = "Mark selected listings as featured"
     
     def mark_as_unavailable(self, request, queryset):
-        queryset.update(available=False)
+        queryset.update(available=False, updated=timezone.now())
+        bump_listing_version()
     mark_as_unavailable.short_description = "Mark selected listings as unavailable"
     
     def export_as_csv(self, request, queryset):
@@ -66,7 +80,8 @@ class ListingAdmin(admin.ModelAdmin):
         writer = csv.writer(response)
         writer.writerow(['Title', 'Agent', 'Location', 'Price', 'Status', 'Bedrooms', 'Bathrooms', 'Area', 'Kitchen', 'Garage', 'Available', 'Featured', 'Created'])
         
-        for listing in queryset:
+        # Agents joined in, rows fetched in chunks rather than all at once
+        for listing in queryset.select_related('agent').iterator(chunk_size=2000):
             writer.writerow([
                 listing.title,
                 listing.agent.name,
@@ -281,3 +296,62 @@ class NewsletterAdmin(admin.ModelAdmin):
     export_as_excel.short_description = "Export selected subscribers as Excel"
 
 
+
+
+class PersonFilter(admin.SimpleListFilter):
+    """?person=<touch id>: every touch linked to that one by email or phone (LeadTouch.person_touches)"""
+    title = 'person'
+    parameter_name = 'person'
+
+    def lookups(self, request, model_admin):
+        touch = self.touch()
+        return [(str(touch.pk), str(touch))] if touch else []
+
+    def touch(self):
+        value = self.value()
+        if not hasattr(self, '_touch'):
+            self._touch = LeadTouch.objects.filter(pk=value).first() if value and value.isdigit() else None
+        return self._touch
+
+    def queryset(self, request, queryset):
+        touch = self.touch()
+        if touch:
+            return queryset & touch.person_touches()
+        return queryset
+
+
+@admin.register(LeadTouch)
+class LeadTouchAdmin(admin.ModelAdmin):
+    list_display = ('name', 'email', 'phone', 'kind', 'created_at', 'all_touches', 'source')
+    list_filter = (PersonFilter, 'kind', 'created_at')
+    search_fields = ('email', 'phone')
+    search_help_text = "An email address or phone number, in any format"
+    ordering = ('-created_at',)
+
+    def get_search_results(self, request, queryset, search_term):
+        # Exact matches on the normalized forms, so the email and phone indexes serve them
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        match = Q(email=normalize_email(term))
+        if normalize_phone(term):
+            match |= Q(phone=normalize_phone(term))
+        return queryset.filter(match), False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        # Filed by shelter/leads.py from the source rows, edit those instead
+        return False
+
+    def all_touches(self, obj):
+        url = reverse('admin:shelter_leadtouch_changelist') + f'?person={obj.pk}'
+        return format_html('<a href="{}">All touches</a>', url)
+    all_touches.short_description = "Person"
+
+    def source(self, obj):
+        model = apps.get_model(LEAD_MODELS[obj.kind])
+        url = reverse(f'admin:{model._meta.app_label}_{model._meta.model_name}_change', args=[obj.object_id])
+        return format_html('<a href="{}">{}</a>', url, obj.get_kind_display())
+    source.short_description = "Source"
@@ -0,0 +1,167 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import viewsets
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.permissions import AllowAny, IsAdminUser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from .cache import get_version
+from .importer import ImportFileError, detect_format, import_listings, import_subscribers, read_rows
+from .models import Listening
+from .pagination import get_page_size, paginate
+from .search import apply_filters
+from .serializers import ListingSerializer
+
+# Read-only JSON API for the mobile app. Everything it returns is public, so
+# responses are shared by all clients: the rendered JSON is cached under the
+# version counters of the data it shows and carries an ETag, and a repeat
+# request is answered without touching the database.
+
+# Columns keyset pagination may sort on, always loaded alongside ?fields=
+SORT_FIELDS = {'id', 'created', 'rank_score', 'price', 'area_sqft', 'bedrooms'}
+
+
+def get_cache_seconds():
+    return getattr(settings, 'API_CACHE_SECONDS', 60)
+
+
+class KeysetPagination(BasePagination):
+    """shelter.pagination's opaque cursors for API lists: ?cursor= and ?page_size="""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = get_page_size(request.query_params.get('page_size'), api_settings.PAGE_SIZE)
+        items, self.next_cursor = paginate(queryset, request.query_params.get('cursor'), page_size)
+        return items
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor:
+            next_url = replace_query_param(self.request.build_absolute_uri(), 'cursor', self.next_cursor)
+        return Response({'next': next_url, 'results': data})
+
+
+class CachedReadOnlyViewSet(viewsets.ReadOnlyModelViewSet):
+    """Public read-only endpoints whose JSON is cached until `versions` change"""
+    versions = ()
+    authentication_classes = ()
+    permission_classes = (AllowAny,)
+    # Filtering is done by the view from the same parameters as the site search
+    filter_backends = ()
+    pagination_class = KeysetPagination
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedReadOnlyViewSet, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, lambda: super(CachedReadOnlyViewSet, self).retrieve(request, *args, **kwargs))
+
+    def cached_response(self, request, build):
+        if request.accepted_renderer.format != 'json':
+            # The browsable API is for people, render it every time
+            return build()
+
+        versions = '.'.join(str(get_version(name)) for name in self.versions)
+        url = hashlib.md5(request.build_absolute_uri().encode()).hexdigest()
+        key = f'api:{self.basename}:{versions}:{url}'
+        hit = cache.get(key)
+        if hit is None:
+            response = build()
+            if response.status_code != 200:
+                return response
+            payload = JSONRenderer().render(response.data)
+            hit = (quote_etag(hashlib.md5(payload).hexdigest()), payload)
+            cache.set(key, hit, get_cache_seconds())
+
+        etag, payload = hit
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(payload, content_type='application/json')
+        response['ETag'] = etag
+        response['Cache-Control'] = f'public, max-age={get_cache_seconds()}'
+        response['Vary'] = 'Accept'
+        return response
+
+
+class ListingViewSet(CachedReadOnlyViewSet):
+    """Available listings; list filters take the search page parameters"""
+    serializer_class = ListingSerializer
+    lookup_field = 'slug'
+    versions = ('listing', 'agent')
+
+    def get_queryset(self):
+        fields = ListingSerializer.model_fields(self.request) | SORT_FIELDS
+        queryset = Listening.objects.filter(available=True)
+        if any(field.startswith('agent__') for field in fields):
+            # A deferred foreign key cannot be followed by select_related()
+            queryset = queryset.select_related('agent')
+            fields.add('agent')
+        queryset = queryset.only(*fields)
+        if self.action == 'list':
+            queryset = apply_filters(queryset, self.request.query_params)
+        return queryset
+
+
+class ListingImportView(APIView):
+    """Staff create-or-update of listings by external_id
+
+    POST a JSON list of rows (or {"rows": [...]}), or upload a CSV, XLSX or
+    JSON Lines file as `file`. ?dry_run=1 validates without writing. Bigger
+    files belong to `manage.py import_listings`.
+    """
+    permission_classes = (IsAdminUser,)
+    parser_classes = (JSONParser, MultiPartParser)
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            try:
+                rows = list(read_rows(upload, detect_format(upload.name)))
+            except ImportFileError as e:
+                raise ParseError(str(e))
+        else:
+            data = request.data
+            if isinstance(data, dict):
+                data = data.get('rows')
+            if not isinstance(data, list):
+                raise ParseError('Send a list of rows, {"rows": [...]}, or a file upload')
+            rows = list(enumerate(data, start=1))
+
+        limit = getattr(settings, 'LISTING_IMPORT_API_MAX_ROWS', 10000)
+        if len(rows) > limit:
+            raise ParseError(f'At most {limit} rows per request')
+        dry_run = request.query_params.get('dry_run') in ('1', 'true')
+        result = import_listings(rows, dry_run=dry_run)
+        # Rows that failed are listed in the body, the others went through
+        return Response(dict(result.as_dict(), dry_run=dry_run))
+
+
+class NewsletterImportView(APIView):
+    """Staff bulk subscribe from an uploaded CSV, XLSX or JSON Lines file
+
+    Columns: email, name, phone, whatsapp_updates. Addresses already on the
+    list are reactivated. Rows are read as they are upserted, so a list of
+    any length goes through in constant memory.
+    """
+    permission_classes = (IsAdminUser,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise ParseError('Upload the list as file')
+        try:
+            result = import_subscribers(read_rows(upload, detect_format(upload.name)))
+        except ImportFileError as e:
+            raise ParseError(str(e))
+        return Response(result.as_dict())
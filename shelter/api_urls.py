@@ -0,0 +1,15 @@
+from django.urls import path
+from rest_framework.routers import SimpleRouter
+
+from agents.api import AgentViewSet
+from .api import ListingImportView, ListingViewSet, NewsletterImportView
+
+router = SimpleRouter()
+router.register('listings', ListingViewSet, basename='api-listing')
+router.register('agents', AgentViewSet, basename='api-agent')
+
+urlpatterns = [
+    # Outside listings/, which takes any slug
+    path('imports/listings/', ListingImportView.as_view(), name='api-listing-import'),
+    path('imports/newsletter/', NewsletterImportView.as_view(), name='api-newsletter-import'),
+] + router.urls
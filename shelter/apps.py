@@ -3,3 +3,7 @@ from django.apps import AppConfig
 class ShelterConfig(AppConfig):
     name = 'shelter'
     default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        # Connects the receivers that keep the search indexes, similar homes and image renditions current
+        from . import autocomplete, fuzzy, images, similar  # noqa: F401
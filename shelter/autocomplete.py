@@ -0,0 +1,270 @@
+import logging
+import threading
+from bisect import bisect_left, insort
+from collections import Counter
+from django.db import connections
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.http import urlencode
+
+from agents.models import Agent
+from .cache import get_version
+from .models import Listening
+from .search import tokenize
+
+# In-memory typeahead over listing titles, locations and agent names. Every
+# worker keeps its own sorted term list and answers lookups with bisect, so
+# suggestions never touch the database. Signals patch the index of the worker
+# that made a change; other workers notice the bumped version counters on
+# their next lookup and rebuild in a background thread, answering from the
+# old index meanwhile.
+SUGGESTION_LIMIT = 8
+MAX_SUGGESTION_LIMIT = 20
+# Matches looked at per lookup before ranking, keeps lookups bounded on short prefixes
+CANDIDATE_LIMIT = 200
+# Sort order of suggestion types with equally good matches
+KIND_ORDER = {'location': 0, 'listing': 1, 'agent': 2}
+VERSION_NAMES = ('listing', 'agent')
+
+logger = logging.getLogger(__name__)
+
+
+def _terms(label):
+    """Every word-suffix of the label, whole label first
+
+    Filing 'Luxury Villa Lahore' under each suffix lets 'villa la' match it.
+    """
+    words = tokenize(label)
+    terms = []
+    for i in range(len(words)):
+        term = ' '.join(words[i:])
+        if term not in terms:
+            terms.append(term)
+    return terms
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._keys = []       # sorted (term, entry key) pairs
+        self._entries = {}    # entry key -> suggestion dict
+        self._terms = {}      # entry key -> terms it is filed under
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, entries):
+        """Replace the index contents with (key, label, suggestion) triples in one sort"""
+        self._entries = {}
+        self._terms = {}
+        keys = []
+        for key, label, suggestion in entries:
+            terms = _terms(label)
+            self._entries[key] = suggestion
+            self._terms[key] = terms
+            keys.extend((term, key) for term in terms)
+        keys.sort()
+        self._keys = keys
+
+    def add(self, key, label, suggestion):
+        self.remove(key)
+        terms = _terms(label)
+        self._entries[key] = suggestion
+        self._terms[key] = terms
+        for term in terms:
+            insort(self._keys, (term, key))
+
+    def remove(self, key):
+        for term in self._terms.pop(key, ()):
+            i = bisect_left(self._keys, (term, key))
+            if i < len(self._keys) and self._keys[i] == (term, key):
+                del self._keys[i]
+        self._entries.pop(key, None)
+
+    def search(self, prefix, limit=SUGGESTION_LIMIT):
+        prefix = ' '.join(tokenize(prefix))
+        if not prefix:
+            return []
+        found = {}
+        i = bisect_left(self._keys, (prefix,))
+        for term, key in self._keys[i:i + CANDIDATE_LIMIT]:
+            if not term.startswith(prefix):
+                break
+            # Matching the start of the label beats matching a later word
+            leading = 0 if term == self._terms[key][0] else 1
+            found[key] = min(found.get(key, 1), leading)
+        ranked = sorted(found, key=lambda key: (
+            found[key],
+            KIND_ORDER[key[0]],
+            -self._entries[key].get('count', 0),
+            self._entries[key]['label'].lower(),
+        ))
+        return [self._entries[key] for key in ranked[:limit]]
+
+
+class Autocomplete:
+    """Per-process suggestion index, kept current with the listing and agent versions"""
+
+    def __init__(self):
+        self.index = PrefixIndex()
+        self.versions = None
+        self.location_counts = Counter()
+        self.listing_locations = {}
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.rebuilding = False
+
+    def current_versions(self):
+        return tuple(get_version(name) for name in VERSION_NAMES)
+
+    def build(self):
+        """Load a new index from the database, then swap it in
+
+        Lookups keep using the old index while this reads.
+        """
+        with self.build_lock:
+            # Read versions first, a change made while loading forces another rebuild
+            versions = self.current_versions()
+            listings = Listening.objects.filter(available=True).values_list('id', 'title', 'slug', 'location')
+            agents = Agent.objects.values_list('id', 'name')
+
+            listing_locations = {}
+            entries = []
+            for pk, title, slug, location in listings:
+                entries.append(self._listing_entry(pk, title, slug))
+                listing_locations[pk] = location
+            location_counts = Counter(location for location in listing_locations.values() if location)
+            entries.extend(self._location_entry(location, location_counts[location]) for location in location_counts)
+            entries.extend(self._agent_entry(pk, name) for pk, name in agents)
+            index = PrefixIndex()
+            index.load(entries)
+
+            with self.lock:
+                self.index = index
+                self.listing_locations = listing_locations
+                self.location_counts = location_counts
+                self.versions = versions
+
+    def rebuild_in_background(self):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild, name='autocomplete-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Could not rebuild the autocomplete index')
+        finally:
+            self.rebuilding = False
+            connections.close_all()
+
+    def search(self, prefix, limit=SUGGESTION_LIMIT):
+        if self.versions is None:
+            # Nothing to serve yet, warm_index() normally builds at startup
+            self.build()
+        elif self.versions != self.current_versions():
+            self.rebuild_in_background()
+        with self.lock:
+            return self.index.search(prefix, limit)
+
+    def _listing_entry(self, pk, title, slug):
+        return (('listing', pk), title, {
+            'type': 'listing',
+            'label': title,
+            'url': reverse('property_detail', args=[slug]),
+        })
+
+    def _location_entry(self, location, count):
+        return (('location', location), location, {
+            'type': 'location',
+            'label': location,
+            'count': count,
+            'url': reverse('search') + '?' + urlencode({'location': location}),
+        })
+
+    def _agent_entry(self, pk, name):
+        return (('agent', pk), name, {
+            'type': 'agent',
+            'label': name,
+            'url': reverse('agent_detail', args=[pk]),
+        })
+
+    def _set_location_count(self, location, delta):
+        if not location:
+            return
+        self.location_counts[location] += delta
+        if self.location_counts[location] > 0:
+            self.index.add(*self._location_entry(location, self.location_counts[location]))
+        else:
+            del self.location_counts[location]
+            self.index.remove(('location', location))
+
+    def listing_changed(self, listing, deleted=False):
+        with self.lock:
+            if self.versions is None:
+                return
+            self._set_location_count(self.listing_locations.pop(listing.pk, None), -1)
+            if deleted or not listing.available:
+                self.index.remove(('listing', listing.pk))
+            else:
+                self.index.add(*self._listing_entry(listing.pk, listing.title, listing.slug))
+                self.listing_locations[listing.pk] = listing.location
+                self._set_location_count(listing.location, 1)
+            self._catch_up('listing')
+
+    def agent_changed(self, agent, deleted=False):
+        with self.lock:
+            if self.versions is None:
+                return
+            if deleted:
+                self.index.remove(('agent', agent.pk))
+            else:
+                self.index.add(*self._agent_entry(agent.pk, agent.name))
+            self._catch_up('agent')
+
+    def _catch_up(self, name):
+        # The change has been applied here, so accept the version it bumped to.
+        # Any other jump means another worker changed data too: rebuild on next lookup.
+        position = VERSION_NAMES.index(name)
+        versions = list(self.versions)
+        current = get_version(name)
+        if current == versions[position] + 1:
+            versions[position] = current
+            self.versions = tuple(versions)
+
+
+autocomplete = Autocomplete()
+
+
+def warm_index():
+    """Build this worker's index up front instead of on the first lookup"""
+    autocomplete.build()
+
+
+def suggest(prefix, limit=SUGGESTION_LIMIT):
+    return autocomplete.search(prefix, limit)
+
+
+# Receivers are connected after the ones in models.py, so the version counters
+# have already been bumped when these run
+@receiver(post_save, sender=Listening)
+def listing_saved(sender, instance, **kwargs):
+    autocomplete.listing_changed(instance)
+
+
+@receiver(post_delete, sender=Listening)
+def listing_deleted(sender, instance, **kwargs):
+    autocomplete.listing_changed(instance, deleted=True)
+
+
+@receiver(post_save, sender=Agent)
+def agent_saved(sender, instance, **kwargs):
+    autocomplete.agent_changed(instance)
+
+
+@receiver(post_delete, sender=Agent)
+def agent_deleted(sender, instance, **kwargs):
+    autocomplete.agent_changed(instance, deleted=True)
@@ -0,0 +1,77 @@
+import hashlib
+from django.conf import settings
+from django.core.cache import cache
+
+# Cached data is keyed on a version counter per model family. Any change bumps
+# the counter, so old entries are simply never read again and expire on their
+# own; nothing has to be purged key by key.
+VERSION_KEY = 'version:{}'
+
+# Parameters that change neither the result set nor its order
+IGNORED_PARAMS = {'format', 'csrfmiddlewaretoken'}
+
+
+def get_version(name):
+    version = cache.get(VERSION_KEY.format(name))
+    if version is None:
+        cache.add(VERSION_KEY.format(name), 1, timeout=None)
+        version = cache.get(VERSION_KEY.format(name), 1)
+    return version
+
+
+def bump_version(name):
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Counter evicted or never set, start again above any value a reader may hold
+        cache.set(key, 2, timeout=None)
+        return 2
+
+
+def listing_version():
+    return get_version('listing')
+
+
+def bump_listing_version():
+    return bump_version('listing')
+
+
+def agent_version():
+    return get_version('agent')
+
+
+def bump_agent_version():
+    return bump_version('agent')
+
+
+def team_version():
+    return get_version('team')
+
+
+def bump_team_version():
+    return bump_version('team')
+
+
+def normalize_params(params, exclude=()):
+    """Stable text form of the search parameters, blank values dropped"""
+    items = []
+    for key in sorted(params.keys()):
+        if key in IGNORED_PARAMS or key in exclude:
+            continue
+        for value in params.getlist(key):
+            value = ' '.join(str(value).split())
+            if key in ('keyword', 'location', 'status'):
+                value = value.lower()
+            if value:
+                items.append(f'{key}={value}')
+    return '&'.join(items)
+
+
+def search_cache_key(kind, params, exclude=()):
+    digest = hashlib.md5(normalize_params(params, exclude).encode()).hexdigest()
+    return f'search:{kind}:{listing_version()}:{digest}'
+
+
+def search_cache_timeout():
+    return getattr(settings, 'SEARCH_CACHE_SECONDS', 600)
@@ -0,0 +1,138 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+# Cache in a SQLite file that every worker process on the host opens, for
+# data that must be shared without a Redis server. LOCATION is the file
+# path, or a bare file name kept in a private directory in /dev/shm, so
+# reads and writes stay in memory. Writes skip fsync, a crash or reboot may
+# lose the entries.
+DEFAULT_FILENAME = 'cache.sqlite3'
+# One set() in this many also deletes expired rows and, past MAX_ENTRIES,
+# the rows closest to expiring
+CULL_EVERY = 100
+
+
+def default_location(filename=DEFAULT_FILENAME):
+    """filename in a directory only this user may write to
+
+    Entries are pickled, so nobody else may get to plant one.
+    """
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    if not hasattr(os, 'getuid'):
+        return os.path.join(base, f'zameen-{filename}')
+    root = os.path.join(base, f'zameen-{os.getuid()}')
+    os.makedirs(root, mode=0o700, exist_ok=True)
+    if os.stat(root).st_uid != os.getuid():
+        raise ImproperlyConfigured(f'{root} belongs to another user, give the cache a LOCATION')
+    return os.path.join(root, filename)
+
+
+class SQLiteCache(BaseCache):
+    """Host wide cache, get and set cost a few microseconds each"""
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        location = location or DEFAULT_FILENAME
+        self.path = location if os.path.isabs(location) else default_location(location)
+        self._local = threading.local()
+        self._sets = 0
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # Connections are not shared with forked workers
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) WITHOUT ROWID'
+            )
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _expires(self, timeout):
+        timeout = self.get_backend_timeout(timeout)
+        return None if timeout is None else time.time() + timeout
+
+    def _read(self, key):
+        return self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+
+    def get(self, key, default=None, version=None):
+        row = self._read(self.make_and_validate_key(key, version=version))
+        return default if row is None else pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)),
+        )
+        self._sets += 1
+        if self._sets % CULL_EVERY == 0:
+            self._cull(connection)
+
+    def _cull(self, connection):
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        (count,) = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            # Down to MAX_ENTRIES less a 1/CULL_FREQUENCY share, like the built in backends
+            keep = self._max_entries - self._max_entries // self._cull_frequency
+            connection.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count - keep,),
+            )
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        connection = self._connection()
+        # The write lock is taken before the read, so no increment is lost
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self._read(key)
+            if row is None:
+                raise ValueError(f"Key '{key}' not found.")
+            value = pickle.loads(row[0]) + delta
+            connection.execute('UPDATE cache SET value = ? WHERE key = ?', (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key))
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires IS NOT NULL AND cache.expires <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout), time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._connection().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expires(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._connection().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self._read(self.make_and_validate_key(key, version=version)) is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
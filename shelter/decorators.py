@@ -0,0 +1,106 @@
+import hashlib
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .cache import get_version
+from .fuzzy import results_cacheable
+
+
+def _cached_response(view_func, version_names, request, *args, **kwargs):
+    """The view's response from the cache, keyed on the named version counters
+
+    A save anywhere in those models bumps a counter and so retires every
+    cached copy at once. Fuzzy searches answered by a lagging trigram index
+    are not stored.
+    """
+    versions = '.'.join(str(get_version(name)) for name in version_names)
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    key = f'page:{view_func.__name__}:{versions}:{path}'
+    response = cache.get(key)
+    if response is None:
+        response = view_func(request, *args, **kwargs)
+        cacheable = response.status_code == 200 and not response.cookies and not response.streaming
+        if cacheable and results_cacheable(request.GET):
+            cache.set(key, response, getattr(settings, 'VERSIONED_PAGE_CACHE_SECONDS', 3600))
+    return response
+
+
+def public_page(*version_names):
+    """Cache a view's response until its data changes and let CDNs keep it briefly
+
+    As with versioned_page the cache key holds the named version counters.
+    CDNs and browsers may reuse a copy for PUBLIC_PAGE_CACHE_SECONDS, so that
+    is how long a change can take to show. The wrapped view must not read the
+    session or the user. Forms on the page fetch their CSRF token separately
+    (see the form_csrf_token tag), so the response carries no cookies and no
+    Vary: Cookie.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            request.public_page = True
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            return _cached_response(view_func, version_names, request, *args, **kwargs)
+
+        max_age = getattr(settings, 'PUBLIC_PAGE_CACHE_SECONDS', 60)
+        return cache_control(public=True, max_age=max_age)(_wrapped_view)
+    return decorator
+
+
+def versioned_page(*version_names):
+    """Cache a view's whole response for anonymous visitors until its data changes
+
+    The cache key holds the named version counters (e.g. 'listing', 'agent'),
+    so a save anywhere in those models retires every cached copy at once.
+    Visitors with a session (e.g. logged in) always get a freshly rendered
+    page. As with public_page, forms on the page fetch
+    their CSRF token separately.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or settings.SESSION_COOKIE_NAME in request.COOKIES:
+                return view_func(request, *args, **kwargs)
+
+            request.public_page = True
+            return _cached_response(view_func, version_names, request, *args, **kwargs)
+
+        return _wrapped_view
+    return decorator
+
+
+def conditional_page(validators):
+    """Answer conditional GETs with 304 Not Modified before the view renders
+
+    validators(request, *args, **kwargs) returns (parts, last_modified) for
+    the object a page shows, or None when it does not exist. The ETag is a
+    hash of the parts plus the visitor's CSRF cookie, since these pages embed
+    a token tied to it. Browsers are told to revalidate on every visit, which
+    costs them a 304 whenever nothing changed.
+    """
+    def _validators(request, *args, **kwargs):
+        # condition() asks for the ETag and Last-Modified separately, look up once
+        if not hasattr(request, '_page_validators'):
+            request._page_validators = validators(request, *args, **kwargs)
+        return request._page_validators
+
+    def etag(request, *args, **kwargs):
+        found = _validators(request, *args, **kwargs)
+        if found is None:
+            return None
+        parts = [*found[0], request.COOKIES.get(settings.CSRF_COOKIE_NAME, '')]
+        return hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        found = _validators(request, *args, **kwargs)
+        return found[1] if found else None
+
+    def decorator(view_func):
+        return cache_control(private=True, no_cache=True)(
+            condition(etag_func=etag, last_modified_func=last_modified)(view_func)
+        )
+    return decorator
@@ -0,0 +1,123 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from .cache import search_cache_key, search_cache_timeout
+from .fuzzy import results_cacheable
+from .models import Listening
+
+# Lower bounds of the price bands shown on the search page, the last band is open ended
+DEFAULT_PRICE_BUCKETS = [0, 1000000, 2500000, 5000000, 10000000]
+
+
+def get_price_buckets():
+    return getattr(settings, 'SEARCH_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS)
+
+
+def _refine_query(params, **changes):
+    """Querystring for the current search with some parameters replaced"""
+    query = params.copy()
+    # Refining the search always starts again from the first page
+    query.pop('cursor', None)
+    for key, value in changes.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
+
+
+def _grouped_counts(queryset, field):
+    """Count matching listings per distinct value of a field in one GROUP BY query"""
+    rows = (
+        queryset.order_by()
+        .values(field)
+        .annotate(count=Count('pk'))
+        .order_by(field)
+    )
+    return [(row[field], row['count']) for row in rows]
+
+
+def _value_facet(queryset, params, field, labels=None):
+    labels = labels or {}
+    current = params.get(field, '')
+    return [
+        {
+            'value': value,
+            'label': labels.get(value, value),
+            'count': count,
+            'query': _refine_query(params, **{field: value}),
+            'selected': str(value).lower() == current.lower(),
+        }
+        for value, count in _grouped_counts(queryset, field)
+    ]
+
+
+def _cumulative_facet(queryset, params, field):
+    # The search form filters rooms with "up to N", so counts are running totals
+    current = params.get(field, '')
+    facet = []
+    running = 0
+    for value, count in _grouped_counts(queryset, field):
+        running += count
+        facet.append({
+            'value': value,
+            'label': f'Up to {value}',
+            'count': running,
+            'query': _refine_query(params, **{field: value}),
+            'selected': str(value) == current,
+        })
+    return facet
+
+
+def _price_facet(queryset, params):
+    buckets = list(get_price_buckets())
+    bands = []
+    aggregates = {}
+    for i, low in enumerate(buckets):
+        high = buckets[i + 1] if i + 1 < len(buckets) else None
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f'band_{i}'] = Count('pk', filter=condition)
+        bands.append((low, high))
+
+    # Every band is counted by the same aggregate query
+    counts = queryset.order_by().aggregate(**aggregates)
+
+    current = (params.get('min_price', ''), params.get('max_price', ''))
+    facet = []
+    for i, (low, high) in enumerate(bands):
+        min_price = str(low) if low else None
+        max_price = str(high) if high is not None else None
+        facet.append({
+            'value': f'{low}-{high or ""}',
+            'label': f'{low:,} - {high:,}' if high is not None else f'{low:,}+',
+            'count': counts[f'band_{i}'],
+            'query': _refine_query(params, min_price=min_price, max_price=max_price, price=None),
+            'selected': any(current) and current == (min_price or '', max_price or ''),
+        })
+    return facet
+
+
+def build_facets(queryset, params):
+    """Facet counts for the current filter set, one query per facet family"""
+    return [
+        {'name': 'location', 'title': 'Location', 'options': _value_facet(queryset, params, 'location')},
+        {'name': 'status', 'title': 'Status',
+         'options': _value_facet(queryset, params, 'status', dict(Listening.STATUS_CHOICES))},
+        {'name': 'bedrooms', 'title': 'Bedrooms', 'options': _cumulative_facet(queryset, params, 'bedrooms')},
+        {'name': 'bathrooms', 'title': 'Bathrooms', 'options': _cumulative_facet(queryset, params, 'bathrooms')},
+        {'name': 'price', 'title': 'Price (INR)', 'options': _price_facet(queryset, params)},
+    ]
+
+
+def cached_facets(queryset, params):
+    """build_facets() cached per search until any listing changes"""
+    key = search_cache_key('facets', params, exclude=('cursor',))
+    facets = cache.get(key)
+    if facets is None:
+        facets = build_facets(queryset, params)
+        if results_cacheable(params):
+            cache.set(key, facets, search_cache_timeout())
+    return facets
@@ -0,0 +1,161 @@
+import json
+import re
+import zlib
+from datetime import datetime, time
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Listening
+from .sitemap import get_base_url
+
+# Inventory feed for partner portals, as XML or JSON Lines. Rows come from one
+# joined values() query walked in chunks and are written out as they arrive,
+# so a feed of any size is produced in constant memory.
+CHUNK_SIZE = 2000
+# Bytes collected before handing them to the compressor or the client
+BUFFER_SIZE = 64 * 1024
+
+LISTING_FIELDS = (
+    'id', 'slug', 'title', 'description', 'status', 'available', 'location',
+    'price', 'bedrooms', 'bathrooms', 'kitchen', 'garage', 'area', 'area_sqft',
+    'latitude', 'longitude', 'is_featured', 'created', 'updated',
+)
+IMAGE_FIELDS = ('image', 'image2', 'image3')
+AGENT_FIELDS = ('id', 'name', 'phone', 'email', 'whatsapp')
+# Control characters (other than tab and newlines), lone surrogates and the
+# two non-characters; pasted descriptions carry them and partners' parsers
+# reject the whole file
+INVALID_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+FORMATS = {
+    'xml': 'application/xml',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def parse_since(value):
+    """Aware datetime from an ISO date or datetime, None if it is not one"""
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def feed_queryset(since=None):
+    """Feed rows oldest first; with since, every listing changed after it
+
+    An incremental feed also lists listings that went off the market
+    (available is false), so partners can take them down.
+    """
+    queryset = Listening.objects.all() if since else Listening.objects.filter(available=True)
+    if since:
+        queryset = queryset.filter(updated__gte=since)
+    return queryset.order_by('pk').values(
+        *LISTING_FIELDS, *IMAGE_FIELDS, *(f'agent__{field}' for field in AGENT_FIELDS)
+    )
+
+
+def _absolute(base_url, url):
+    return url if '://' in url else base_url + url
+
+
+def feed_records(since=None, base_url=None):
+    base_url = (base_url or get_base_url()).rstrip('/')
+    # One reverse() for the whole feed, slugs are URL safe
+    detail_url = base_url + reverse('property_detail', args=['__slug__'])
+    for row in feed_queryset(since).iterator(chunk_size=CHUNK_SIZE):
+        record = {field: row[field] for field in LISTING_FIELDS}
+        record['url'] = detail_url.replace('__slug__', row['slug'])
+        record['price'] = str(row['price'])
+        record['created'] = row['created'].isoformat()
+        record['updated'] = row['updated'].isoformat()
+        record['images'] = [
+            _absolute(base_url, default_storage.url(row[field])) for field in IMAGE_FIELDS if row[field]
+        ]
+        record['agent'] = {field: row[f'agent__{field}'] for field in AGENT_FIELDS}
+        yield record
+
+
+def jsonl_chunks(records):
+    for record in records:
+        yield json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def _xml_text(value):
+    """Escaped text with the characters XML 1.0 does not allow removed"""
+    return escape(INVALID_XML_CHARS.sub('', str(value)))
+
+
+def _xml_value(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return _xml_text(value)
+
+
+def _xml_fields(record):
+    return ''.join(
+        f'<{key}>{_xml_value(value)}</{key}>' for key, value in record.items()
+        if value is not None and not isinstance(value, (list, dict))
+    )
+
+
+def xml_chunks(records, generated=None):
+    generated = (generated or timezone.now()).isoformat()
+    yield f'<?xml version="1.0" encoding="UTF-8"?>\n<listings generated="{generated}">\n'
+    for record in records:
+        images = ''.join(f'<image>{_xml_text(url)}</image>' for url in record['images'])
+        yield (
+            f'<listing>{_xml_fields(record)}<images>{images}</images>'
+            f'<agent>{_xml_fields(record["agent"])}</agent></listing>\n'
+        )
+    yield '</listings>\n'
+
+
+def encoded(chunks, compress=False):
+    """UTF-8 bytes of the chunks in BUFFER_SIZE pieces, gzipped on the fly if asked"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        data = chunk.encode('utf-8')
+        buffer.append(data)
+        size += len(data)
+        if size >= BUFFER_SIZE:
+            data = b''.join(buffer)
+            buffer, size = [], 0
+            data = compressor.compress(data) if compressor else data
+            if data:
+                yield data
+    data = b''.join(buffer)
+    if compressor:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
+
+def feed_chunks(feed_format, since=None, base_url=None):
+    records = feed_records(since, base_url)
+    return xml_chunks(records) if feed_format == 'xml' else jsonl_chunks(records)
+
+
+def check_feed_key(key):
+    """Partners present one of PARTNER_FEED_KEYS
+
+    With none configured the feed is closed, unless PARTNER_FEED_OPEN is set.
+    """
+    keys = getattr(settings, 'PARTNER_FEED_KEYS', [])
+    if not keys:
+        return getattr(settings, 'PARTNER_FEED_OPEN', False)
+    return any(constant_time_compare(key or '', allowed) for allowed in keys)
@@ -3,4 +3,69 @@ from django import forms
 class QuickContactForm(forms.Form):
     name = forms.CharField(label='', required=True, widget=forms.TextInput(attrs={'placeholder':'Enter your name'}))
     email = forms.CharField(label='', required=True, widget=forms.EmailInput(attrs={'placeholder':'Enter your E-mail address'}))
-    phone = forms.CharField(label='', required=True, widget=forms.TextInput(attrs={'placeholder':'Enter your phone number'}))
\ No newline at end of file
+    phone = forms.CharField(label='', required=True, widget=forms.TextInput(attrs={'placeholder':'Enter your phone number'}))
+
+class LowercaseChoiceField(forms.ChoiceField):
+    def to_python(self, value):
+        return super().to_python(value).strip().lower()
+
+# Spellings of yes and no accepted in import files
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 'on'}
+FALSE_VALUES = {'0', 'false', 'no', 'n', 'off'}
+
+
+class StrictNullBooleanField(forms.Field):
+    """True, False or None for blank; anything else is an error, not a guess"""
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        # Spreadsheets give booleans, or 1 and 0 as numbers
+        if isinstance(value, (bool, int, float)) and value in (0, 1):
+            return bool(value)
+        text = str(value).strip().lower()
+        if not text:
+            return None
+        if text in TRUE_VALUES:
+            return True
+        if text in FALSE_VALUES:
+            return False
+        raise forms.ValidationError('Enter yes or no (1/0, true/false)', code='invalid')
+
+
+class ListingImportForm(forms.Form):
+    """One row of a bulk listing import (see shelter/importer.py)
+
+    The agent is given by id (agent) or e-mail (agent_email); images are
+    names of files already in media storage.
+    """
+    external_id = forms.CharField(max_length=100)
+    agent = forms.IntegerField(required=False, min_value=1)
+    agent_email = forms.EmailField(required=False)
+    title = forms.CharField(max_length=200)
+    description = forms.CharField(required=False)
+    location = forms.CharField(max_length=200)
+    status = LowercaseChoiceField(choices=(('rent', 'Rent'), ('sale', 'Sale')))
+    price = forms.DecimalField(max_digits=10, decimal_places=2, min_value=0)
+    bedrooms = forms.IntegerField(min_value=0)
+    bathrooms = forms.IntegerField(min_value=0)
+    kitchen = forms.IntegerField(required=False, min_value=0)
+    garage = forms.IntegerField(required=False, min_value=0)
+    area = forms.CharField(max_length=200)
+    latitude = forms.FloatField(required=False, min_value=-90, max_value=90)
+    longitude = forms.FloatField(required=False, min_value=-180, max_value=180)
+    available = StrictNullBooleanField(required=False)
+    is_featured = StrictNullBooleanField(required=False)
+    marketing_priority = LowercaseChoiceField(required=False, choices=(('low', 'Low'), ('medium', 'Medium'), ('high', 'High')))
+    created = forms.DateTimeField(required=False)
+    image = forms.CharField(required=False, max_length=100)
+    image2 = forms.CharField(required=False, max_length=100)
+    image3 = forms.CharField(required=False, max_length=100)
+
+    def clean(self):
+        cleaned = super().clean()
+        if not cleaned.get('agent') and not cleaned.get('agent_email'):
+            raise forms.ValidationError('Give the agent as agent (id) or agent_email')
+        if (cleaned.get('latitude') is None) != (cleaned.get('longitude') is None):
+            raise forms.ValidationError('latitude and longitude go together')
+        return cleaned
@@ -0,0 +1,281 @@
+import logging
+import threading
+import time
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Case, FloatField, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import listing_version
+from .models import Listening
+from .ranking import by_relevance
+from .search import get_connection, tokenize
+
+# Typo tolerant matching on listing titles and locations. Postgres uses pg_trgm
+# word similarity behind GIN trigram indexes; other databases use an in-memory
+# trigram posting list per worker, scored with numpy. Scores follow pg_trgm's
+# word_similarity: the share of the query's trigrams found in the field.
+FUZZY_FIELDS = ('title', 'location')
+DEFAULT_THRESHOLD = 0.5
+# Best matches that pass the other filters, passed on to the database when
+# scoring in Python; fuzzy results page through at most this many
+MAX_MATCHES = 2000
+# Most match ids checked against the filters per query
+MAX_CHUNK = 10000
+# Listings changed in this worker are scored separately until the next rebuild
+MAX_PENDING = 1000
+
+logger = logging.getLogger(__name__)
+
+
+def get_threshold():
+    return getattr(settings, 'SEARCH_FUZZY_THRESHOLD', DEFAULT_THRESHOLD)
+
+
+def get_refresh_seconds():
+    return getattr(settings, 'SEARCH_FUZZY_REFRESH_SECONDS', 300)
+
+
+def trigrams(text):
+    """pg_trgm style trigrams: each word padded with two spaces in front and one behind"""
+    grams = set()
+    for word in tokenize(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Trigram posting lists over (title, location) of every listing
+
+    Document 2*i is the title and 2*i+1 the location of listing ids[i]; a
+    query counts its trigram hits per document with one bincount.
+    """
+
+    def __init__(self):
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.postings = {}
+        self.pending = {}       # listing id -> field trigram sets, or None once deleted
+        self.version = None
+        self.built_at = 0.0
+        self.needs_rebuild = False
+        self.recent = None      # changes made while a build reads, kept past the swap
+        self.recent_bumps = 0
+        self.lock = threading.RLock()
+        self.build_lock = threading.Lock()
+        self.rebuilding = False
+
+    def build(self):
+        """Load new posting lists from the database, then swap them in
+
+        Searches keep using the old lists while this reads.
+        """
+        with self.build_lock:
+            with self.lock:
+                version = listing_version()
+                self.recent = {}
+                self.recent_bumps = 0
+            rows = Listening.objects.order_by('pk').values_list('pk', *FUZZY_FIELDS)
+            ids = []
+            postings = {}
+            for i, (pk, *fields) in enumerate(rows.iterator(chunk_size=2000)):
+                ids.append(pk)
+                for offset, text in enumerate(fields):
+                    for gram in trigrams(text):
+                        postings.setdefault(gram, []).append(2 * i + offset)
+            postings = {gram: np.array(docs, dtype=np.int32) for gram, docs in postings.items()}
+            with self.lock:
+                self.ids = np.array(ids, dtype=np.int64)
+                self.postings = postings
+                self.pending, self.recent = self.recent, None
+                # Caught up if every version bump since the read was made here
+                if listing_version() == version + self.recent_bumps:
+                    version += self.recent_bumps
+                self.version = version
+                self.built_at = time.monotonic()
+                self.needs_rebuild = False
+
+    def rebuild_in_background(self):
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=self._rebuild, name='trigram-rebuild', daemon=True).start()
+
+    def _rebuild(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Could not rebuild the trigram index')
+        finally:
+            self.rebuilding = False
+            connections.close_all()
+
+    def is_stale(self):
+        if self.version is None or self.needs_rebuild:
+            return True
+        if self.version == listing_version():
+            return False
+        # Changes made by other workers are picked up by a periodic rebuild
+        return time.monotonic() - self.built_at > get_refresh_seconds()
+
+    def is_behind(self):
+        """True while the index may miss changes made by other workers"""
+        return self.version is None or self.needs_rebuild or self.version != listing_version()
+
+    def listing_changed(self, listing, deleted=False):
+        with self.lock:
+            if self.version is None:
+                return
+            if deleted:
+                grams = None
+            else:
+                grams = [trigrams(getattr(listing, field)) for field in FUZZY_FIELDS]
+            self.pending[listing.pk] = grams
+            if self.recent is not None:
+                self.recent[listing.pk] = grams
+                self.recent_bumps += 1
+            if len(self.pending) > MAX_PENDING:
+                self.needs_rebuild = True
+            elif listing_version() == self.version + 1:
+                self.version += 1
+
+    def search(self, keyword, threshold):
+        """(listing ids, scores) of every match as numpy arrays, best first"""
+        if self.version is None:
+            # Nothing to search yet
+            self.build()
+        elif self.is_stale():
+            self.rebuild_in_background()
+        query = trigrams(keyword)
+        ids = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0)
+        if not query:
+            return ids, scores
+        with self.lock:
+            lists = [self.postings[gram] for gram in query if gram in self.postings]
+            if lists and len(self.ids):
+                hits = np.bincount(np.concatenate(lists), minlength=2 * len(self.ids))
+                best = hits.reshape(-1, 2).max(axis=1) / len(query)
+                found = np.flatnonzero(best >= threshold)
+                ids, scores = self.ids[found], best[found]
+            if self.pending:
+                keep = ~np.isin(ids, np.fromiter(self.pending, dtype=np.int64))
+                ids, scores = ids[keep], scores[keep]
+                changed = [
+                    (pk, max(len(query & grams) for grams in fields) / len(query))
+                    for pk, fields in self.pending.items() if fields
+                ]
+                changed = [(pk, score) for pk, score in changed if score >= threshold]
+                if changed:
+                    ids = np.concatenate([ids, np.array([pk for pk, score in changed], dtype=np.int64)])
+                    scores = np.concatenate([scores, np.array([score for pk, score in changed])])
+        order = np.lexsort((-ids, -scores))
+        return ids[order], scores[order]
+
+
+trigram_index = TrigramIndex()
+
+
+def create_index_sql(vendor):
+    if vendor != 'postgresql':
+        return []
+    return ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+        f'CREATE INDEX IF NOT EXISTS shelter_listening_{field}_trgm '
+        f'ON shelter_listening USING GIN ({field} gin_trgm_ops)'
+        for field in FUZZY_FIELDS
+    ]
+
+
+def drop_index_sql(vendor):
+    if vendor != 'postgresql':
+        return []
+    return [f'DROP INDEX IF EXISTS shelter_listening_{field}_trgm' for field in FUZZY_FIELDS]
+
+
+def results_cacheable(params):
+    """False for fuzzy searches answered from an index that is behind
+
+    Their results would be cached under the current listing version and
+    outlive the rebuild that is catching the index up.
+    """
+    if params.get('match') != 'fuzzy' or get_connection().vendor == 'postgresql':
+        return True
+    return not trigram_index.is_behind()
+
+
+def fuzzy_search(queryset, keyword, threshold=None):
+    """Filter a Listening queryset to near matches of keyword, most similar first
+
+    The result is annotated with ``fuzzy_rank`` between 0 and 1 and blended
+    with the listing rank by by_relevance().
+    """
+    if threshold is None:
+        threshold = get_threshold()
+    if not tokenize(keyword):
+        return queryset
+
+    connection = get_connection(queryset.db)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            # The <% operator, and so the GIN index, uses this session threshold
+            cursor.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)", [str(threshold)])
+        where = ' OR '.join(f'%s <%% shelter_listening.{field}' for field in FUZZY_FIELDS)
+        rank = ', '.join(f'word_similarity(%s, shelter_listening.{field})' for field in FUZZY_FIELDS)
+        return by_relevance(queryset.extra(
+            where=[f'({where})'],
+            params=[keyword] * len(FUZZY_FIELDS),
+        ).annotate(
+            fuzzy_rank=RawSQL(f'GREATEST({rank})', [keyword] * len(FUZZY_FIELDS))
+        ), 'fuzzy_rank')
+
+    ids, scores = trigram_index.search(keyword, threshold)
+    matches = _best_allowed(queryset, ids, scores)
+    if not matches:
+        return queryset.none()
+    # Scores are shares of the query's trigrams, so few distinct values
+    by_score = {}
+    for pk, score in matches:
+        by_score.setdefault(score, []).append(pk)
+    return by_relevance(queryset.filter(pk__in=[pk for pk, score in matches]).annotate(
+        fuzzy_rank=Case(
+            *[When(pk__in=pks, then=Value(score)) for score, pks in by_score.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    ), 'fuzzy_rank')
+
+
+def _best_allowed(queryset, ids, scores):
+    """The first MAX_MATCHES (id, score) of a ranked match list that queryset keeps
+
+    Matches are checked against the filters a growing chunk at a time, so a
+    common keyword costs a few queries however many listings it matches.
+    """
+    matches = []
+    start, size = 0, MAX_MATCHES
+    queryset = queryset.order_by()
+    while start < len(ids) and len(matches) < MAX_MATCHES:
+        chunk = ids[start:start + size].tolist()
+        allowed = set(queryset.filter(pk__in=chunk).values_list('pk', flat=True))
+        matches.extend(
+            (pk, float(score)) for pk, score in zip(chunk, scores[start:start + size]) if pk in allowed
+        )
+        start += size
+        size = min(size * 2, MAX_CHUNK)
+    return matches[:MAX_MATCHES]
+
+
+# Receivers are connected after the ones in models.py, so the listing version
+# has already been bumped when these run
+@receiver(post_save, sender=Listening)
+def listing_saved(sender, instance, **kwargs):
+    trigram_index.listing_changed(instance)
+
+
+@receiver(post_delete, sender=Listening)
+def listing_deleted(sender, instance, **kwargs):
+    trigram_index.listing_changed(instance, deleted=True)
@@ -0,0 +1,132 @@
+import math
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cos, Power, Radians, Sin, Sqrt
+
+# Geohash cells for listing coordinates. Each listing stores a full precision
+# geohash; every shorter prefix of it is the enclosing grid cell, so "listings
+# in cell X" is a plain range scan on the indexed geohash column.
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 9
+# Sorts after every geohash character, closes the range of a prefix
+PREFIX_END = '{'
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_RADIUS_KM = 200
+# Upper bound on prefix ranges per query, trades pruning precision for query size
+MAX_CELLS = 16
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a coordinate pair"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = bits * 2 + 1
+                lon_range[0] = mid
+            else:
+                bits = bits * 2
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = bits * 2 + 1
+                lat_range[0] = mid
+            else:
+                bits = bits * 2
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of a geohash cell"""
+    lat_bits = (5 * precision) // 2
+    lon_bits = 5 * precision - lat_bits
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lon_bits
+
+
+def covering_cells(south, west, north, east):
+    """Smallest set of same-size geohash cells covering a bounding box"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        rows = math.ceil((north - south) / height) + 1
+        cols = math.ceil((east - west) / width) + 1
+        if rows * cols <= MAX_CELLS:
+            break
+
+    # One sample point per cell step (plus the far edge) hits every covering cell
+    cells = set()
+    for row in range(rows):
+        latitude = min(south + row * height, north)
+        for col in range(cols):
+            longitude = min(west + col * width, east)
+            cells.add(encode(latitude, longitude, precision))
+    return sorted(cells)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(south, west, north, east) box enclosing a circle"""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    dlon = min(math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)), 180.0)
+    return (
+        max(latitude - dlat, -90.0),
+        max(longitude - dlon, -180.0),
+        min(latitude + dlat, 90.0),
+        min(longitude + dlon, 180.0),
+    )
+
+
+def cell_filter(cells):
+    """Q matching listings whose geohash falls inside any of the cells"""
+    condition = Q()
+    for cell in cells:
+        condition |= Q(geohash__gte=cell, geohash__lt=cell + PREFIX_END)
+    return condition
+
+
+def within_box(queryset, south, west, north, east):
+    """Listings inside a bounding box, pruned by geohash cell first"""
+    return queryset.filter(
+        cell_filter(covering_cells(south, west, north, east)),
+        latitude__gte=south, latitude__lte=north,
+        longitude__gte=west, longitude__lte=east,
+    )
+
+
+def distance_expression(latitude, longitude):
+    """Great circle distance in km from a point, as a database expression"""
+    lat1 = Radians(Value(latitude, output_field=FloatField()))
+    lon1 = Radians(Value(longitude, output_field=FloatField()))
+    lat2 = Radians(F('latitude'))
+    lon2 = Radians(F('longitude'))
+    half_chord = (
+        Power(Sin((lat2 - lat1) / 2), 2)
+        + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(Sqrt(half_chord))
+
+
+def within_radius(queryset, latitude, longitude, radius_km):
+    """Listings within radius_km, annotated with distance_km
+
+    Candidates are first pruned by geohash cell and bounding box, the exact
+    haversine distance is only computed for what is left.
+    """
+    radius_km = min(radius_km, MAX_RADIUS_KM)
+    south, west, north, east = bounding_box(latitude, longitude, radius_km)
+    return within_box(queryset, south, west, north, east).annotate(
+        distance_km=distance_expression(latitude, longitude)
+    ).filter(distance_km__lte=radius_km)
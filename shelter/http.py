@@ -0,0 +1,30 @@
+def encoding_qualities(header):
+    """q-value per content coding named in an Accept-Encoding header
+
+    x-gzip counts as gzip; a malformed q-value counts as a refusal (0).
+    """
+    qualities = {}
+    for part in (header or '').split(','):
+        coding, *params = [piece.strip() for piece in part.split(';')]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        coding = coding.lower()
+        qualities['gzip' if coding == 'x-gzip' else coding] = quality
+    return qualities
+
+
+def accepts_gzip(request):
+    """True if the client takes a gzipped body, by name or through *
+
+    "gzip;q=0" is a refusal, as is "*;q=0" without gzip named.
+    """
+    qualities = encoding_qualities(request.headers.get('Accept-Encoding'))
+    return qualities.get('gzip', qualities.get('*', 0)) > 0
@@ -0,0 +1,207 @@
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from agents.models import Agent
+from team.models import Team
+from .cache import bump_agent_version, bump_listing_version, bump_team_version
+from .models import Listening
+
+logger = logging.getLogger(__name__)
+
+# Resized copies of uploaded photos. Each rendition is (width, height, crop)
+# at 1x; a 2x copy is made too when the original is large enough. Results are
+# recorded in the model's ``renditions`` JSON field, so templates build
+# srcsets without extra queries.
+RENDITION_SIZES = {
+    'thumbnail': (160, 110, True),
+    'sidebar': (330, 210, True),
+    'card': (368, 250, True),
+    'gallery': (870, 580, False),
+    'profile': (320, 330, True),
+}
+DENSITIES = (1, 2)
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpeg', 'JPEG', {'quality': 82, 'progressive': True, 'optimize': True}),
+)
+RENDITION_DIR = 'renditions'
+
+# Image fields per model and the renditions each one needs
+IMAGE_FIELDS = {
+    Listening: {
+        'image': ('thumbnail', 'sidebar', 'card', 'gallery'),
+        'image2': ('thumbnail', 'gallery'),
+        'image3': ('thumbnail', 'gallery'),
+    },
+    Agent: {'photo': ('thumbnail', 'profile')},
+    Team: {'photo': ('thumbnail', 'profile')},
+}
+# Cached pages showing these models are retired once new renditions exist
+VERSION_BUMPS = {
+    Listening: bump_listing_version,
+    Agent: bump_agent_version,
+    Team: bump_team_version,
+}
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+            thread_name_prefix='image-renditions',
+        )
+    return _executor
+
+
+def rendition_name(source, size, density, extension):
+    base, _ = os.path.splitext(source)
+    return f'{RENDITION_DIR}/{base}/{size}-{density}x.{extension}'
+
+
+def _resize(image, width, height, crop):
+    if crop:
+        return ImageOps.fit(image, (width, height), Image.LANCZOS)
+    resized = image.copy()
+    resized.thumbnail((width, height), Image.LANCZOS)
+    return resized
+
+
+def render_renditions(data, source, sizes):
+    """Encode every rendition of one image, no Django or database involved
+
+    Returns (source info, [(size, density, format, width, height, name, bytes)]). Runs
+    in worker threads after upload and in worker processes when backfilling.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image = ImageOps.exif_transpose(original).convert('RGB')
+    info = {'source': source, 'width': image.width, 'height': image.height}
+
+    outputs = []
+    for size in sizes:
+        width, height, crop = RENDITION_SIZES[size]
+        for density in DENSITIES:
+            # Never upscale, a 2x copy only exists when the original has the pixels
+            if density > 1 and (image.width < width * density or image.height < height * density):
+                continue
+            resized = _resize(image, width * density, height * density, crop)
+            for extension, pil_format, options in FORMATS:
+                buffer = io.BytesIO()
+                resized.save(buffer, pil_format, **options)
+                outputs.append((
+                    size, density, extension, resized.width, resized.height,
+                    rendition_name(source, size, density, extension), buffer.getvalue(),
+                ))
+    return info, outputs
+
+
+def store_renditions(info, outputs):
+    """Save encoded renditions and return the JSON entry describing them"""
+    entry = dict(info, sizes={})
+    for size, density, extension, width, height, name, content in outputs:
+        if default_storage.exists(name):
+            default_storage.delete(name)
+        default_storage.save(name, ContentFile(content))
+        entry['sizes'].setdefault(size, []).append({
+            'format': extension, 'density': density, 'width': width, 'height': height, 'name': name,
+        })
+    return entry
+
+
+def pending_fields(instance):
+    """Image fields whose renditions are missing or were made from another file"""
+    renditions = instance.renditions or {}
+    return [
+        field for field in IMAGE_FIELDS[type(instance)]
+        if getattr(instance, field) and renditions.get(field, {}).get('source') != getattr(instance, field).name
+    ]
+
+
+def save_renditions(model, pk, entries):
+    """Merge new rendition entries into the stored JSON without calling save()"""
+    with transaction.atomic():
+        instance = model.objects.select_for_update().filter(pk=pk).first()
+        if instance is None:
+            return
+        renditions = dict(instance.renditions or {})
+        for field, entry in entries.items():
+            # The file may have been replaced again while this one was processing
+            if getattr(instance, field).name == entry['source']:
+                renditions[field] = entry
+        model.objects.filter(pk=pk).update(renditions=renditions, updated=timezone.now())
+    VERSION_BUMPS[model]()
+
+
+def process_instance(model, pk, fields):
+    """Make renditions for some image fields of one object"""
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    entries = {}
+    for field in fields:
+        file = getattr(instance, field)
+        if not file:
+            continue
+        try:
+            with default_storage.open(file.name, 'rb') as handle:
+                data = handle.read()
+            entries[field] = store_renditions(*render_renditions(data, file.name, IMAGE_FIELDS[model][field]))
+        except (OSError, Image.DecompressionBombError):
+            logger.exception('Could not make renditions of %s', file.name)
+    if entries:
+        save_renditions(model, pk, entries)
+
+
+def _run_in_background(model, pk, fields):
+    try:
+        process_instance(model, pk, fields)
+    except Exception:
+        logger.exception('Image renditions failed for %s %s', model.__name__, pk)
+    finally:
+        # Worker threads open their own connections, close them between jobs
+        close_old_connections()
+
+
+def queue_renditions(instance):
+    fields = pending_fields(instance)
+    if fields:
+        model, pk = type(instance), instance.pk
+        transaction.on_commit(lambda: get_executor().submit(_run_in_background, model, pk, fields))
+
+
+def variants(instance, field, size, extension):
+    """Stored renditions of one size and format, 1x first; [] until they exist"""
+    entry = (instance.renditions or {}).get(field, {})
+    file = getattr(instance, field)
+    if not file or entry.get('source') != file.name:
+        return []
+    found = [variant for variant in entry['sizes'].get(size, []) if variant['format'] == extension]
+    return sorted(found, key=lambda variant: variant['density'])
+
+
+def srcset(instance, field, size, extension):
+    """'url 1x, url 2x' for a rendition, or '' if it has not been made yet"""
+    return ', '.join(
+        f"{default_storage.url(variant['name'])} {variant['density']}x"
+        for variant in variants(instance, field, size, extension)
+    )
+
+
+@receiver(post_save, sender=Listening)
+@receiver(post_save, sender=Agent)
+@receiver(post_save, sender=Team)
+def image_owner_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        queue_renditions(instance)
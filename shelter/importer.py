@@ -0,0 +1,301 @@
+import csv
+import io
+import json
+import os
+import secrets
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import slugify
+from openpyxl import load_workbook
+
+from agents.models import Agent
+from . import search
+from .cache import bump_listing_version
+from .forms import TRUE_VALUES, ListingImportForm
+from .leads import normalize_email, write_leads
+from .models import Listening, Newsletter
+from .ranking import get_rank_weights
+from .similar import queue_similar_updates
+
+# Bulk create-or-update of listings keyed on external_id, from the API or
+# `manage.py import_listings`. Rows are validated, given slugs and written a
+# batch at a time with one upsert statement, so large files go through in
+# minutes and memory stays flat. save() and its signals are skipped; the
+# derived columns, search index, similar homes queue and cache version are
+# handled here instead.
+BATCH_SIZE = 1000
+# Per-row errors kept for the report, the rest are only counted
+MAX_REPORTED_ERRORS = 1000
+FORMATS = ('csv', 'xlsx', 'jsonl')
+# Newsletter subscribers upserted per chunk
+SUBSCRIBER_BATCH_SIZE = 5000
+# Slug queries counting up -2, -3... before random suffixes are used
+SLUG_NUMBERED_ROUNDS = 3
+
+WRITTEN_FIELDS = (
+    'external_id', 'agent', 'title', 'description', 'location', 'status', 'price',
+    'bedrooms', 'bathrooms', 'kitchen', 'garage', 'area', 'latitude', 'longitude',
+    'available', 'is_featured', 'marketing_priority', 'created', 'image', 'image2', 'image3',
+)
+# Computed by Listening.set_derived_fields()
+DERIVED_FIELDS = ('area_sqft', 'geohash', 'rank_score')
+# The slug of an existing listing never changes, its URL stays valid
+UPDATED_FIELDS = tuple(field for field in WRITTEN_FIELDS if field != 'external_id') + DERIVED_FIELDS + ('updated',)
+
+
+class ImportFileError(Exception):
+    pass
+
+
+class ImportResult:
+    def __init__(self, key='external_id'):
+        # Name of the column that identifies a row in error reports
+        self.key = key
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def add_error(self, row, errors, key=None):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, self.key: key, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def detect_format(name):
+    extension = os.path.splitext(name)[1].lower().lstrip('.')
+    return {'ndjson': 'jsonl', 'json': 'jsonl', 'xlsm': 'xlsx'}.get(extension, extension)
+
+
+def read_rows(handle, file_format):
+    """(row number, dict) for each record of a binary file object
+
+    Row numbers are as a person would count them: CSV and XLSX data start at
+    row 2, below the header.
+    """
+    if file_format == 'csv':
+        text = io.TextIOWrapper(handle, encoding='utf-8-sig', newline='')
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, row
+    elif file_format == 'xlsx':
+        # read_only streams the sheet instead of loading it whole
+        workbook = load_workbook(handle, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(cell).strip() if cell is not None else '' for cell in next(rows, ())]
+        for number, values in enumerate(rows, start=2):
+            if any(value is not None for value in values):
+                yield number, {key: value for key, value in zip(header, values) if key}
+        workbook.close()
+    elif file_format == 'jsonl':
+        for number, line in enumerate(handle, start=1):
+            if line.strip():
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    row = e
+                yield number, row
+    else:
+        raise ImportFileError(f'Unsupported format {file_format!r}, use one of {", ".join(FORMATS)}')
+
+
+def _blank_to_none(row):
+    # Spreadsheets give None or '' for empty cells, forms want ''
+    return {key: '' if value is None else value for key, value in row.items()}
+
+
+class ListingImporter:
+    def __init__(self, batch_size=BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.result = ImportResult()
+        self.rank_weights = get_rank_weights()
+        self.seen = set()
+        # One form for every row: building a form deep-copies all its fields,
+        # which costs more than validating the row
+        self.form = ListingImportForm(data={})
+        self.agent_ids = set()
+        self.agent_emails = {}
+        for pk, email in Agent.objects.values_list('pk', 'email'):
+            self.agent_ids.add(pk)
+            self.agent_emails[email.strip().lower()] = pk
+
+    def run(self, rows):
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            self.import_batch(batch)
+        return self.result
+
+    def validate(self, number, row):
+        if not isinstance(row, dict):
+            self.result.add_error(number, {'__all__': [f'Not a JSON object: {row}']})
+            return None
+        form = self.form
+        form.data = _blank_to_none(row)
+        form._errors = None
+        external_id = str(row.get('external_id') or '').strip() or None
+        if not form.is_valid():
+            self.result.add_error(number, form.errors.get_json_data(), external_id)
+            return None
+        data = form.cleaned_data
+        agent = data['agent'] or self.agent_emails.get(data['agent_email'].lower())
+        if agent not in self.agent_ids:
+            self.result.add_error(number, {'agent': [{'message': 'No such agent', 'code': 'invalid'}]}, external_id)
+            return None
+        if data['external_id'] in self.seen:
+            self.result.add_error(number, {'external_id': [{'message': 'Repeated in this import', 'code': 'unique'}]}, external_id)
+            return None
+        self.seen.add(data['external_id'])
+        data['agent'] = agent
+        return data
+
+    def build(self, data, existing):
+        fields = {field: data[field] for field in WRITTEN_FIELDS if field != 'agent'}
+        fields['agent_id'] = data['agent']
+        fields['kitchen'] = data['kitchen'] or 0
+        fields['garage'] = data['garage'] or 0
+        fields['available'] = True if data['available'] is None else data['available']
+        fields['is_featured'] = bool(data['is_featured'])
+        fields['marketing_priority'] = data['marketing_priority'] or 'medium'
+        listing = Listening(**fields)
+        if existing:
+            listing.pk, listing.slug, created = existing
+            listing.created = data['created'] or created
+        else:
+            listing.created = data['created'] or timezone.now()
+        listing.updated = timezone.now()
+        listing.set_derived_fields(self.rank_weights)
+        return listing
+
+    def allocate_slugs(self, listings):
+        """Unique slugs for new listings, one query per round for the whole batch"""
+        pending = {}
+        for listing in listings:
+            base = slugify(listing.title)[:180] or 'listing'
+            pending.setdefault(base, []).append(listing)
+        used = set()
+        offset, rounds = 1, 0
+        while pending:
+            candidates = {}
+            for base, group in pending.items():
+                for i, listing in enumerate(group):
+                    # After a few rounds of numbering, fall back to a random suffix
+                    number = offset + i
+                    if rounds >= SLUG_NUMBERED_ROUNDS:
+                        tail = f'-{secrets.token_hex(3)}'
+                    else:
+                        tail = '' if number == 1 else f'-{number}'
+                    candidates.setdefault(f'{base}{tail}', []).append((base, listing))
+            taken = used | set(Listening.objects.filter(slug__in=list(candidates)).values_list('slug', flat=True))
+            retry = {}
+            for slug, claims in candidates.items():
+                for position, (base, listing) in enumerate(claims):
+                    if slug in taken or position > 0:
+                        retry.setdefault(base, []).append(listing)
+                    else:
+                        listing.slug = slug
+                        used.add(slug)
+            offset += max(len(group) for group in pending.values())
+            rounds += 1
+            pending = retry
+
+    def import_batch(self, batch):
+        valid = [(number, data) for number, data in ((n, self.validate(n, row)) for n, row in batch) if data]
+        if not valid:
+            return
+        existing = {
+            external_id: (pk, slug, created)
+            for external_id, pk, slug, created in Listening.objects.filter(
+                external_id__in=[data['external_id'] for number, data in valid]
+            ).values_list('external_id', 'pk', 'slug', 'created')
+        }
+        listings = [self.build(data, existing.get(data['external_id'])) for number, data in valid]
+        new = [listing for listing in listings if listing.pk is None]
+        updated = len(listings) - len(new)
+        if self.dry_run:
+            self.result.created += len(new)
+            self.result.updated += updated
+            return
+
+        self.allocate_slugs(new)
+        with transaction.atomic():
+            # One INSERT ... ON CONFLICT (external_id) DO UPDATE per batch
+            Listening.objects.bulk_create(
+                listings,
+                update_conflicts=True,
+                unique_fields=['external_id'],
+                update_fields=UPDATED_FIELDS,
+            )
+            if any(listing.pk is None for listing in listings):
+                # Databases that cannot return ids from an upsert
+                ids = dict(Listening.objects.filter(
+                    external_id__in=[listing.external_id for listing in listings]
+                ).values_list('external_id', 'pk'))
+                for listing in listings:
+                    listing.pk = ids[listing.external_id]
+            search.index_listings(listings)
+            queue_similar_updates([listing.pk for listing in listings if listing.available])
+        bump_listing_version()
+        self.result.created += len(new)
+        self.result.updated += updated
+
+
+def import_listings(rows, batch_size=BATCH_SIZE, dry_run=False):
+    """Create or update listings from (row number, dict) pairs, returns an ImportResult"""
+    return ListingImporter(batch_size, dry_run).run(rows)
+
+
+def _subscriber(row):
+    """(Newsletter field values, None) for an import row, or (None, errors)"""
+    if not isinstance(row, dict):
+        return None, {'__all__': ['Not a JSON object']}
+    email = normalize_email(str(row.get('email') or ''))
+    try:
+        validate_email(email)
+    except ValidationError as e:
+        return None, {'email': e.messages}
+    return {
+        'email': email,
+        'name': str(row.get('name') or '')[:100],
+        'phone': str(row.get('phone') or '')[:20],
+        'whatsapp_updates': str(row.get('whatsapp_updates') or '').strip().lower() in TRUE_VALUES,
+    }, None
+
+
+def import_subscribers(rows, batch_size=SUBSCRIBER_BATCH_SIZE):
+    """Subscribe (row number, dict) pairs with email, name, phone, whatsapp_updates
+
+    Each chunk is one upsert on email, which also reactivates unsubscribed
+    addresses; created counts new addresses, updated the ones already listed.
+    """
+    result = ImportResult(key='email')
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        subscribers = {}
+        for number, row in batch:
+            fields, errors = _subscriber(row)
+            if errors:
+                result.add_error(number, errors, row.get('email') if isinstance(row, dict) else None)
+            else:
+                subscribers[fields['email']] = fields
+        known = set(Newsletter.objects.filter(email__in=list(subscribers)).values_list('email', flat=True))
+        write_leads(('newsletter', fields) for fields in subscribers.values())
+        result.created += len(subscribers) - len(known)
+        result.updated += len(known)
+    return result
@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from itertools import groupby
+from django.apps import apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows, where one dev server process writes alone
+    fcntl = None
+
+# Contact and signup forms hand their rows to a journal file on local disk
+# instead of inserting them during the request. A flusher thread in each
+# worker (or `manage.py flush_leads`) moves the journal aside every
+# LEAD_FLUSH_SECONDS and writes its rows with bulk_create, so a burst of
+# submissions becomes a few INSERTs instead of one write lock per request.
+#
+# Delivery is at least once: a flusher that dies between committing and
+# deleting a journal leaves it to be written again. Rows are kept in order.
+
+LEAD_MODELS = {
+    'contact': 'shelter.Contact',
+    'quickcontact': 'shelter.Quickcontact',
+    'agentcontact': 'agents.AgentContact',
+    'agentpropertycontact': 'agents.AgentPropertyContact',
+    'teamcontact': 'team.TeamContactMessage',
+    'newsletter': 'shelter.Newsletter',
+}
+# Columns each kind of lead is filed by in LeadTouch: email, phone, name and
+# submission time (None where the model has none)
+TOUCH_FIELDS = {
+    'contact': ('email', 'phone', 'name', 'created_at'),
+    'quickcontact': ('email', 'phone', 'name', None),
+    'agentcontact': ('user_email', 'user_phone', 'user_name', 'contact_date'),
+    'agentpropertycontact': ('user_email', 'user_phone', 'user_name', 'contact_date'),
+    'newsletter': ('email', 'phone', 'name', 'date_subscribed'),
+}
+# How a kind's INSERT treats a row already there. A newsletter signup for a
+# known address is an upsert (ON CONFLICT DO UPDATE on PostgreSQL and SQLite)
+# that reactivates the subscription; the first signup date is kept.
+CONFLICT_OPTIONS = {
+    'newsletter': {
+        'update_conflicts': True,
+        'unique_fields': ['email'],
+        'update_fields': ['name', 'whatsapp_updates', 'is_active'],
+    },
+}
+# Rows per INSERT
+FLUSH_BATCH_SIZE = 500
+CURRENT = 'current.jsonl'
+
+logger = logging.getLogger(__name__)
+
+_flusher_lock = threading.Lock()
+_flusher_pid = None
+
+
+def get_outbox_root():
+    return getattr(settings, 'LEAD_OUTBOX_ROOT', os.path.join(settings.BASE_DIR, 'lead_outbox'))
+
+
+def get_flush_seconds():
+    return getattr(settings, 'LEAD_FLUSH_SECONDS', 2)
+
+
+def _lock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+
+
+def _same_file(fd, path):
+    try:
+        return os.fstat(fd).st_ino == os.stat(path).st_ino
+    except FileNotFoundError:
+        return False
+
+
+def _append(data):
+    root = get_outbox_root()
+    path = os.path.join(root, CURRENT)
+    while True:
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o640)
+        except FileNotFoundError:
+            os.makedirs(root, exist_ok=True)
+            continue
+        try:
+            _lock(fd)
+            # A flusher may have moved the journal away since it was opened
+            if fcntl is not None and not _same_file(fd, path):
+                continue
+            os.write(fd, data)
+            if getattr(settings, 'LEAD_OUTBOX_FSYNC', False):
+                os.fsync(fd)
+            return
+        finally:
+            os.close(fd)
+
+
+def submit_lead(kind, **fields):
+    """Queue one row of LEAD_MODELS[kind], written within LEAD_FLUSH_SECONDS
+
+    fields are model field values (use team_id=, not team=) and must be JSON
+    serializable. With LEAD_OUTBOX off the row is inserted right away.
+    """
+    if kind not in LEAD_MODELS:
+        raise ValueError(f'Unknown lead kind {kind!r}')
+    if not getattr(settings, 'LEAD_OUTBOX', True):
+        write_leads([(kind, fields)])
+        return
+    record = {'kind': kind, 'fields': fields}
+    _append((json.dumps(record, cls=DjangoJSONEncoder, separators=(',', ':')) + '\n').encode())
+    start_flusher()
+
+
+def lead_kind(model):
+    return next(kind for kind, label in LEAD_MODELS.items() if label == model._meta.label)
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_phone(value):
+    """Digits in international form without the +, so 098123 45678 and 98123 45678 match +91 98123 45678
+
+    A number with a single leading 0, or of exactly LEAD_PHONE_NATIONAL_DIGITS
+    digits, is taken as national and given LEAD_PHONE_COUNTRY_CODE. Anything
+    too short to dial is blank.
+    """
+    digits = ''.join(char for char in value or '' if char.isdigit())
+    country_code = getattr(settings, 'LEAD_PHONE_COUNTRY_CODE', '91')
+    if digits.startswith('00'):
+        digits = digits[2:]
+    elif digits.startswith('0'):
+        digits = country_code + digits[1:]
+    elif len(digits) == getattr(settings, 'LEAD_PHONE_NATIONAL_DIGITS', 10):
+        digits = country_code + digits
+    return digits[:20] if len(digits) >= 7 else ''
+
+
+def record_touches(kind, objs):
+    """File saved lead rows of one kind in LeadTouch, refreshing any already filed"""
+    if kind not in TOUCH_FIELDS:
+        return
+    LeadTouch = apps.get_model('shelter', 'LeadTouch')
+    email_field, phone_field, name_field, date_field = TOUCH_FIELDS[kind]
+    touches = [
+        LeadTouch(
+            kind=kind,
+            object_id=obj.pk,
+            email=normalize_email(getattr(obj, email_field)),
+            phone=normalize_phone(getattr(obj, phone_field)),
+            name=(getattr(obj, name_field) or '')[:100],
+            created_at=getattr(obj, date_field) if date_field else timezone.now(),
+        )
+        for obj in objs if obj.pk is not None
+    ]
+    LeadTouch.objects.bulk_create(
+        touches,
+        batch_size=FLUSH_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['kind', 'object_id'],
+        update_fields=['email', 'phone', 'name'],
+    )
+
+
+def _build(model, kind, fields):
+    try:
+        obj = model(**fields)
+    except (TypeError, ValueError):
+        logger.exception('Dropping a %s lead that does not fit the model: %r', kind, fields)
+        return None
+    # Forms pass what visitors typed; cut it to the columns rather than have
+    # the database refuse the row
+    for field in model._meta.concrete_fields:
+        value = getattr(obj, field.attname)
+        if field.max_length and isinstance(value, str) and len(value) > field.max_length:
+            logger.warning('Truncating %s.%s of a %s lead to %d characters', model.__name__, field.name, kind, field.max_length)
+            setattr(obj, field.attname, value[:field.max_length])
+    return obj
+
+
+def _bulk_create(model, kind, objs):
+    try:
+        with transaction.atomic():
+            model.objects.bulk_create(objs, **CONFLICT_OPTIONS.get(kind, {}))
+            # bulk_create() sends no post_save, file the touches here
+            record_touches(kind, objs)
+        return len(objs)
+    except (DataError, IntegrityError):
+        # Errors about the rows themselves; a database that is down raises
+        # OperationalError and the whole journal is tried again later
+        if len(objs) == 1:
+            logger.exception('Dropping a %s lead the database refused', kind)
+            return 0
+    # Find the bad row (say, a team deleted meanwhile) without losing the rest
+    return sum(_bulk_create(model, kind, [obj]) for obj in objs)
+
+
+def write_leads(leads):
+    """Insert (kind, fields) pairs, a run of one kind per bulk_create; returns rows written"""
+    written = 0
+    for kind, run in groupby(leads, key=lambda lead: lead[0]):
+        model = apps.get_model(LEAD_MODELS[kind])
+        objs = [obj for obj in (_build(model, kind, fields) for _, fields in run) if obj is not None]
+        if kind == 'newsletter':
+            # One INSERT may not upsert the same address twice, the last signup wins
+            for obj in objs:
+                obj.email = normalize_email(obj.email)
+                obj.is_active = True
+            objs = list({obj.email: obj for obj in objs}.values())
+        for start in range(0, len(objs), FLUSH_BATCH_SIZE):
+            written += _bulk_create(model, kind, objs[start:start + FLUSH_BATCH_SIZE])
+    return written
+
+
+def _flush_file(path):
+    try:
+        handle = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with handle:
+        # Waits out a writer still appending, or another flusher on this file
+        _lock(handle.fileno())
+        if not _same_file(handle.fileno(), path):
+            return 0
+        leads = []
+        for line in handle:
+            try:
+                record = json.loads(line)
+                leads.append((record['kind'], record['fields']))
+            except (ValueError, KeyError):
+                # A line cut short by a crash mid-write
+                logger.error('Skipping a damaged line in %s', path)
+        written = write_leads(lead for lead in leads if lead[0] in LEAD_MODELS)
+        os.unlink(path)
+    return written
+
+
+def flush_leads():
+    """Write every queued lead to the database, returns the number of rows"""
+    root = get_outbox_root()
+    if not os.path.isdir(root):
+        return 0
+    try:
+        os.rename(os.path.join(root, CURRENT), os.path.join(root, f'batch-{time.time_ns()}-{uuid.uuid4().hex}.jsonl'))
+    except FileNotFoundError:
+        pass
+    # Older batches first, including any left by a flusher that died
+    names = sorted(name for name in os.listdir(root) if name.startswith('batch-'))
+    written = 0
+    for name in names:
+        try:
+            written += _flush_file(os.path.join(root, name))
+        except Exception:
+            # Kept for the next flush, the batches after it still go through
+            logger.exception('Could not write the leads in %s', name)
+    return written
+
+
+def _flush_forever():
+    while True:
+        time.sleep(get_flush_seconds())
+        try:
+            flush_leads()
+        except Exception:
+            logger.exception('Could not flush the lead outbox')
+
+
+def start_flusher():
+    """Start this process's flusher thread unless it is running"""
+    global _flusher_pid
+    # Threads do not survive a fork, so the check is per process
+    if _flusher_pid == os.getpid():
+        return
+    with _flusher_lock:
+        if _flusher_pid != os.getpid():
+            threading.Thread(target=_flush_forever, name='lead-flusher', daemon=True).start()
+            _flusher_pid = os.getpid()
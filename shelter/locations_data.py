@@ -38,3 +38,12 @@ locations = {
     'Lakshadweep': 'Lakshadweep',
     'Puducherry': 'Puducherry'
 }
+
+# Known locations by lower-cased name, so searches can use an exact indexed match
+LOCATION_NAMES = {name.lower(): name for name in locations.values()}
+
+
+def normalize_location(location):
+    """Canonical spelling of a known location, otherwise the trimmed input"""
+    location = (location or '').strip()
+    return LOCATION_NAMES.get(location.lower(), location)
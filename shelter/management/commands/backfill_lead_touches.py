@@ -0,0 +1,26 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from shelter.leads import FLUSH_BATCH_SIZE, LEAD_MODELS, TOUCH_FIELDS, record_touches
+
+
+class Command(BaseCommand):
+    help = 'File every existing contact, enquiry and newsletter row in LeadTouch (safe to rerun)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=FLUSH_BATCH_SIZE * 4)
+
+    def handle(self, *args, **options):
+        for kind in TOUCH_FIELDS:
+            model = apps.get_model(LEAD_MODELS[kind])
+            filed = last = 0
+            # Walk by primary key so each batch is one indexed range read
+            while True:
+                batch = list(model.objects.filter(pk__gt=last).order_by('pk')[:options['batch_size']])
+                if not batch:
+                    break
+                record_touches(kind, batch)
+                filed += len(batch)
+                last = batch[-1].pk
+            self.stdout.write(f'{model._meta.verbose_name_plural}: {filed}')
+        self.stdout.write(self.style.SUCCESS('Lead touches are up to date'))
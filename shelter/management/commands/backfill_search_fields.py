@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from shelter import geo
+from shelter.locations_data import normalize_location
+from shelter.cache import bump_listing_version
+from shelter.models import Listening, parse_area_sqft
+from shelter.ranking import refresh_rank_scores
+
+
+class Command(BaseCommand):
+    help = 'Fill area_sqft, geohash, rank_score and canonical location spelling for existing listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Listings updated per query')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        queryset = Listening.objects.only('id', 'area', 'area_sqft', 'location', 'latitude', 'longitude', 'geohash')
+        fields = ['area_sqft', 'location', 'geohash']
+
+        # bulk_update skips save() and signals, only derived columns change here
+        batch = []
+        updated = 0
+        unparsed = 0
+        for listing in queryset.iterator(chunk_size=batch_size):
+            area_sqft = parse_area_sqft(listing.area)
+            location = normalize_location(listing.location)
+            geohash = ''
+            if listing.latitude is not None and listing.longitude is not None:
+                geohash = geo.encode(listing.latitude, listing.longitude)
+            if area_sqft is None:
+                unparsed += 1
+            if (area_sqft, location, geohash) != (listing.area_sqft, listing.location, listing.geohash):
+                listing.area_sqft = area_sqft
+                listing.location = location
+                listing.geohash = geohash
+                batch.append(listing)
+            if len(batch) >= batch_size:
+                Listening.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            Listening.objects.bulk_update(batch, fields)
+            updated += len(batch)
+
+        # Also picks up changed LISTING_RANK_WEIGHTS
+        ranked = refresh_rank_scores(Listening.objects.all(), batch_size)
+        if updated or ranked:
+            bump_listing_version()
+        self.stdout.write(self.style.SUCCESS(f'Updated {updated} listings, re-ranked {ranked}'))
+        if unparsed:
+            self.stdout.write(self.style.WARNING(f'{unparsed} listings have an area that could not be parsed'))
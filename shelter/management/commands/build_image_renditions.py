@@ -0,0 +1,79 @@
+import logging
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+
+from shelter.images import IMAGE_FIELDS, pending_fields, render_renditions, save_renditions, store_renditions
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Make the resized WebP/JPEG copies of listing, agent and team photos that are missing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='Encoding processes, defaults to the CPU count')
+        parser.add_argument('--all', action='store_true', help='Redo renditions that already exist')
+
+    def handle(self, *args, **options):
+        self.done = self.failed = 0
+        workers = options['workers'] or os.cpu_count() or 1
+        # Only Pillow runs in the pool; files are read, stored and saved here
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers)
+        self.running = {}
+        # Bounded, so at most a few images per worker are held in memory
+        self.limit = workers * 4
+        try:
+            for model, fields in IMAGE_FIELDS.items():
+                objects = model.objects.only('pk', 'renditions', *fields).order_by('pk')
+                for instance in objects.iterator(chunk_size=500):
+                    for field in (list(fields) if options['all'] else pending_fields(instance)):
+                        self.submit(model, instance, field)
+            while self.running:
+                self.collect(wait(self.running).done)
+        finally:
+            self.executor.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f'Made renditions for {self.done} images, {self.failed} failed'))
+
+    def submit(self, model, instance, field):
+        file = getattr(instance, field)
+        if not file:
+            return
+        try:
+            with default_storage.open(file.name, 'rb') as handle:
+                data = handle.read()
+        except Exception as e:
+            self.fail(file.name, e)
+            return
+        while len(self.running) >= self.limit:
+            self.collect(wait(self.running, return_when=FIRST_COMPLETED).done)
+        try:
+            future = self.executor.submit(render_renditions, data, file.name, IMAGE_FIELDS[model][field])
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); its images are failed in collect()
+            self.executor.shutdown(wait=False)
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            future = self.executor.submit(render_renditions, data, file.name, IMAGE_FIELDS[model][field])
+        self.running[future] = (model, instance.pk, field, file.name)
+
+    def collect(self, futures):
+        for future in futures:
+            model, pk, field, name = self.running.pop(future)
+            # One bad image (corrupt, huge, a crashed worker, a failed save) must not end the run
+            try:
+                entry = store_renditions(*future.result())
+                save_renditions(model, pk, {field: entry})
+            except Exception as e:
+                self.fail(name, e)
+                continue
+            self.done += 1
+
+    def fail(self, name, error):
+        self.failed += 1
+        logger.error('Renditions failed for %s', name, exc_info=error)
+        self.stderr.write(f'{name}: {error}')
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from shelter.similar import BATCH_SIZE, rebuild_similar_listings, update_pending_similar_listings
+
+
+class Command(BaseCommand):
+    help = 'Recompute the "similar homes" shown on property detail pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Listings compared per vectorised batch')
+        parser.add_argument('--pending', action='store_true', help='Only listings saved since they were last computed')
+
+    def handle(self, *args, **options):
+        if options['pending']:
+            listings, total = update_pending_similar_listings(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Stored {total} similar listing links for {listings} changed listings'))
+            return
+        total = rebuild_similar_listings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {total} similar listing links'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shelter.sitemap import build_sitemaps, get_root
+
+
+class Command(BaseCommand):
+    help = 'Write the listing sitemap, rewriting only the shards whose listings changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rewrite every shard')
+        parser.add_argument('--base-url', help='Public site address, defaults to SITE_URL')
+
+    def handle(self, *args, **options):
+        rewritten, total = build_sitemaps(full=options['full'], base_url=options['base_url'])
+        self.stdout.write(self.style.SUCCESS(f'Rewrote {rewritten} of {total} sitemap shards in {get_root()}'))
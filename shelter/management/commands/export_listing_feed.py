@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shelter.feed import FORMATS, encoded, feed_chunks, parse_since
+
+
+class Command(BaseCommand):
+    help = 'Write the partner inventory feed of available listings as XML or JSON Lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='xml')
+        parser.add_argument('--since', help='Only listings changed after this ISO date or datetime, sold ones included')
+        parser.add_argument('--output', default='-', help='File to write, - for stdout; a .gz name is gzipped')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--base-url', help='Public site address for links, defaults to SITE_URL')
+
+    def handle(self, *args, **options):
+        since = parse_since(options['since'])
+        if options['since'] and since is None:
+            raise CommandError('--since must be an ISO date or datetime')
+
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        chunks = encoded(feed_chunks(options['format'], since, options['base_url']), compress=compress)
+        stream = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            written = 0
+            for chunk in chunks:
+                stream.write(chunk)
+                written += len(chunk)
+        finally:
+            if stream is not sys.stdout.buffer:
+                stream.close()
+        if output != '-':
+            self.stdout.write(self.style.SUCCESS(f'Wrote {written} bytes to {output}'))
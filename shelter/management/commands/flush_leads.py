@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shelter.leads import flush_leads, get_flush_seconds, get_outbox_root
+
+
+class Command(BaseCommand):
+    help = 'Write the contact form and newsletter rows queued in the lead outbox to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep flushing every LEAD_FLUSH_SECONDS')
+
+    def handle(self, *args, **options):
+        written = flush_leads()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} leads from {get_outbox_root()}'))
+        while options['loop']:
+            time.sleep(get_flush_seconds())
+            written = flush_leads()
+            if written:
+                self.stdout.write(f'Wrote {written} leads')
@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shelter.importer import BATCH_SIZE, FORMATS, ImportFileError, detect_format, import_listings, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Create or update listings from a CSV, XLSX or JSON Lines file, matched on external_id'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='File format, by default from the extension')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate the rows without writing')
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or detect_format(options['path'])
+        if file_format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {options["path"]}, pass --format')
+        try:
+            with open(options['path'], 'rb') as handle:
+                result = import_listings(
+                    read_rows(handle, file_format), batch_size=options['batch_size'], dry_run=options['dry_run'],
+                )
+        except (OSError, ImportFileError) as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(json.dumps(error))
+        if result.failed > len(result.errors):
+            self.stderr.write(f'... and {result.failed - len(result.errors)} more rows with errors')
+        verb = 'Would create' if options['dry_run'] else 'Created'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created}, updated {result.updated}, {result.failed} rows failed'
+        ))
+        if (result.created or result.updated) and not options['dry_run']:
+            self.stdout.write('Run build_similar_listings and build_image_renditions to bring those up to date')
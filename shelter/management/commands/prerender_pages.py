@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from shelter.prerender import get_root, prerender_pages
+
+
+class Command(BaseCommand):
+    help = 'Write the static pages (terms, services, ...) to disk as plain and gzipped HTML'
+
+    def handle(self, *args, **options):
+        manifest = prerender_pages()
+        self.stdout.write(self.style.SUCCESS(f"Prerendered {len(manifest['pages'])} pages to {get_root()}"))
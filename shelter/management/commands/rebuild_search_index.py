@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from shelter.cache import bump_listing_version
+from shelter.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for property listings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default', help='Database alias to rebuild')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Listings indexed per batch')
+
+    def handle(self, *args, **options):
+        total = rebuild_index(using=options['database'], batch_size=options['batch_size'])
+        bump_listing_version()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} listings'))
@@ -0,0 +1,53 @@
+import math
+
+from django.http import HttpResponse, JsonResponse
+
+from . import ratelimit
+from .prerender import PRERENDER_ENVIRON_KEY, serve_page
+
+
+class PrerenderedPageMiddleware:
+    """Serve the pages in shelter.prerender.PRERENDERED_PAGES from disk
+
+    Sits right after SecurityMiddleware, so these requests skip the session,
+    CSRF, auth and message middleware as well as the view.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.META.get(PRERENDER_ENVIRON_KEY):
+            # Rendering the file itself; forms fetch their CSRF token on load,
+            # as on the other publicly cached pages
+            request.public_page = True
+            return self.get_response(request)
+        if request.method in ('GET', 'HEAD'):
+            response = serve_page(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+
+class RateLimitMiddleware:
+    """Answer 429 to clients over their shelter.ratelimit.RATE_LIMITS budget
+
+    Runs ahead of the session, auth and message middleware, so a rejected
+    request costs no database work.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        limited = ratelimit.check(request)
+        if limited is None:
+            return self.get_response(request)
+        name, wait = limited
+        message = 'Too many requests, please try again shortly.'
+        if 'application/json' in request.headers.get('Accept', ''):
+            response = JsonResponse({'success': False, 'message': message}, status=429)
+        else:
+            response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(math.ceil(wait))
+        return response
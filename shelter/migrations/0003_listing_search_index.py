@@ -0,0 +1,32 @@
+from django.db import migrations
+
+from shelter.search import create_index_sql, drop_index_sql, index_listings
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for statement in create_index_sql(connection.vendor):
+            cursor.execute(statement)
+
+    Listening = apps.get_model('shelter', 'Listening')
+    listings = Listening.objects.using(connection.alias).only('id', 'title', 'description', 'location', 'area')
+    index_listings(listings.iterator(), using=connection.alias)
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        for statement in drop_index_sql(connection.vendor):
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0002_listening_is_featured_listening_marketing_priority_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_agent_user'),
+        ('shelter', '0003_listing_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['-created', '-id'], name='shelter_lis_created_7c7629_idx'),
+        ),
+    ]
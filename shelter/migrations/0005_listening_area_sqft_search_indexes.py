@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_agent_user'),
+        ('shelter', '0004_listening_created_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listening',
+            name='area_sqft',
+            field=models.PositiveIntegerField(blank=True, editable=False, help_text='Parsed from area', null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', 'status', 'location', 'price'], name='shelter_lis_availab_731c72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', 'location', 'price'], name='shelter_lis_availab_f953b0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', 'price'], name='shelter_lis_availab_cf308b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', 'area_sqft'], name='shelter_lis_availab_a8653e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', 'bedrooms'], name='shelter_lis_availab_8791bf_idx'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_agent_user'),
+        ('shelter', '0005_listening_area_sqft_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listening',
+            name='geohash',
+            field=models.CharField(blank=True, editable=False, help_text='Computed from latitude and longitude', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='listening',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='listening',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', 'geohash'], name='shelter_lis_availab_2c6e9a_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+from shelter.fuzzy import create_index_sql, drop_index_sql
+
+
+def create_trigram_index(apps, schema_editor):
+    # pg_trgm only, other databases keep their trigram index in memory
+    with schema_editor.connection.cursor() as cursor:
+        for statement in create_index_sql(schema_editor.connection.vendor):
+            cursor.execute(statement)
+
+
+def drop_trigram_index(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for statement in drop_index_sql(schema_editor.connection.vendor):
+            cursor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0006_listening_geo_location'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
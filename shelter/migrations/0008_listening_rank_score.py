@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+from shelter.ranking import listing_rank_score
+
+
+def compute_rank_scores(apps, schema_editor):
+    Listening = apps.get_model('shelter', 'Listening')
+    listings = list(Listening.objects.using(schema_editor.connection.alias).only(
+        'id', 'created', 'is_featured', 'marketing_priority'))
+    for listing in listings:
+        listing.rank_score = listing_rank_score(listing.created, listing.is_featured, listing.marketing_priority)
+    Listening.objects.using(schema_editor.connection.alias).bulk_update(listings, ['rank_score'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agents', '0005_agent_user'),
+        ('shelter', '0007_listing_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listening',
+            name='rank_score',
+            field=models.FloatField(default=0, editable=False, help_text='Recency plus featured and priority boosts'),
+        ),
+        migrations.RunPython(compute_rank_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listening',
+            index=models.Index(fields=['available', '-rank_score', '-id'], name='shelter_lis_availab_7598f5_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0011_listening_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listening',
+            name='external_id',
+            field=models.CharField(blank=True, help_text="Listing id in the agency's own system, used by bulk imports", max_length=100, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0012_listening_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadTouch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('contact', 'Contact form'), ('quickcontact', 'Quick contact'), ('agentcontact', 'Agent contact'), ('agentpropertycontact', 'Property enquiry'), ('newsletter', 'Newsletter signup')], max_length=30)),
+                ('object_id', models.PositiveIntegerField()),
+                ('email', models.CharField(blank=True, max_length=254)),
+                ('phone', models.CharField(blank=True, max_length=20)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['email', '-created_at'], name='shelter_lea_email_0ef265_idx'), models.Index(fields=['phone', '-created_at'], name='shelter_lea_phone_beb5c4_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='shelter_leadtouch_kind_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+from django.db import migrations
+
+# Lead touches were first filed with national numbers given +92; file every
+# phone again with the current LEAD_PHONE_COUNTRY_CODE rules
+BATCH_SIZE = 2000
+TOUCH_SOURCES = {
+    'contact': ('shelter', 'Contact', 'phone'),
+    'quickcontact': ('shelter', 'Quickcontact', 'phone'),
+    'agentcontact': ('agents', 'AgentContact', 'user_phone'),
+    'agentpropertycontact': ('agents', 'AgentPropertyContact', 'user_phone'),
+    'newsletter': ('shelter', 'Newsletter', 'phone'),
+}
+
+
+def renormalize_phones(apps, schema_editor):
+    from shelter.leads import normalize_phone
+
+    db = schema_editor.connection.alias
+    LeadTouch = apps.get_model('shelter', 'LeadTouch')
+    for kind, (app_label, model_name, phone_field) in TOUCH_SOURCES.items():
+        model = apps.get_model(app_label, model_name)
+        last = 0
+        while True:
+            rows = list(
+                model.objects.using(db).filter(pk__gt=last).order_by('pk').values_list('pk', phone_field)[:BATCH_SIZE]
+            )
+            if not rows:
+                break
+            last = rows[-1][0]
+            phones = {pk: normalize_phone(phone) for pk, phone in rows}
+            touches = list(LeadTouch.objects.using(db).filter(kind=kind, object_id__in=list(phones)).only('pk', 'object_id', 'phone'))
+            changed = []
+            for touch in touches:
+                if touch.phone != phones[touch.object_id]:
+                    touch.phone = phones[touch.object_id]
+                    changed.append(touch)
+            LeadTouch.objects.using(db).bulk_update(changed, ['phone'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0014_pendingsimilarlisting'),
+        ('agents', '0011_contact_agent_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(renormalize_phones, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+from django.db.models import Count, F
+from django.db.models.functions import Lower, Trim
+
+
+def merge_emails(apps, schema_editor):
+    """Lowercase subscriber emails, merging rows that differ only in case
+
+    Signups upsert on the lowercased address, so a row kept as Foo@x.com
+    would never be reactivated. Of each group the first row is kept with its
+    signup date, taking the name, phone and choices of the latest signup.
+    """
+    db = schema_editor.connection.alias
+    Newsletter = apps.get_model('shelter', 'Newsletter')
+    LeadTouch = apps.get_model('shelter', 'LeadTouch')
+    subscribers = Newsletter.objects.using(db).annotate(address=Lower(Trim('email')))
+
+    repeated = subscribers.values('address').annotate(rows=Count('pk')).filter(rows__gt=1).values_list('address', flat=True)
+    for address in list(repeated):
+        rows = list(subscribers.filter(address=address).order_by('date_subscribed', 'pk'))
+        kept, latest = rows[0], rows[-1]
+        kept.name = latest.name
+        kept.phone = latest.phone
+        kept.whatsapp_updates = latest.whatsapp_updates
+        kept.is_active = latest.is_active
+        removed = [row.pk for row in rows[1:]]
+        Newsletter.objects.using(db).filter(pk__in=removed).delete()
+        # Deletes in migrations send no signals
+        LeadTouch.objects.using(db).filter(kind='newsletter', object_id__in=removed).delete()
+        kept.save(update_fields=['name', 'phone', 'whatsapp_updates', 'is_active'])
+
+    subscribers.exclude(email=F('address')).update(email=Lower(Trim('email')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0015_renormalize_lead_phones'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Listings saved before area_sqft and canonical locations existed only get
+# them when saved again; fill both for every row in pk ranges
+BATCH_SIZE = 2000
+
+
+def backfill(apps, schema_editor):
+    from shelter.locations_data import normalize_location
+    from shelter.models import parse_area_sqft
+
+    db = schema_editor.connection.alias
+    Listening = apps.get_model('shelter', 'Listening')
+    last = 0
+    while True:
+        rows = list(
+            Listening.objects.using(db).filter(pk__gt=last).order_by('pk').only('pk', 'area', 'area_sqft', 'location')[:BATCH_SIZE]
+        )
+        if not rows:
+            break
+        last = rows[-1].pk
+        changed = []
+        for listing in rows:
+            area_sqft = parse_area_sqft(listing.area)
+            location = normalize_location(listing.location)
+            if (area_sqft, location) != (listing.area_sqft, listing.location):
+                listing.area_sqft = area_sqft
+                listing.location = location
+                changed.append(listing)
+        Listening.objects.using(db).bulk_update(changed, ['area_sqft', 'location'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shelter', '0016_merge_newsletter_emails'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
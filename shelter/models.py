@@ -1,7 +1,54 @@
+import re
 from django.db import models
 from django.urls import reverse
 from django.utils import timezone
-from agents.models import Agent, AgentContact
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.db.models import Q
+from agents.models import Agent, AgentContact, AgentPropertyContact
+from team.models import Team
+from .locations_data import normalize_location
+from . import geo, leads, search
+from .ranking import listing_rank_score
+from .cache import bump_agent_version, bump_listing_version, bump_team_version
+
+# Square feet per unit for the area formats agents actually type
+AREA_UNITS = (
+    (('sq ft', 'sqft', 'sq. ft', 'sq.ft', 'square feet', 'ft2', 'sft'), 1),
+    (('sq m', 'sqm', 'sq. m', 'sq.m', 'square meter', 'square metre', 'm2'), 10.7639),
+    (('sq yd', 'sqyd', 'sq. yd', 'sq yard', 'square yard', 'gaj', 'yd2'), 9),
+    (('acre',), 43560),
+    (('hectare',), 107639),
+)
+AREA_NUMBER_RE = re.compile(r'\d[\d,]*(?:\.\d+)?')
+
+
+def _area_unit_factor(text):
+    for names, factor in AREA_UNITS:
+        if any(name in text for name in names):
+            return factor
+    return None
+
+
+def parse_area_sqft(area):
+    """Parse free text like '1,200 sq ft' or '2 acres' into whole square feet"""
+    if not area:
+        return None
+    text = str(area).lower()
+    numbers = list(AREA_NUMBER_RE.finditer(text))
+    if not numbers:
+        return None
+    # Prefer the number that is followed by a unit, e.g. "3 BHK, 1200 sqft"
+    for match in numbers:
+        factor = _area_unit_factor(text[match.end():match.end() + 16])
+        if factor:
+            break
+    else:
+        match, factor = numbers[0], 1
+    value = float(match.group().replace(',', ''))
+    return int(round(value * factor))
+
+
 # Create your models here.
 class Listening(models.Model):
     STATUS_CHOICES = (
@@ -9,20 +56,27 @@ class Listening(models.Model):
         ('sale', 'Sale'),
     )
     agent = models.ForeignKey(Agent,on_delete=models.DO_NOTHING)
+    external_id = models.CharField(max_length=100, null=True, blank=True, unique=True, help_text="Listing id in the agency's own system, used by bulk imports")
     title = models.CharField(max_length=200,db_index=True)
     slug = models.SlugField(max_length=200,unique=True,db_index=True)
     image = models.ImageField(upload_to='listings/%Y/%m/%d',blank=True)
     image2 = models.ImageField(upload_to='listings/%Y/%m/%d',blank=True)
     image3 = models.ImageField(upload_to='listings/%Y/%m/%d',blank=True)
+    renditions = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of the photos, see shelter.images")
     description = models.TextField(blank=True)
     location = models.CharField(null=False,max_length=200)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     bedrooms = models.IntegerField()
     bathrooms = models.IntegerField()
     area = models.CharField(max_length=200)
+    area_sqft = models.PositiveIntegerField(null=True, blank=True, editable=False, help_text="Parsed from area")
+    latitude = models.FloatField(null=True, blank=True)
+    longitude = models.FloatField(null=True, blank=True)
+    geohash = models.CharField(max_length=12, blank=True, editable=False, help_text="Computed from latitude and longitude")
     kitchen = models.IntegerField()
     garage = models.IntegerField()
     created = models.DateTimeField(default=timezone.now)
+    updated = models.DateTimeField(auto_now=True)
     available = models.BooleanField(default=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='rent')
     
@@ -33,19 +87,70 @@ class Listening(models.Model):
         choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High')],
         default='medium'
     )
+    rank_score = models.FloatField(default=0, editable=False, help_text="Recency plus featured and priority boosts")
     
     class Meta:
         ordering = ('-created',)
         indexes = [
             models.Index(fields=['id', 'slug']),
+            # Keyset pagination walks listings newest first
+            models.Index(fields=['-created', '-id']),
+            # Shaped to the search form predicates, equality columns first
+            models.Index(fields=['available', 'status', 'location', 'price']),
+            models.Index(fields=['available', 'location', 'price']),
+            models.Index(fields=['available', 'price']),
+            models.Index(fields=['available', 'area_sqft']),
+            models.Index(fields=['available', 'bedrooms']),
+            # Map searches scan geohash prefix ranges
+            models.Index(fields=['available', 'geohash']),
+            # Default listing order, best ranked first
+            models.Index(fields=['available', '-rank_score', '-id']),
         ]
     
+    def set_derived_fields(self, rank_weights=None):
+        """Fill the columns computed from others, also used by bulk imports"""
+        self.location = normalize_location(self.location)
+        self.area_sqft = parse_area_sqft(self.area)
+        self.rank_score = listing_rank_score(self.created, self.is_featured, self.marketing_priority, rank_weights)
+        if self.latitude is not None and self.longitude is not None:
+            self.geohash = geo.encode(self.latitude, self.longitude)
+        else:
+            self.geohash = ''
+
+    def save(self, *args, **kwargs):
+        self.set_derived_fields()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.title
 
     def get_absolute_url(self):
         return reverse('listing_detail',args=[str(self.slug)])
 
+class SimilarListing(models.Model):
+    """Precomputed nearest neighbours of a listing, see shelter/similar.py"""
+    listing = models.ForeignKey(Listening, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Listening, on_delete=models.CASCADE, related_name='similar_to')
+    rank = models.PositiveSmallIntegerField()
+    distance = models.FloatField()
+
+    class Meta:
+        ordering = ('listing', 'rank')
+        constraints = [
+            models.UniqueConstraint(fields=['listing', 'rank'], name='shelter_similarlisting_listing_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.listing_id} -> {self.similar_id} (#{self.rank})"
+
+class PendingSimilarListing(models.Model):
+    """Listing saved since its similar homes were computed, see shelter/similar.py"""
+    listing = models.OneToOneField(Listening, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    queued_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.listing_id} queued {self.queued_at:%Y-%m-%d %H:%M}"
+
 class Contact(models.Model):
     """Model to store contact form submissions"""
     name = models.CharField(max_length=100)
@@ -88,3 +193,110 @@ class Newsletter(models.Model):
         ordering = ['-date_subscribed']
 
 
+class LeadTouch(models.Model):
+    """One form submission or signup, filed under the person's email and phone
+
+    A row per Contact, Quickcontact, AgentContact, AgentPropertyContact and
+    Newsletter row, kept by shelter/leads.py, so every touch from one person
+    is a single indexed lookup instead of a scan of five tables.
+    """
+    KIND_CHOICES = (
+        ('contact', 'Contact form'),
+        ('quickcontact', 'Quick contact'),
+        ('agentcontact', 'Agent contact'),
+        ('agentpropertycontact', 'Property enquiry'),
+        ('newsletter', 'Newsletter signup'),
+    )
+    # Most emails and phones person_touches() gathers for one person
+    PERSON_MAX_KEYS = 200
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    # Normalized by leads.normalize_email() and leads.normalize_phone(), blank if not given
+    email = models.CharField(max_length=254, blank=True)
+    phone = models.CharField(max_length=20, blank=True)
+    name = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['email', '-created_at']),
+            models.Index(fields=['phone', '-created_at']),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='shelter_leadtouch_kind_object'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} from {self.name or self.email or self.phone}"
+
+    def person_touches(self):
+        """Every touch linked to this one by shared emails or phones, newest first
+
+        Links are followed transitively: a touch with this phone brings in its
+        email, whose other touches bring in their phones, and so on. Each round
+        is one indexed lookup of the addresses and numbers found last round.
+        Past PERSON_MAX_KEYS of them (say, an office switchboard number) no
+        further rounds are made.
+        """
+        emails = {self.email} - {''}
+        phones = {self.phone} - {''}
+        new_emails, new_phones = set(emails), set(phones)
+        while (new_emails or new_phones) and len(emails) + len(phones) < self.PERSON_MAX_KEYS:
+            found = LeadTouch.objects.filter(
+                Q(email__in=new_emails) | Q(phone__in=new_phones)
+            ).values_list('email', 'phone').distinct()
+            new_emails, new_phones = set(), set()
+            for email, phone in found:
+                if email and email not in emails:
+                    new_emails.add(email)
+                if phone and phone not in phones:
+                    new_phones.add(phone)
+            emails |= new_emails
+            phones |= new_phones
+        return LeadTouch.objects.filter(Q(pk=self.pk) | Q(email__in=emails) | Q(phone__in=phones))
+
+
+# Keep the full-text search index and cached search results in sync with listing changes
+@receiver(post_save, sender=Listening)
+def listing_post_save(sender, instance, using, **kwargs):
+    search.index_listing(instance, using=using)
+    bump_listing_version()
+
+
+@receiver(post_delete, sender=Listening)
+def listing_post_delete(sender, instance, using, **kwargs):
+    search.remove_listing(instance.pk, using=using)
+    bump_listing_version()
+
+
+@receiver(post_save, sender=Agent)
+@receiver(post_delete, sender=Agent)
+def agent_changed(sender, **kwargs):
+    bump_agent_version()
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def team_changed(sender, **kwargs):
+    bump_team_version()
+
+
+# Leads written one at a time (admin, shell); the lead outbox files its bulk inserts itself
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=Quickcontact)
+@receiver(post_save, sender=Newsletter)
+@receiver(post_save, sender=AgentContact)
+@receiver(post_save, sender=AgentPropertyContact)
+def lead_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        leads.record_touches(leads.lead_kind(sender), [instance])
+
+
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Quickcontact)
+@receiver(post_delete, sender=Newsletter)
+@receiver(post_delete, sender=AgentContact)
+@receiver(post_delete, sender=AgentPropertyContact)
+def lead_deleted(sender, instance, **kwargs):
+    LeadTouch.objects.filter(kind=leads.lead_kind(sender), object_id=instance.pk).delete()
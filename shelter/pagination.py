@@ -0,0 +1,138 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from decimal import Decimal
+from django.core.cache import cache
+from django.db.models import Q
+
+from .cache import search_cache_key, search_cache_timeout
+from .fuzzy import results_cacheable
+from .models import Listening
+
+# Keyset pagination for listing pages. Pages are addressed by an opaque cursor
+# holding the sort key of the last row shown, so every page is a single
+# indexed range scan with no OFFSET and no COUNT(*).
+PAGE_SIZE = 6
+MAX_PAGE_SIZE = 48
+# Sort keys compared as numbers, a cursor holding anything else is rejected
+FLOAT_KEYS = ('rank_score', 'relevance', 'distance_km')
+
+
+def sort_keys(queryset):
+    """Ordering the queryset is paged on, e.g. ['-created', '-id']
+
+    Taken from the queryset's own order_by() (or the model default) with the
+    primary key appended as a tie breaker so every row has a unique position.
+    """
+    ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+    fields = [key.lstrip('-') for key in ordering]
+    if 'id' not in fields and 'pk' not in fields:
+        descending = ordering[0].startswith('-') if ordering else True
+        ordering.append('-id' if descending else 'id')
+    return ordering
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _decode_value(field, value):
+    if field == 'created':
+        return datetime.fromisoformat(value)
+    if field == 'price':
+        return Decimal(value)
+    if field in FLOAT_KEYS:
+        return float(value)
+    return value
+
+
+def encode_cursor(listing, keys):
+    values = [_encode_value(getattr(listing, key.lstrip('-'))) for key in keys]
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, keys):
+    """Sort key values from a cursor, or None if it is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(values, list) or len(values) != len(keys):
+        return None
+    try:
+        return [_decode_value(key.lstrip('-'), value) for key, value in zip(keys, values)]
+    except (TypeError, ValueError, ArithmeticError):
+        return None
+
+
+def _after(keys, values):
+    """Rows strictly after the cursor position in the given ordering"""
+    condition = Q()
+    for i, key in enumerate(keys):
+        field = key.lstrip('-')
+        lookup = 'lt' if key.startswith('-') else 'gt'
+        branch = Q(**{f'{field}__{lookup}': values[i]})
+        for prev_key, prev_value in zip(keys[:i], values[:i]):
+            branch &= Q(**{prev_key.lstrip('-'): prev_value})
+        condition |= branch
+    return condition
+
+
+def get_page_size(value, default=PAGE_SIZE):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def paginate(queryset, cursor=None, page_size=PAGE_SIZE):
+    """Return one page of listings and the cursor for the next page
+
+    The next cursor is None once the last page has been reached.
+    """
+    keys = sort_keys(queryset)
+    queryset = queryset.order_by(*keys)
+    values = decode_cursor(cursor, keys)
+    if values is not None:
+        queryset = queryset.filter(_after(keys, values))
+
+    # Fetch one extra row to learn whether there is a next page
+    rows = list(queryset[:page_size + 1])
+    items = rows[:page_size]
+    next_cursor = encode_cursor(items[-1], keys) if len(rows) > page_size else None
+    return items, next_cursor
+
+
+def next_page_query(params, next_cursor):
+    """Querystring for the next page, keeping the current filters"""
+    if next_cursor is None:
+        return None
+    query = params.copy()
+    query['cursor'] = next_cursor
+    return query.urlencode()
+
+
+def cached_page(queryset, params, page_size=PAGE_SIZE):
+    """paginate() for search results, served from the ordered id list when cached"""
+    key = search_cache_key(f'page{page_size}', params)
+    hit = cache.get(key)
+    if hit is not None:
+        ids, next_cursor = hit
+        # Not queryset.model, a lazy_filters() queryset would filter for nothing
+        found = Listening.objects.in_bulk(ids)
+        return [found[pk] for pk in ids if pk in found], next_cursor
+
+    items, next_cursor = paginate(queryset, params.get('cursor'), page_size)
+    if results_cacheable(params):
+        cache.set(key, ([item.pk for item in items], next_cursor), search_cache_timeout())
+    return items, next_cursor
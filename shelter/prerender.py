@@ -0,0 +1,183 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.template import engines
+from django.test import Client
+from django.urls import reverse
+from django.utils.http import parse_etags, quote_etag
+
+from .http import accepts_gzip
+
+# Pages that only render a template. They are written to disk as plain and
+# gzipped HTML and served by PrerenderedPageMiddleware without touching the
+# session, auth or template machinery. The files are rewritten whenever a
+# template (or the static files manifest they link to) changes.
+PRERENDERED_PAGES = (
+    'services',
+    'terms',
+    'privacy',
+    'cookies',
+    'sale_view',
+    'buy_view',
+    'rent_view',
+    'property_management_view',
+)
+MANIFEST = 'manifest.json'
+# Set in the WSGI environ of the requests that render the pages, which no
+# client can send
+PRERENDER_ENVIRON_KEY = 'shelter.prerender'
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_state = {'manifest': None, 'checked': 0.0, 'paths': None}
+
+
+def get_root():
+    return getattr(settings, 'PRERENDER_ROOT', os.path.join(settings.BASE_DIR, 'prerendered'))
+
+
+def get_check_seconds():
+    # Edits show up on the next request while developing
+    return getattr(settings, 'PRERENDER_CHECK_SECONDS', 0 if settings.DEBUG else 60)
+
+
+def template_fingerprint():
+    """Hash of every template file's size and mtime, the static manifest and the year"""
+    digest = hashlib.md5(str(date.today().year).encode())  # the footer shows the year
+    paths = []
+    for engine in engines.all():
+        for directory in engine.template_dirs:
+            for root, _, files in os.walk(directory):
+                paths.extend(os.path.join(root, name) for name in files)
+    # Pages link to hashed static file names, which change on collectstatic
+    paths.append(os.path.join(settings.STATIC_ROOT, 'staticfiles.json'))
+    for path in sorted(paths):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()
+
+
+def render_page(path):
+    """HTML of a page as an anonymous visitor would get it
+
+    The request goes through the whole middleware stack, as a real one
+    would, flagged so PrerenderedPageMiddleware passes it on to the view.
+    """
+    site = urlsplit(getattr(settings, 'SITE_URL', 'http://localhost'))
+    client = Client(HTTP_HOST=site.netloc, **{PRERENDER_ENVIRON_KEY: True})
+    response = client.get(path, secure=site.scheme == 'https')
+    if response.status_code != 200:
+        raise ValueError(f'{path} answered {response.status_code}, it cannot be prerendered')
+    if response.cookies:
+        raise ValueError(f'{path} sets cookies, it cannot be prerendered')
+    return response.content
+
+
+def _write(path, content):
+    # Written aside and renamed, so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as handle:
+        handle.write(content)
+    os.replace(temporary, path)
+
+
+def _page_dir(root, path):
+    return os.path.join(root, path.strip('/'))
+
+
+def prerender_pages():
+    """Render every page in PRERENDERED_PAGES to disk, returns the manifest"""
+    root = get_root()
+    fingerprint = template_fingerprint()
+    pages = {}
+    for name in PRERENDERED_PAGES:
+        path = reverse(name)
+        content = render_page(path)
+        directory = _page_dir(root, path)
+        _write(os.path.join(directory, 'index.html'), content)
+        _write(os.path.join(directory, 'index.html.gz'), gzip.compress(content, 9, mtime=0))
+        pages[path] = hashlib.md5(content).hexdigest()
+    manifest = {'fingerprint': fingerprint, 'pages': pages}
+    _write(os.path.join(root, MANIFEST), json.dumps(manifest).encode())
+    _state.update(manifest=manifest, checked=time.monotonic())
+    return manifest
+
+
+def _read_manifest():
+    try:
+        with open(os.path.join(get_root(), MANIFEST), 'rb') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return None
+
+
+def current_manifest():
+    """The manifest of the files on disk, re-rendering them first if templates changed
+
+    None if they cannot be rendered, the views then answer as usual.
+    """
+    if time.monotonic() - _state['checked'] < get_check_seconds():
+        return _state['manifest']
+    with _lock:
+        if time.monotonic() - _state['checked'] < get_check_seconds():
+            return _state['manifest']
+        manifest = _read_manifest()
+        if manifest is None or manifest['fingerprint'] != template_fingerprint():
+            # Another worker may have done it already, rendering twice is harmless
+            try:
+                return prerender_pages()
+            except Exception:
+                logger.exception('Could not prerender static pages')
+                manifest = None
+        _state.update(manifest=manifest, checked=time.monotonic())
+        return manifest
+
+
+def prerendered_paths():
+    if _state['paths'] is None:
+        _state['paths'] = frozenset(reverse(name) for name in PRERENDERED_PAGES)
+    return _state['paths']
+
+
+def serve_page(request):
+    """Response for a prerendered page, or None if the path is not one"""
+    if request.path_info not in prerendered_paths():
+        return None
+    manifest = current_manifest()
+    etag = manifest and manifest['pages'].get(request.path_info)
+    if etag is None:
+        return None
+    etag = quote_etag(etag)
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        filename = os.path.join(_page_dir(get_root(), request.path_info), 'index.html')
+        gzipped = accepts_gzip(request)
+        if gzipped:
+            filename += '.gz'
+        try:
+            with open(filename, 'rb') as handle:
+                response = HttpResponse(handle.read())
+        except OSError:
+            return None
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = len(response.content)
+    response['ETag'] = etag
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = f"public, max-age={getattr(settings, 'PRERENDER_CACHE_SECONDS', 86400)}"
+    response['X-Frame-Options'] = getattr(settings, 'X_FRAME_OPTIONS', 'DENY')
+    return response
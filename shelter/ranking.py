@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.db.models import ExpressionWrapper, F, FloatField, Value
+
+# Listing rank, stored in Listening.rank_score. The score is the creation time
+# in days plus boosts counted in days, so a featured listing sorts as if it
+# were posted that many days later. Nothing in it depends on the current
+# time, which keeps the column valid forever and lets list pages walk an index.
+SECONDS_PER_DAY = 86400
+DEFAULT_RANK_WEIGHTS = {
+    # Days added for is_featured
+    'featured': 30,
+    # Days added per marketing_priority
+    'priority': {'low': 0, 'medium': 7, 'high': 14},
+    # Days added for a perfect text match, scaled by the 0-1 text relevance
+    'text': 60,
+}
+
+
+def get_rank_weights():
+    weights = dict(DEFAULT_RANK_WEIGHTS)
+    weights.update(getattr(settings, 'LISTING_RANK_WEIGHTS', {}))
+    return weights
+
+
+def listing_rank_score(created, is_featured, marketing_priority, weights=None):
+    weights = weights or get_rank_weights()
+    score = created.timestamp() / SECONDS_PER_DAY
+    if is_featured:
+        score += weights['featured']
+    return score + weights['priority'].get(marketing_priority, 0)
+
+
+def by_relevance(queryset, text_rank=None):
+    """Order listings best first, blending in a 0-1 text relevance annotation if given"""
+    if text_rank is None:
+        return queryset.order_by('-rank_score')
+    weight = Value(float(get_rank_weights()['text']), output_field=FloatField())
+    return queryset.annotate(
+        relevance=ExpressionWrapper(F('rank_score') + weight * F(text_rank), output_field=FloatField())
+    ).order_by('-relevance')
+
+
+def refresh_rank_scores(queryset, batch_size=1000):
+    """Recompute rank_score for listings changed without save(), e.g. by update()"""
+    weights = get_rank_weights()
+    batch = []
+    updated = 0
+    listings = queryset.only('id', 'created', 'is_featured', 'marketing_priority', 'rank_score')
+    for listing in listings.iterator(chunk_size=batch_size):
+        score = listing_rank_score(listing.created, listing.is_featured, listing.marketing_priority, weights)
+        if score != listing.rank_score:
+            listing.rank_score = score
+            batch.append(listing)
+        if len(batch) >= batch_size:
+            queryset.model.objects.bulk_update(batch, ['rank_score'])
+            updated += len(batch)
+            batch = []
+    if batch:
+        queryset.model.objects.bulk_update(batch, ['rank_score'])
+        updated += len(batch)
+    return updated
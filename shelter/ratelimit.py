@@ -0,0 +1,87 @@
+import math
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.urls import NoReverseMatch, reverse
+
+# Per client IP throttling of the public endpoints in RATE_LIMITS, checked by
+# shelter.middleware.RateLimitMiddleware before sessions, auth or the view
+# touch the database.
+#
+# Each (endpoint, IP) pair has a token bucket holding `requests` tokens that
+# refills over `seconds`. It is stored as the single moment the bucket will
+# be full again (GCRA), so a check is one cache read and one write. The
+# read and write are not atomic: under contention a few extra requests may
+# get through, which is fine for keeping bots out.
+
+# Clients rejected recently, {key: moment they may retry}, so repeat
+# offenders are turned away by this process without asking the cache
+_blocked = {}
+MAX_BLOCKED = 10000
+
+_rules = None
+
+
+def get_cache():
+    return caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+
+
+def get_rules():
+    """{path: (url name, rule)} for the RATE_LIMITS endpoints, built once"""
+    global _rules
+    if _rules is None:
+        rules = {}
+        for name, rule in getattr(settings, 'RATE_LIMITS', {}).items():
+            try:
+                rules[reverse(name)] = (name, rule)
+            except NoReverseMatch:
+                # Only URLs without arguments can be limited
+                continue
+        _rules = rules
+    return _rules
+
+
+def client_ip(request):
+    """REMOTE_ADDR, or the address RATE_LIMIT_PROXY_COUNT proxies in front saw"""
+    proxies = getattr(settings, 'RATE_LIMIT_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def take(key, requests, seconds, now=None):
+    """Spend a token from key's bucket; 0 if allowed, else seconds until one is free"""
+    now = time.time() if now is None else now
+    blocked_until = _blocked.get(key)
+    if blocked_until is not None:
+        if blocked_until > now:
+            return blocked_until - now
+        # Another thread may have released the key first
+        _blocked.pop(key, None)
+
+    interval = seconds / requests
+    cache = get_cache()
+    # When the bucket would be full again, counting this request
+    full_at = max(cache.get(key) or now, now) + interval
+    wait = full_at - now - seconds
+    if wait > 0:
+        if len(_blocked) >= MAX_BLOCKED:
+            _blocked.clear()
+        _blocked[key] = now + wait
+        return wait
+    cache.set(key, full_at, math.ceil(full_at - now))
+    return 0
+
+
+def check(request):
+    """(url name, seconds to wait) when request is over its limit, else None"""
+    match = get_rules().get(request.path_info)
+    if match is None:
+        return None
+    name, rule = match
+    if request.method not in rule.get('methods', ('GET', 'POST')):
+        return None
+    wait = take(f'ratelimit:{name}:{client_ip(request)}', rule['requests'], rule['seconds'])
+    return (name, wait) if wait else None
@@ -0,0 +1,353 @@
+import math
+import re
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.functional import SimpleLazyObject
+
+from . import geo
+from .locations_data import normalize_location
+from .ranking import by_relevance
+
+# Inverted index over Listening text fields. Postgres keeps a tsvector per
+# listing behind a GIN index, SQLite uses an FTS5 virtual table keyed on rowid.
+INDEX_TABLE = 'shelter_listing_fts'
+INDEX_FIELDS = ('title', 'description', 'location', 'area')
+
+# Relative weight of each field when ranking matches
+SQLITE_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+POSTGRES_WEIGHTS = ('A', 'D', 'B', 'C')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(str(text).lower())
+
+
+def get_connection(using=None):
+    return connections[using or DEFAULT_DB_ALIAS]
+
+
+def is_supported_vendor(vendor):
+    return vendor in ('sqlite', 'postgresql')
+
+
+def create_index_sql(vendor):
+    """DDL for the index table on the given database vendor"""
+    if vendor == 'postgresql':
+        return [
+            f'CREATE TABLE IF NOT EXISTS {INDEX_TABLE} ('
+            f'listing_id bigint PRIMARY KEY REFERENCES shelter_listening (id) ON DELETE CASCADE, '
+            f'document tsvector NOT NULL)',
+            f'CREATE INDEX IF NOT EXISTS {INDEX_TABLE}_document_gin ON {INDEX_TABLE} USING GIN (document)',
+        ]
+    if vendor == 'sqlite':
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5('
+            f'{", ".join(INDEX_FIELDS)}, tokenize="unicode61 remove_diacritics 2")',
+        ]
+    return []
+
+
+def drop_index_sql(vendor):
+    if not is_supported_vendor(vendor):
+        return []
+    return [f'DROP TABLE IF EXISTS {INDEX_TABLE}']
+
+
+def build_match_query(keyword, vendor):
+    """Turn free text into a prefix query for the backend, or None if empty"""
+    tokens = tokenize(keyword)
+    if not tokens:
+        return None
+    if vendor == 'postgresql':
+        return ' & '.join(f'{token}:*' for token in tokens)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _document_values(listing):
+    return [str(getattr(listing, field) or '') for field in INDEX_FIELDS]
+
+
+def _postgres_document_sql():
+    parts = [
+        f"setweight(to_tsvector('simple', %s), '{weight}')"
+        for weight in POSTGRES_WEIGHTS
+    ]
+    return ' || '.join(parts)
+
+
+def index_listings(listings, using=None):
+    """Insert or refresh index rows for the given listings"""
+    connection = get_connection(using)
+    vendor = connection.vendor
+    if not is_supported_vendor(vendor):
+        return 0
+
+    rows = [(listing.pk, *_document_values(listing)) for listing in listings]
+    if not rows:
+        return 0
+
+    with connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.executemany(
+                f'INSERT INTO {INDEX_TABLE} (listing_id, document) '
+                f'VALUES (%s, {_postgres_document_sql()}) '
+                f'ON CONFLICT (listing_id) DO UPDATE SET document = EXCLUDED.document',
+                rows
+            )
+        else:
+            cursor.executemany(
+                f'DELETE FROM {INDEX_TABLE} WHERE rowid = %s',
+                [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f'INSERT INTO {INDEX_TABLE} (rowid, {", ".join(INDEX_FIELDS)}) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                rows
+            )
+    return len(rows)
+
+
+def index_listing(listing, using=None):
+    return index_listings([listing], using=using)
+
+
+def remove_listing(listing_id, using=None):
+    connection = get_connection(using)
+    vendor = connection.vendor
+    if not is_supported_vendor(vendor):
+        return
+    key = 'listing_id' if vendor == 'postgresql' else 'rowid'
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE} WHERE {key} = %s', [listing_id])
+
+
+def clear_index(using=None):
+    connection = get_connection(using)
+    if not is_supported_vendor(connection.vendor):
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {INDEX_TABLE}')
+
+
+def rebuild_index(using=None, batch_size=1000):
+    """Rebuild the whole index from the Listening table"""
+    from .models import Listening
+
+    clear_index(using)
+    queryset = Listening.objects.using(using or DEFAULT_DB_ALIAS).only('id', *INDEX_FIELDS)
+    batch = []
+    total = 0
+    for listing in queryset.iterator(chunk_size=batch_size):
+        batch.append(listing)
+        if len(batch) >= batch_size:
+            total += index_listings(batch, using=using)
+            batch = []
+    total += index_listings(batch, using=using)
+    return total
+
+
+def search_listings(queryset, keyword):
+    """Filter a Listening queryset by keyword, ordered by relevance
+
+    The result is annotated with ``search_rank`` between 0 and 1 (higher is
+    better), blended with the listing rank by by_relevance(). Databases
+    without a full-text backend fall back to a plain substring match.
+    """
+    connection = get_connection(queryset.db)
+    vendor = connection.vendor
+    match = build_match_query(keyword, vendor)
+    if match is None:
+        return queryset
+
+    if vendor == 'postgresql':
+        return by_relevance(queryset.extra(
+            tables=[INDEX_TABLE],
+            where=[
+                f'{INDEX_TABLE}.listing_id = shelter_listening.id',
+                f"{INDEX_TABLE}.document @@ to_tsquery('simple', %s)",
+            ],
+            params=[match],
+        ).annotate(
+            # Normalization 32 scales the rank to rank / (rank + 1)
+            search_rank=RawSQL(f"ts_rank_cd({INDEX_TABLE}.document, to_tsquery('simple', %s), 32)", [match])
+        ), 'search_rank')
+
+    if vendor == 'sqlite':
+        weights = ', '.join(str(weight) for weight in SQLITE_WEIGHTS)
+        bm25 = f'bm25({INDEX_TABLE}, {weights})'
+        return by_relevance(queryset.extra(
+            tables=[INDEX_TABLE],
+            where=[
+                f'{INDEX_TABLE}.rowid = shelter_listening.id',
+                f'{INDEX_TABLE} MATCH %s',
+            ],
+            params=[match],
+        ).annotate(
+            # bm25() is negative and lower-is-better, map it to rank / (rank + 1)
+            # like Postgres so both backends blend with the listing rank alike
+            search_rank=RawSQL(f'-{bm25} / (1 - {bm25})', [])
+        ), 'search_rank')
+
+    condition = Q()
+    for field in INDEX_FIELDS:
+        condition |= Q(**{f'{field}__icontains': keyword})
+    return by_relevance(queryset.filter(condition))
+
+
+def parse_int(value):
+    """Parse a numeric query parameter, ignoring blanks and garbage"""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_float(value):
+    try:
+        number = float(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+    # Rejects nan and inf, which would poison every comparison
+    return number if math.isfinite(number) else None
+
+
+# Values accepted by the ?sort= parameter
+SORT_ORDERINGS = {
+    'newest': ('-created',),
+    'price': ('price',),
+    '-price': ('-price',),
+    'area': ('area_sqft',),
+    '-area': ('-area_sqft',),
+    'bedrooms': ('bedrooms',),
+    '-bedrooms': ('-bedrooms',),
+    # Only available with a radius search, which annotates distance_km
+    'distance': ('distance_km',),
+}
+
+
+SORT_CHOICES = (
+    ('newest', 'Newest'),
+    ('price', 'Price: Low to High'),
+    ('-price', 'Price: High to Low'),
+    ('area', 'Area: Small to Large'),
+    ('-area', 'Area: Large to Small'),
+    ('bedrooms', 'Bedrooms: Fewest'),
+    ('-bedrooms', 'Bedrooms: Most'),
+)
+
+
+def _apply_range(queryset, params, field, min_param, max_param):
+    low = parse_int(params.get(min_param))
+    if low is not None:
+        queryset = queryset.filter(**{f'{field}__gte': low})
+    high = parse_int(params.get(max_param))
+    if high is not None:
+        queryset = queryset.filter(**{f'{field}__lte': high})
+    return queryset
+
+
+def apply_sort(queryset, params):
+    """Order by the requested ?sort=, by relevance otherwise"""
+    ordering = SORT_ORDERINGS.get(params.get('sort'))
+    if ordering is None:
+        # A keyword search has already ordered by its blended relevance
+        return queryset if queryset.query.order_by else by_relevance(queryset)
+    if ordering[0] == 'distance_km' and 'distance_km' not in queryset.query.annotations:
+        return queryset
+    if ordering[0].lstrip('-') == 'area_sqft':
+        # Listings whose area could not be parsed have no place in an area sort
+        queryset = queryset.filter(area_sqft__isnull=False)
+    return queryset.order_by(*ordering)
+
+
+def _valid_latitude(value):
+    return value is not None and -90 <= value <= 90
+
+
+def _valid_longitude(value):
+    return value is not None and -180 <= value <= 180
+
+
+def apply_geo_filter(queryset, params):
+    """Radius (?lat=&lng=&radius_km=) or map box (?north=&south=&east=&west=) search
+
+    Listings without coordinates never match a map search.
+    """
+    latitude = parse_float(params.get('lat'))
+    longitude = parse_float(params.get('lng'))
+    radius_km = parse_float(params.get('radius_km'))
+    if _valid_latitude(latitude) and _valid_longitude(longitude) and radius_km and radius_km > 0:
+        return geo.within_radius(queryset, latitude, longitude, radius_km)
+
+    north = parse_float(params.get('north'))
+    south = parse_float(params.get('south'))
+    east = parse_float(params.get('east'))
+    west = parse_float(params.get('west'))
+    if (_valid_latitude(north) and _valid_latitude(south) and south <= north
+            and _valid_longitude(east) and _valid_longitude(west) and west <= east):
+        return geo.within_box(queryset, south, west, north, east)
+    return queryset
+
+
+def apply_filters(queryset, params):
+    """Apply the search form parameters to a Listening queryset"""
+    #location
+    location = params.get('location')
+    if location:
+        queryset = queryset.filter(location=normalize_location(location))
+    #agent
+    agent = parse_int(params.get('agent'))
+    if agent:
+        queryset = queryset.filter(agent_id=agent)
+    #status
+    status = params.get('status')
+    if status:
+        queryset = queryset.filter(status=status.strip().lower())
+    #bedrooms
+    bedrooms = parse_int(params.get('bedrooms'))
+    if bedrooms is not None:
+        queryset = queryset.filter(bedrooms__lte=bedrooms)
+    queryset = _apply_range(queryset, params, 'bedrooms', 'min_bedrooms', 'max_bedrooms')
+    #bathrooms
+    bathrooms = parse_int(params.get('bathrooms'))
+    if bathrooms is not None:
+        queryset = queryset.filter(bathrooms__lte=bathrooms)
+    #area
+    queryset = _apply_range(queryset, params, 'area_sqft', 'min_area', 'max_area')
+    #price
+    price = parse_int(params.get('price'))
+    if price:
+        queryset = queryset.filter(price__lte=price)
+    min_price = parse_int(params.get('min_price'))
+    if min_price:
+        queryset = queryset.filter(price__gte=min_price)
+    # upper bound is exclusive so adjacent price bands never overlap
+    max_price = parse_int(params.get('max_price'))
+    if max_price:
+        queryset = queryset.filter(price__lt=max_price)
+    #map
+    queryset = apply_geo_filter(queryset, params)
+    # keyword, last: fuzzy matching picks its best matches among what the
+    # other filters let through
+    keyword = params.get('keyword')
+    if keyword and params.get('match') == 'fuzzy':
+        from .fuzzy import fuzzy_search
+        queryset = fuzzy_search(queryset, keyword)
+    elif keyword:
+        queryset = search_listings(queryset, keyword)
+    return apply_sort(queryset, params)
+
+
+def lazy_filters(queryset, params):
+    """apply_filters() put off until the result is first used
+
+    Fuzzy matching scores the keyword while filtering, so searches answered
+    by cached_page() and cached_facets() should not filter up front.
+    """
+    return SimpleLazyObject(lambda: apply_filters(queryset, params))
@@ -0,0 +1,78 @@
+from rest_framework import serializers
+
+from .models import Listening
+
+
+class SparseFieldsetMixin:
+    """Keep only the fields named in ?fields=a,b,c (all of them without it)
+
+    Meta.source_fields maps a serializer field to the model fields it reads,
+    so views can hand the same selection to QuerySet.only().
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        requested = self.requested_fields(self.context.get('request'))
+        if requested is not None:
+            for name in set(self.fields) - requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def requested_fields(cls, request):
+        value = request.query_params.get('fields') if request is not None else None
+        if not value:
+            return None
+        names = {name.strip() for name in value.split(',')} & set(cls.Meta.fields)
+        return names or None
+
+    @classmethod
+    def model_fields(cls, request):
+        """Model field names to load for the requested serializer fields"""
+        names = cls.requested_fields(request) or cls.Meta.fields
+        sources = getattr(cls.Meta, 'source_fields', {})
+        fields = set()
+        for name in names:
+            fields.update(sources.get(name, (name,)))
+        return fields
+
+
+class ListingAgentSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    name = serializers.CharField()
+    phone = serializers.CharField()
+    email = serializers.CharField()
+    photo = serializers.ImageField(use_url=True)
+
+
+class ListingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(view_name='property_detail', lookup_field='slug')
+    images = serializers.SerializerMethodField()
+    agent = ListingAgentSerializer()
+    distance_km = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Listening
+        fields = (
+            'id', 'slug', 'url', 'title', 'description', 'status', 'location', 'price',
+            'bedrooms', 'bathrooms', 'kitchen', 'garage', 'area', 'area_sqft',
+            'latitude', 'longitude', 'is_featured', 'created', 'updated', 'images',
+            'agent', 'distance_km',
+        )
+        source_fields = {
+            'url': ('slug',),
+            'images': ('image', 'image2', 'image3'),
+            'agent': ('agent__id', 'agent__name', 'agent__phone', 'agent__email', 'agent__photo'),
+            # Annotated by a radius search, not a column
+            'distance_km': (),
+        }
+
+    def get_images(self, listing):
+        request = self.context.get('request')
+        return [
+            request.build_absolute_uri(image.url) if request else image.url
+            for image in (listing.image, listing.image2, listing.image3) if image
+        ]
+
+    def get_distance_km(self, listing):
+        distance = getattr(listing, 'distance_km', None)
+        return round(distance, 3) if distance is not None else None
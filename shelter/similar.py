@@ -0,0 +1,239 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Listening, PendingSimilarListing, SimilarListing
+
+# "Similar homes" for the property detail sidebar. Every available listing is
+# turned into a weighted feature vector, neighbours are found by euclidean
+# distance in vectorised batches and stored in SimilarListing, so a detail
+# page only reads its precomputed rows. A saved listing is queued in
+# PendingSimilarListing and recomputed by `manage.py build_similar_listings
+# --pending`, which should run every few minutes.
+NEIGHBOURS = 6
+BATCH_SIZE = 1024
+COLUMN_BLOCK = 8192
+FEATURE_FIELDS = ('id', 'price', 'bedrooms', 'bathrooms', 'area_sqft', 'location', 'status')
+
+# Relative importance of each feature, numeric features are standardised first
+DEFAULT_FEATURE_WEIGHTS = {
+    'price': 2.0,
+    'bedrooms': 1.0,
+    'bathrooms': 0.5,
+    'area': 1.0,
+    'location': 1.5,
+    'status': 3.0,
+}
+
+
+def get_feature_weights():
+    weights = dict(DEFAULT_FEATURE_WEIGHTS)
+    weights.update(getattr(settings, 'SIMILAR_LISTING_WEIGHTS', {}))
+    return weights
+
+
+def _standardise(column):
+    """Z-scores, missing values take the column mean"""
+    mean = np.nanmean(column) if np.isfinite(column).any() else 0.0
+    column = np.where(np.isfinite(column), column, mean)
+    std = column.std()
+    return (column - mean) / std if std > 0 else np.zeros_like(column)
+
+
+def _one_hot(values):
+    labels, codes = np.unique(np.array(values, dtype=object).astype(str), return_inverse=True)
+    matrix = np.zeros((len(values), len(labels)))
+    matrix[np.arange(len(values)), codes] = 1.0
+    return matrix
+
+
+def feature_matrix(rows):
+    """(ids, vectors) for rows of FEATURE_FIELDS values"""
+    weights = get_feature_weights()
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    price = np.array([float(row[1]) for row in rows])
+    bedrooms = np.array([row[2] for row in rows], dtype=float)
+    bathrooms = np.array([row[3] for row in rows], dtype=float)
+    area = np.array([row[4] if row[4] else np.nan for row in rows], dtype=float)
+
+    # Prices and areas spread over orders of magnitude, compare them on a log scale
+    columns = [
+        weights['price'] * _standardise(np.log1p(np.maximum(price, 0)))[:, None],
+        weights['bedrooms'] * _standardise(bedrooms)[:, None],
+        weights['bathrooms'] * _standardise(bathrooms)[:, None],
+        weights['area'] * _standardise(np.log1p(area))[:, None],
+        # One-hot columns are 0/1 apart; sqrt(1/2) makes a mismatch cost exactly the weight
+        weights['location'] * np.sqrt(0.5) * _one_hot([row[5] for row in rows]),
+        weights['status'] * np.sqrt(0.5) * _one_hot([row[6] for row in rows]),
+    ]
+    return ids, np.hstack(columns)
+
+
+def _squared_distances(targets, vectors):
+    # |a - b|^2 = |a|^2 + |b|^2 - 2 a.b for the whole block at once
+    return (
+        (targets ** 2).sum(axis=1)[:, None]
+        + (vectors ** 2).sum(axis=1)[None, :]
+        - 2 * targets @ vectors.T
+    )
+
+
+def nearest_neighbours(vectors, targets, exclude, count=NEIGHBOURS, block_size=COLUMN_BLOCK):
+    """Indexes and distances of the closest vectors to each target row
+
+    ``exclude`` holds, per target, the index of its own vector (or -1).
+    Vectors are compared block_size at a time, keeping the best so far, so
+    memory grows with the batch and the block rather than every listing.
+    """
+    if not len(targets) or len(vectors) < 2:
+        return np.zeros((len(targets), 0), dtype=int), np.zeros((len(targets), 0))
+    count = min(count, len(vectors) - 1)
+    rows = np.arange(len(targets))
+    nearest = np.zeros((len(targets), 0), dtype=int)
+    nearest_distances = np.zeros((len(targets), 0))
+    for start in range(0, len(vectors), block_size):
+        distances = _squared_distances(targets, vectors[start:start + block_size])
+        own = (exclude >= start) & (exclude < start + distances.shape[1])
+        distances[rows[own], exclude[own] - start] = np.inf
+        keep = min(count, distances.shape[1])
+        best = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+        nearest = np.hstack([nearest, best + start])
+        nearest_distances = np.hstack([nearest_distances, np.take_along_axis(distances, best, axis=1)])
+        if nearest.shape[1] > count:
+            best = np.argpartition(nearest_distances, count - 1, axis=1)[:, :count]
+            nearest = np.take_along_axis(nearest, best, axis=1)
+            nearest_distances = np.take_along_axis(nearest_distances, best, axis=1)
+    order = np.argsort(nearest_distances, axis=1)
+    nearest = np.take_along_axis(nearest, order, axis=1)
+    nearest_distances = np.sqrt(np.maximum(np.take_along_axis(nearest_distances, order, axis=1), 0))
+    return nearest, nearest_distances
+
+
+def _available_features():
+    rows = list(Listening.objects.filter(available=True).order_by('pk').values_list(*FEATURE_FIELDS))
+    return feature_matrix(rows) if rows else (np.zeros(0, dtype=np.int64), np.zeros((0, 0)))
+
+
+def _links(ids, listing_ids, nearest, distances):
+    return [
+        SimilarListing(listing_id=int(listing_id), similar_id=int(ids[index]), rank=rank, distance=float(distance))
+        for listing_id, indexes, row_distances in zip(listing_ids, nearest, distances)
+        for rank, (index, distance) in enumerate(zip(indexes, row_distances), start=1)
+    ]
+
+
+def rebuild_similar_listings(batch_size=BATCH_SIZE):
+    """Recompute the neighbours of every available listing, returns rows written"""
+    started = timezone.now()
+    ids, vectors = _available_features()
+    links = []
+    for start in range(0, len(ids), batch_size):
+        stop = min(start + batch_size, len(ids))
+        nearest, distances = nearest_neighbours(vectors, vectors[start:stop], np.arange(start, stop))
+        links.extend(_links(ids, ids[start:stop], nearest, distances))
+
+    with transaction.atomic():
+        SimilarListing.objects.all().delete()
+        SimilarListing.objects.bulk_create(links, batch_size=1000)
+        PendingSimilarListing.objects.filter(queued_at__lte=started).delete()
+    return len(links)
+
+
+def queue_similar_update(listing):
+    """Mark a changed listing for the next update_pending_similar_listings()
+
+    Only an unavailable listing is dealt with at once, by removing it from
+    every list; its neighbours need the whole feature matrix, which is not
+    read during a request.
+    """
+    if not listing.available:
+        with transaction.atomic():
+            SimilarListing.objects.filter(listing=listing.pk).delete()
+            SimilarListing.objects.filter(similar=listing.pk).delete()
+            PendingSimilarListing.objects.filter(listing=listing.pk).delete()
+        return
+    queue_similar_updates([listing.pk])
+
+
+def queue_similar_updates(pks):
+    """Queue listings by pk, e.g. ones written by bulk_create() without signals"""
+    now = timezone.now()
+    PendingSimilarListing.objects.bulk_create(
+        [PendingSimilarListing(listing_id=pk, queued_at=now) for pk in pks],
+        batch_size=1000,
+        update_conflicts=True,
+        unique_fields=['listing'],
+        update_fields=['queued_at'],
+    )
+
+
+def _displaced_by(ids, vectors, positions, batch_size=BATCH_SIZE):
+    """Indexes of listings that a changed listing (at positions) now beats
+
+    These are listings with fewer than a full list of neighbours, or whose
+    furthest stored neighbour is further away than a changed listing is.
+    """
+    full = min(NEIGHBOURS, len(ids) - 1)
+    furthest = np.full(len(ids), np.inf)
+    lists = SimilarListing.objects.values('listing').annotate(furthest=Max('distance'), size=Count('pk'))
+    index = {listing_id: i for i, listing_id in enumerate(ids.tolist())}
+    for row in lists:
+        if row['listing'] in index and row['size'] >= full:
+            furthest[index[row['listing']]] = row['furthest']
+
+    closest = np.full(len(ids), np.inf)
+    for start in range(0, len(ids), COLUMN_BLOCK):
+        block = vectors[start:start + COLUMN_BLOCK]
+        for batch in range(0, len(positions), batch_size):
+            distances = _squared_distances(block, vectors[positions[batch:batch + batch_size]])
+            closest[start:start + len(block)] = np.minimum(closest[start:start + len(block)], distances.min(axis=1))
+    return np.flatnonzero(np.sqrt(np.maximum(closest, 0)) < furthest)
+
+
+def update_pending_similar_listings(batch_size=BATCH_SIZE):
+    """Recompute the neighbours of the queued listings, returns (listings, rows written)
+
+    Lists that hold a queued listing, or that it now comes closer to than
+    their furthest neighbour, are recomputed too. Listings queued again while
+    this runs stay queued for the next run.
+    """
+    started = timezone.now()
+    pending = list(PendingSimilarListing.objects.filter(queued_at__lte=started).values_list('listing_id', flat=True))
+    if not pending:
+        return 0, 0
+    ids, vectors = _available_features()
+    changed = np.flatnonzero(np.isin(ids, pending))
+    listing_them = SimilarListing.objects.filter(similar__in=pending).values_list('listing_id', flat=True)
+    positions = np.union1d(
+        np.union1d(changed, np.flatnonzero(np.isin(ids, list(listing_them)))),
+        _displaced_by(ids, vectors, changed, batch_size),
+    )
+    links = []
+    for start in range(0, len(positions), batch_size):
+        batch = positions[start:start + batch_size]
+        nearest, distances = nearest_neighbours(vectors, vectors[batch], batch)
+        links.extend(_links(ids, ids[batch], nearest, distances))
+
+    with transaction.atomic():
+        SimilarListing.objects.filter(listing__in=pending).delete()
+        SimilarListing.objects.filter(listing__in=ids[positions].tolist()).delete()
+        SimilarListing.objects.bulk_create(links, batch_size=1000)
+        PendingSimilarListing.objects.filter(listing__in=pending, queued_at__lte=started).delete()
+    return len(pending), len(links)
+
+
+def similar_listings(listing, count=3):
+    """Precomputed neighbours of a listing that are still available, closest first"""
+    return Listening.objects.filter(
+        similar_to__listing=listing, available=True
+    ).order_by('similar_to__rank')[:count]
+
+
+@receiver(post_save, sender=Listening)
+def listing_saved(sender, instance, **kwargs):
+    # After commit, so a rolled back save leaves the neighbours untouched
+    transaction.on_commit(lambda: queue_similar_update(instance))
@@ -0,0 +1,143 @@
+import json
+import os
+from xml.sax.saxutils import escape
+from django.conf import settings
+from django.db.models import Count, F, Max, Q, Value
+from django.urls import reverse
+
+from .models import Listening
+
+# XML sitemap of every available listing. Listings are sharded by primary key
+# range, so a changed listing only ever dirties its own file; the sitemap
+# index and the shards are written to SITEMAP_ROOT by `manage.py
+# build_sitemaps` and served from there.
+SHARD_SIZE = 50000
+INDEX_FILE = 'sitemap.xml'
+STATE_FILE = 'state.json'
+CHUNK_SIZE = 2000
+XMLNS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
+
+
+def get_root():
+    return getattr(settings, 'SITEMAP_ROOT', os.path.join(settings.BASE_DIR, 'sitemaps'))
+
+
+def get_base_url():
+    return getattr(settings, 'SITE_URL', 'http://localhost:8000').rstrip('/')
+
+
+def shard_filename(number):
+    return f'listings-{number}.xml'
+
+
+def shard_signatures():
+    """{shard: (signature, lastmod)} from one grouped query over all listings
+
+    The signature covers unavailable and deleted listings too, so a listing
+    leaving the sitemap also rewrites its shard.
+    """
+    rows = Listening.objects.annotate(
+        shard=F('pk') / Value(SHARD_SIZE)
+    ).values('shard').annotate(
+        changed=Max('updated'),
+        total=Count('pk'),
+        live=Count('pk', filter=Q(available=True)),
+        lastmod=Max('updated', filter=Q(available=True)),
+    ).order_by('shard')
+    return {
+        row['shard']: (
+            f"{row['changed'].isoformat()}|{row['total']}|{row['live']}",
+            row['lastmod'].isoformat(timespec='seconds') if row['lastmod'] else None,
+        )
+        for row in rows
+    }
+
+
+def _replace(path, write):
+    # Crawlers never see a half written file
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as handle:
+        write(handle)
+    os.replace(temporary, path)
+
+
+def write_shard(number, path, base_url):
+    """Stream one shard's listings to disk, returns the number of URLs"""
+    listings = Listening.objects.filter(
+        available=True, pk__gte=number * SHARD_SIZE, pk__lt=(number + 1) * SHARD_SIZE,
+    ).order_by('pk').values_list('slug', 'updated')
+    # One reverse() for the whole shard, slugs are URL safe
+    detail_url = base_url + reverse('property_detail', args=['__slug__'])
+    count = 0
+
+    def write(handle):
+        nonlocal count
+        handle.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{XMLNS}">\n')
+        for slug, updated in listings.iterator(chunk_size=CHUNK_SIZE):
+            handle.write(
+                f'<url><loc>{escape(detail_url.replace("__slug__", slug))}</loc>'
+                f'<lastmod>{updated.isoformat(timespec="seconds")}</lastmod></url>\n'
+            )
+            count += 1
+        handle.write('</urlset>\n')
+
+    _replace(path, write)
+    return count
+
+
+def write_index(path, shards, base_url):
+    def write(handle):
+        handle.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="{XMLNS}">\n')
+        for number, lastmod in sorted(shards.items()):
+            loc = escape(base_url + reverse('sitemap_shard', args=[number]))
+            handle.write(f'<sitemap><loc>{loc}</loc><lastmod>{lastmod}</lastmod></sitemap>\n')
+        handle.write('</sitemapindex>\n')
+
+    _replace(path, write)
+
+
+def _read_state(root):
+    try:
+        with open(os.path.join(root, STATE_FILE), encoding='utf-8') as handle:
+            return json.load(handle)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_sitemaps(full=False, base_url=None):
+    """Rewrite the shards whose listings changed since the last run
+
+    Returns (shards rewritten, shards in the sitemap).
+    """
+    root = get_root()
+    base_url = (base_url or get_base_url()).rstrip('/')
+    os.makedirs(root, exist_ok=True)
+    state = {} if full else _read_state(root)
+    if state.get('base_url') != base_url:
+        state = {}
+    previous = state.get('shards', {})
+
+    shards = {}
+    rewritten = 0
+    for number, (signature, lastmod) in shard_signatures().items():
+        path = os.path.join(root, shard_filename(number))
+        if lastmod is None:
+            # Nothing left to list in this range
+            continue
+        if previous.get(str(number)) != signature or not os.path.exists(path):
+            write_shard(number, path, base_url)
+            rewritten += 1
+        shards[number] = (signature, lastmod)
+
+    for number in set(map(int, previous)) - set(shards):
+        try:
+            os.remove(os.path.join(root, shard_filename(number)))
+        except FileNotFoundError:
+            pass
+
+    index = os.path.join(root, INDEX_FILE)
+    if rewritten or set(map(int, previous)) != set(shards) or not os.path.exists(index):
+        write_index(index, {number: lastmod for number, (signature, lastmod) in shards.items()}, base_url)
+    state = {'base_url': base_url, 'shards': {str(number): signature for number, (signature, lastmod) in shards.items()}}
+    _replace(os.path.join(root, STATE_FILE), lambda handle: json.dump(state, handle))
+    return rewritten, len(shards)
@@ -0,0 +1,48 @@
+(function ($) {
+    "use strict";
+
+    // Typeahead for the keyword boxes. Suggestions link straight to the
+    // listing, agent or location search; Enter without a pick submits the form.
+    var url = $('body').data('autocomplete-url');
+    if (!url) {
+        return;
+    }
+
+    $('input[name="keyword"]').each(function () {
+        var $input = $(this).attr('autocomplete', 'off');
+        var $list = $('<ul class="autocomplete-suggestions"></ul>').hide();
+        var request = null;
+        var lastQuery = '';
+
+        $input.parent().css('position', 'relative').append($list);
+
+        $input.on('input', function () {
+            var query = $.trim($input.val());
+            if (query === lastQuery) {
+                return;
+            }
+            lastQuery = query;
+            if (request) {
+                request.abort();
+            }
+            if (!query) {
+                $list.empty().hide();
+                return;
+            }
+            request = $.getJSON(url, {q: query}).done(function (data) {
+                $list.empty();
+                $.each(data.suggestions, function (i, item) {
+                    var $link = $('<a></a>').attr('href', item.url).text(item.label);
+                    var $type = $('<span class="autocomplete-type"></span>').text(item.type);
+                    $('<li></li>').append($link.append($type)).appendTo($list);
+                });
+                $list.toggle(data.suggestions.length > 0);
+            });
+        });
+
+        $input.on('blur', function () {
+            // Let a click on a suggestion land before the list goes away
+            setTimeout(function () { $list.hide(); }, 200);
+        });
+    });
+})(jQuery);
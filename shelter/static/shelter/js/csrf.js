@@ -0,0 +1,15 @@
+(function ($) {
+    "use strict";
+
+    // Cached pages ship their forms without a CSRF token. Fetch one (this also
+    // sets the CSRF cookie) and fill in every placeholder field on the page.
+    $(function () {
+        var $fields = $('input[data-csrf-placeholder]');
+        if (!$fields.length) {
+            return;
+        }
+        $.getJSON($('body').data('csrf-url')).done(function (data) {
+            $fields.val(data.token);
+        });
+    });
+})(jQuery);
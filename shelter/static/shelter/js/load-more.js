@@ -0,0 +1,28 @@
+(function ($) {
+    "use strict";
+
+    // Fetch the next page of listing cards and append them to the grid.
+    // The link's href still works as a plain next-page link without JS.
+    $(document).on('click', '.js-load-more', function (e) {
+        var $button = $(this);
+        var url = $button.data('url');
+        if (!url) {
+            return;
+        }
+        e.preventDefault();
+        $button.addClass('disabled');
+
+        $.getJSON(url).done(function (data) {
+            $($button.data('target')).find('.row').first().append(data.html);
+            if (data.next_url) {
+                $button.data('url', data.next_url);
+                $button.attr('href', data.next_page);
+                $button.removeClass('disabled');
+            } else {
+                $button.closest('div').remove();
+            }
+        }).fail(function () {
+            window.location.href = $button.attr('href');
+        });
+    });
+})(jQuery);
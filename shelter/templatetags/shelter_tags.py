@@ -0,0 +1,56 @@
+from django import template
+from django.template.backends.utils import csrf_input
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from shelter.cache import get_version
+from shelter.images import srcset
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def form_csrf_token(context, cached=False):
+    """
+    CSRF field for forms in the shared layout.
+    On publicly cached pages, and inside cached fragments (cached=True), the
+    token is left empty and filled in by csrf.js, so cached HTML never
+    contains a per-visitor token.
+    Usage: {% form_csrf_token %} or {% form_csrf_token cached=True %}
+    """
+    request = context.get('request')
+    if request is None:
+        return ''
+    if cached or getattr(request, 'public_page', False):
+        return mark_safe('<input type="hidden" name="csrfmiddlewaretoken" value="" data-csrf-placeholder>')
+    return csrf_input(request)
+
+
+@register.simple_tag
+def cache_version(*names):
+    """
+    Current version counters, for use as a {% cache %} vary-on key.
+    Usage: {% cache_version 'listing' as listing_version %}
+    """
+    return '.'.join(str(get_version(name)) for name in names)
+
+
+@register.simple_tag
+def image_srcset(obj, field, size, extension='jpeg'):
+    """
+    srcset of the resized copies of an image field, empty until they exist.
+    Usage: <img src="{{ home.image.url }}" srcset="{% image_srcset home 'image' 'card' %}">
+    """
+    return srcset(obj, field, size, extension)
+
+
+@register.simple_tag
+def webp_source(obj, field, size):
+    """
+    WebP <source> for a <picture>, nothing until the renditions exist.
+    Usage: <picture>{% webp_source home 'image' 'card' %}<img ...></picture>
+    """
+    value = srcset(obj, field, size, 'webp')
+    if not value:
+        return ''
+    return format_html('<source type="image/webp" srcset="{}">', value)
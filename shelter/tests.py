@@ -1,3 +1,880 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+from concurrent.futures import Future
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
+from xml.etree import ElementTree
+import numpy as np
+from django.apps import apps as django_apps
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DataError, OperationalError, connection
+from django.http import QueryDict
+from django.shortcuts import render
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from agents.models import Agent
+from . import autocomplete, fuzzy, geo, importer, leads, prerender, ratelimit, similar, sitemap
+from .cache import bump_listing_version, search_cache_key
+from .facets import build_facets, cached_facets
+from .management.commands import build_image_renditions
+from .cache_backends import CULL_EVERY, SQLiteCache
+from .models import Contact, LeadTouch, Listening, Newsletter, PendingSimilarListing, SimilarListing
+from .pagination import cached_page, encode_cursor, get_page_size, paginate, sort_keys
+from .search import apply_filters, search_listings
+
+
+def make_agent(**fields):
+    return Agent.objects.create(**{
+        'name': 'Test Agent', 'photo': 'agents/test.jpg', 'phone': '9812345678', 'email': 'agent@example.com',
+        'whatsapp': '9812345678', 'instagram': '', 'linkedin': '', **fields,
+    })
+
+
+def make_listing(agent, i, **fields):
+    return Listening.objects.create(**{
+        'agent': agent, 'title': f'Flat {i}', 'slug': f'flat-{i}', 'image': 'listings/test.jpg',
+        'location': 'Goa', 'price': 1000000 + i * 10000, 'bedrooms': 2, 'bathrooms': 1,
+        'area': '900 sq ft', 'kitchen': 1, 'garage': 0, **fields,
+    })
+
+
+# Buckets in the default cache, emptied with it before each test
+@override_settings(RATE_LIMIT_CACHE='default')
+class LoadMoreTests(TestCase):
+    """Every "Load More" chain visits each matching listing once, in order"""
+
+    PARAMS = [
+        {},
+        {'keyword': 'villa'},
+        {'keyword': 'vila', 'match': 'fuzzy'},
+        {'keyword': 'vila', 'match': 'fuzzy', 'location': 'Goa', 'sort': 'price'},
+        {'location': 'Goa'},
+        {'status': 'sale', 'sort': 'price'},
+        {'sort': '-area'},
+        {'sort': 'newest', 'min_bedrooms': '2'},
+        {'lat': '15.5', 'lng': '73.8', 'radius_km': '500', 'sort': 'distance'},
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        agent = make_agent()
+        now = timezone.now()
+        for i in range(23):
+            Listening.objects.create(
+                agent=agent,
+                title=f'{"Sea view villa" if i % 3 == 0 else "City flat"} {i}',
+                slug=f'listing-{i}',
+                image='listings/test.jpg',
+                location='Goa' if i % 2 else 'Kerala',
+                price=1000000 + (i % 5) * 250000,
+                bedrooms=i % 4 + 1,
+                bathrooms=1,
+                area=f'{800 + (i % 6) * 100} sq ft',
+                latitude=15.0 + i / 10,
+                longitude=74.0,
+                kitchen=1,
+                garage=0,
+                status='sale' if i % 2 else 'rent',
+                # Ties in created and rank_score must not repeat or drop rows
+                created=now - timedelta(days=i // 2),
+                is_featured=i % 7 == 0,
+                marketing_priority=('low', 'medium', 'high')[i % 3],
+                available=i != 5,
+            )
+
+    def setUp(self):
+        cache.clear()
+
+    def expected(self, params):
+        queryset = apply_filters(Listening.objects.filter(available=True), params)
+        return list(queryset.order_by(*sort_keys(queryset)).values_list('pk', flat=True))
+
+    def walk_pages(self, url, params):
+        """Listing ids shown following the Load More href through url"""
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        homes = response.context.get('query_list') or response.context.get('homes')
+        ids = [home.pk for home in homes]
+        while response.context['next_query']:
+            response = self.client.get(f"{url}?{response.context['next_query']}")
+            self.assertEqual(response.status_code, 200)
+            homes = response.context.get('query_list') or response.context.get('homes')
+            ids.extend(home.pk for home in homes)
+        return ids
+
+    def walk_fragments(self, url, params):
+        """Listing count shown following the Load More data-url from url"""
+        response = self.client.get(url, params)
+        homes = response.context.get('query_list') or response.context.get('homes')
+        count = len(homes)
+        next_url = response.context['next_query'] and f"{reverse('listings_page')}?{response.context['next_query']}"
+        while next_url:
+            response = self.client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            count += data['count']
+            next_url = data['next_url']
+        return count
+
+    def test_search_chains(self):
+        for params in self.PARAMS:
+            with self.subTest(params=params):
+                expected = self.expected(params)
+                self.assertTrue(expected)
+                self.assertEqual(self.walk_pages(reverse('search'), params), expected)
+                cache.clear()
+                self.assertEqual(self.walk_fragments(reverse('search'), params), len(expected))
+
+    def test_properties_list_chain(self):
+        expected = self.expected({})
+        self.assertEqual(self.walk_pages(reverse('properties_list'), {}), expected)
+        cache.clear()
+        self.assertEqual(self.walk_fragments(reverse('properties_list'), {}), len(expected))
+
+    def test_stale_cursor_starts_over(self):
+        # A cursor from the old created ordering of the bare search page
+        response = self.client.get(reverse('listings_page'), {'cursor': 'WyIyMDI2LTEwLTEzVDAwOjAwOjAwKzAwOjAwIiwxXQ'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_fuzzy_limit_applies_after_filters(self):
+        # Goa listings are the odd ones, fewer than the cap are left after filtering
+        params = {'keyword': 'vila', 'match': 'fuzzy', 'location': 'Goa'}
+        expected = self.expected(params)
+        self.assertEqual(len(expected), 4)
+        with mock.patch.object(fuzzy, 'MAX_MATCHES', 4):
+            self.assertEqual(self.walk_pages(reverse('search'), params), expected)
+
+    def test_cached_search_skips_fuzzy_scoring(self):
+        params = {'keyword': 'vila', 'match': 'fuzzy'}
+        self.client.get(reverse('search'), params)
+        with mock.patch.object(fuzzy.trigram_index, 'search') as search:
+            self.assertEqual(self.client.get(reverse('search'), params).status_code, 200)
+            self.assertEqual(self.client.get(reverse('listings_page'), params).status_code, 200)
+        search.assert_not_called()
+
+
+class MarkAsFeaturedTests(TestCase):
+    def test_reranks_rows_the_filter_no_longer_matches(self):
+        listing = make_listing(make_agent(), 1)
+        before = listing.rank_score
+        # As the changelist passes it when filtered with is_featured=No
+        admin.site._registry[Listening].mark_as_featured(None, Listening.objects.filter(is_featured=False))
+        listing.refresh_from_db()
+        self.assertTrue(listing.is_featured)
+        self.assertGreater(listing.rank_score, before)
+
+
+class SimilarListingTests(TestCase):
+    def setUp(self):
+        self.agent = make_agent()
+
+    def create(self, i, **fields):
+        return make_listing(self.agent, i, **fields)
+
+    def test_save_queues_instead_of_recomputing(self):
+        listings = [self.create(i) for i in range(5)]
+        similar.rebuild_similar_listings()
+        changed = listings[0]
+        changed.price = 5000000
+        with self.captureOnCommitCallbacks(execute=True):
+            changed.save()
+        self.assertTrue(PendingSimilarListing.objects.filter(listing=changed).exists())
+        # Every other list holds the changed listing, so all five are recomputed
+        self.assertEqual(similar.update_pending_similar_listings(), (1, 20))
+        self.assertFalse(PendingSimilarListing.objects.exists())
+
+    def test_changed_listing_joins_lists_it_now_belongs_to(self):
+        listings = [self.create(i) for i in range(9)]
+        mover = self.create(9, price=90000000, bedrooms=5)
+        similar.rebuild_similar_listings()
+        self.assertFalse(SimilarListing.objects.filter(listing=listings[0], similar=mover).exists())
+        mover.price, mover.bedrooms = listings[0].price, listings[0].bedrooms
+        with self.captureOnCommitCallbacks(execute=True):
+            mover.save()
+        similar.update_pending_similar_listings()
+        self.assertTrue(SimilarListing.objects.filter(listing=listings[0], similar=mover, rank=1).exists())
+
+    def test_blocks_find_the_same_neighbours(self):
+        vectors = np.random.default_rng(0).normal(size=(50, 4))
+        targets = np.arange(10)
+        whole = similar.nearest_neighbours(vectors, vectors[targets], targets)
+        blocked = similar.nearest_neighbours(vectors, vectors[targets], targets, block_size=7)
+        np.testing.assert_array_equal(whole[0], blocked[0])
+        np.testing.assert_allclose(whole[1], blocked[1])
+
+    def test_unavailable_listing_leaves_every_list_at_once(self):
+        listings = [self.create(i) for i in range(3)]
+        similar.rebuild_similar_listings()
+        gone = listings[1]
+        gone.available = False
+        with self.captureOnCommitCallbacks(execute=True):
+            gone.save()
+        self.assertFalse(SimilarListing.objects.filter(similar=gone).exists())
+        self.assertFalse(SimilarListing.objects.filter(listing=gone).exists())
+
+
+class ListingImportTests(TestCase):
+    HEADER = 'external_id,agent_email,title,location,status,price,bedrooms,bathrooms,area,available,is_featured\n'
+
+    def setUp(self):
+        make_agent()
+
+    def run_import(self, lines):
+        data = (self.HEADER + ''.join(f'{line}\n' for line in lines)).encode()
+        return importer.import_listings(importer.read_rows(io.BytesIO(data), 'csv'))
+
+    def test_yes_and_no_spellings(self):
+        result = self.run_import([
+            'a,agent@example.com,Flat A,Goa,rent,100,1,1,500 sq ft,0,no',
+            'b,agent@example.com,Flat B,Goa,rent,100,1,1,500 sq ft,no,1',
+            'c,agent@example.com,Flat C,Goa,rent,100,1,1,500 sq ft,,',
+        ])
+        self.assertEqual((result.created, result.failed), (3, 0))
+        flags = dict((external_id, (available, featured)) for external_id, available, featured in
+                     Listening.objects.values_list('external_id', 'available', 'is_featured'))
+        self.assertEqual(flags, {'a': (False, False), 'b': (False, True), 'c': (True, False)})
+
+    def test_unknown_flag_is_a_row_error(self):
+        result = self.run_import(['a,agent@example.com,Flat A,Goa,rent,100,1,1,500 sq ft,maybe,'])
+        self.assertEqual((result.created, result.failed), (0, 1))
+        self.assertIn('available', result.errors[0]['errors'])
+
+    def test_reimport_updates_by_external_id(self):
+        self.run_import(['a,agent@example.com,Flat A,Goa,rent,100,1,1,500 sq ft,,'])
+        slug = Listening.objects.get().slug
+        result = self.run_import(['a,agent@example.com,Flat A renamed,Goa,sale,200,2,1,600 sq ft,,'])
+        self.assertEqual((result.created, result.updated), (0, 1))
+        listing = Listening.objects.get()
+        self.assertEqual((listing.title, listing.status, listing.area_sqft, listing.slug), ('Flat A renamed', 'sale', 600, slug))
+
+    @override_settings(RATE_LIMIT_CACHE='default')
+    def test_api_is_staff_only_and_dry_run_writes_nothing(self):
+        url = reverse('api-listing-import')
+        rows = [{'external_id': 'a', 'agent_email': 'agent@example.com', 'title': 'Flat A', 'location': 'Goa',
+                 'status': 'rent', 'price': '100', 'bedrooms': '1', 'bathrooms': '1', 'area': '500 sq ft'}]
+        self.assertEqual(self.client.post(url, rows, content_type='application/json').status_code, 403)
+        self.client.force_login(get_user_model().objects.create_user('staff', password='x', is_staff=True))
+        result = self.client.post(f'{url}?dry_run=1', rows, content_type='application/json').json()
+        self.assertEqual((result['created'], result['dry_run']), (1, True))
+        self.assertFalse(Listening.objects.exists())
+        result = self.client.post(url, {'rows': rows}, content_type='application/json').json()
+        self.assertEqual((result['created'], result['failed']), (1, 0))
+        self.assertEqual(Listening.objects.get().external_id, 'a')
+
+
+@mock.patch.object(leads, 'start_flusher')
+class LeadOutboxTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(LEAD_OUTBOX=True, LEAD_OUTBOX_ROOT=root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def submit_contact(self, **fields):
+        leads.submit_lead('contact', **{
+            'name': 'Asha', 'email': 'Asha@Example.com', 'phone': '098123 45678', 'message': 'Hello',
+            'created_at': timezone.now(), **fields,
+        })
+
+    def test_leads_wait_for_the_flush(self, start_flusher):
+        self.submit_contact()
+        self.submit_contact(name='Ravi')
+        self.assertFalse(Contact.objects.exists())
+        self.assertEqual(leads.flush_leads(), 2)
+        self.assertEqual(Contact.objects.count(), 2)
+        self.assertEqual(leads.flush_leads(), 0)
+
+    def test_over_long_fields_are_cut_to_the_column(self, start_flusher):
+        self.submit_contact(phone='9' * 40, name='x' * 300)
+        self.assertEqual(leads.flush_leads(), 1)
+        contact = Contact.objects.get()
+        self.assertEqual((len(contact.phone), len(contact.name)), (20, 100))
+
+    def test_failing_journal_does_not_hold_back_later_ones(self, start_flusher):
+        self.submit_contact(name='First')
+        with mock.patch.object(leads, 'write_leads', side_effect=OperationalError('database is locked')):
+            self.assertEqual(leads.flush_leads(), 0)
+        self.submit_contact(name='Second')
+        # The first journal failed again, the second is written regardless
+        with mock.patch.object(leads, '_bulk_create', side_effect=[OperationalError('still locked'), 1]):
+            self.assertEqual(leads.flush_leads(), 1)
+        self.assertEqual(leads.flush_leads(), 1)
+        self.assertEqual(leads.flush_leads(), 0)
+
+    def test_bad_row_is_dropped_alone(self, start_flusher):
+        self.submit_contact(name='Good')
+        self.submit_contact(name='Bad')
+        real = Contact.objects.bulk_create
+
+        def refuse_bad(objs, **kwargs):
+            if any(obj.name == 'Bad' for obj in objs):
+                raise DataError('value too long')
+            return real(objs, **kwargs)
+
+        with mock.patch.object(Contact.objects, 'bulk_create', side_effect=refuse_bad):
+            self.assertEqual(leads.flush_leads(), 1)
+        self.assertEqual(list(Contact.objects.values_list('name', flat=True)), ['Good'])
+        self.assertEqual(LeadTouch.objects.get().phone, '919812345678')
+
+
+@override_settings(RATE_LIMIT_CACHE='default')
+class ContactViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_failure_is_logged_not_shown(self):
+        data = {'name': 'Asha', 'email': 'asha@example.com', 'phone': '9812345678', 'message': 'Hello'}
+        with mock.patch('shelter.views.submit_lead', side_effect=OSError('/srv/lead_outbox: disk full')), \
+                self.assertLogs('shelter.views', 'ERROR'):
+            response = self.client.post(reverse('contact'), data, follow=True)
+        shown = [str(message) for message in response.context['messages']]
+        self.assertEqual(len(shown), 1)
+        self.assertNotIn('disk full', shown[0])
+
+
+class SQLiteCacheTests(TestCase):
+    """The file cache shared by workers when there is no Redis"""
+
+    def make_cache(self, **options):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        return lambda: SQLiteCache(f'{root}/cache.sqlite3', {'OPTIONS': options})
+
+    def test_workers_see_each_others_writes(self):
+        new_cache = self.make_cache()
+        first, second = new_cache(), new_cache()
+        first.set('version', 1)
+        self.assertEqual(second.incr('version'), 2)
+        self.assertEqual(first.incr('version'), 3)
+        self.assertEqual(second.get('version'), 3)
+        with self.assertRaises(ValueError):
+            first.incr('missing')
+
+    def test_cull_keeps_the_newest_entries(self):
+        shared = self.make_cache(MAX_ENTRIES=50, CULL_FREQUENCY=5)()
+        for i in range(CULL_EVERY):
+            shared.set(f'key-{i}', i, timeout=1000 + i)
+        count = shared._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertEqual(count, 40)
+        self.assertIsNone(shared.get('key-0'))
+        self.assertEqual(shared.get(f'key-{CULL_EVERY - 1}'), CULL_EVERY - 1)
+
+
+class PublicPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.listing = make_listing(make_agent(), 1)
+
+    def test_listing_change_retires_cached_pages(self):
+        for name in ('listings_page', 'properties_list'):
+            first = self.client.get(reverse(name), {'format': 'html'})
+            self.assertIn('Flat 1', first.content.decode())
+            self.assertIn('max-age=', first['Cache-Control'])
+        self.listing.title = 'Renamed flat'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.save()
+        for name in ('listings_page', 'properties_list'):
+            with self.subTest(page=name):
+                self.assertIn('Renamed flat', self.client.get(reverse(name), {'format': 'html'}).content.decode())
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.index = autocomplete.Autocomplete()
+        self.listing = make_listing(make_agent(), 1, title='Sea View Villa')
+
+    def test_other_workers_changes_rebuild_in_the_background(self):
+        self.assertEqual([hit['label'] for hit in self.index.search('sea')], ['Sea View Villa'])
+        # As saved by another worker: the version moves, this index is not patched
+        Listening.objects.filter(pk=self.listing.pk).update(title='Hill Top Villa')
+        bump_listing_version()
+        with mock.patch.object(self.index, 'rebuild_in_background') as rebuild:
+            self.assertEqual([hit['label'] for hit in self.index.search('sea')], ['Sea View Villa'])
+        rebuild.assert_called_once_with()
+        self.index.build()
+        self.assertEqual(self.index.search('sea'), [])
+        self.assertEqual([hit['label'] for hit in self.index.search('hill')], ['Hill Top Villa'])
+
+
+@override_settings(SEARCH_FUZZY_REFRESH_SECONDS=0)
+class TrigramIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.index = fuzzy.TrigramIndex()
+        self.listing = make_listing(make_agent(), 1, title='Sea View Villa')
+        self.index.build()
+        for patcher in (
+            mock.patch.object(fuzzy, 'trigram_index', self.index),
+            mock.patch.object(self.index, 'rebuild_in_background'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_stale_index_is_served_and_rebuilt_in_the_background(self):
+        # As saved by another worker: the version moves, this index is not patched
+        Listening.objects.filter(pk=self.listing.pk).update(title='Hill Top Villa')
+        bump_listing_version()
+        self.assertEqual(self.index.search('villa', 0.5)[0].tolist(), [self.listing.pk])
+        self.assertEqual(self.index.search('hill', 0.5)[0].tolist(), [])
+        self.index.rebuild_in_background.assert_called_with()
+
+        self.index.build()
+        self.assertEqual(self.index.search('hill', 0.5)[0].tolist(), [self.listing.pk])
+
+    def test_results_from_a_stale_index_are_not_cached(self):
+        params = {'keyword': 'villa', 'match': 'fuzzy'}
+        self.assertTrue(fuzzy.results_cacheable(params))
+        bump_listing_version()
+        self.assertFalse(fuzzy.results_cacheable(params))
+        self.assertTrue(fuzzy.results_cacheable({'keyword': 'villa'}))
+        with mock.patch.object(fuzzy.TrigramIndex, 'search', wraps=self.index.search) as search:
+            self.client.get(reverse('listings_page'), params)
+            self.client.get(reverse('listings_page'), params)
+        self.assertEqual(search.call_count, 2)
+
+
+class PrerenderTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        enabled = override_settings(PRERENDER_ROOT=root)
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+
+    def test_pages_are_rendered_through_the_middleware(self):
+        manifest = prerender.prerender_pages()
+        path = reverse('terms')
+        self.assertIn(path, manifest['pages'])
+        response = self.client.get(path, HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response['ETag'], f'"{manifest["pages"][path]}"')
+        # Forms carry an empty placeholder, not the token of the rendering request
+        self.assertIn('data-csrf-placeholder', response.content.decode())
+        self.assertNotRegex(response.content.decode(), r'csrfmiddlewaretoken" value="[^"]')
+
+    def test_error_pages_are_not_written(self):
+        with mock.patch.object(prerender, 'PRERENDERED_PAGES', ('terms', 'property_detail')), \
+                mock.patch.object(prerender, 'reverse', side_effect=lambda name: '/no-such-page/' if name == 'property_detail' else reverse(name)):
+            with self.assertRaisesMessage(ValueError, 'answered 404'):
+                prerender.prerender_pages()
+
+
+class BackfillMigrationTests(TestCase):
+    def test_fills_area_and_canonical_location(self):
+        migration = import_module('shelter.migrations.0017_backfill_area_and_location')
+        agent = make_agent()
+        listings = [make_listing(agent, i, area='1,200 sq ft') for i in range(3)]
+        # As saved before either column was derived
+        Listening.objects.update(area_sqft=None, location=' goa ')
+        with mock.patch.object(migration, 'BATCH_SIZE', 2):
+            migration.backfill(django_apps, mock.Mock(connection=connection))
+        for listing in listings:
+            listing.refresh_from_db()
+            self.assertEqual((listing.area_sqft, listing.location), (1200, 'Goa'))
+
+
+@override_settings(RATE_LIMIT_CACHE='default', PARTNER_FEED_KEYS=['partner-key'])
+class ListingFeedTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        make_listing(make_agent(), 1, title='Flat\x0b with a tab\x01', description='Sea view\ufffe')
+
+    def get(self, fmt='xml', **headers):
+        response = self.client.get(reverse('listing_feed', args=[fmt]), {'key': 'partner-key'}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_xml_is_well_formed(self):
+        root = ElementTree.fromstring(b''.join(self.get().streaming_content))
+        listing = root.find('listing')
+        self.assertEqual(listing.find('title').text, 'Flat with a tab')
+        self.assertEqual(listing.find('description').text, 'Sea view')
+
+    def test_gzip_only_when_accepted(self):
+        self.assertEqual(self.get(**{'Accept-Encoding': 'br, gzip;q=0.5'})['Content-Encoding'], 'gzip')
+        for header in ('gzip;q=0', 'identity', '*;q=0', 'gzip;q=0, *'):
+            with self.subTest(header=header):
+                self.assertFalse(self.get(**{'Accept-Encoding': header}).has_header('Content-Encoding'))
+
+    @override_settings(PARTNER_FEED_KEYS=[])
+    def test_closed_without_keys(self):
+        url = reverse('listing_feed', args=['jsonl'])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.settings(PARTNER_FEED_OPEN=True):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class BuildImageRenditionsTests(TestCase):
+    def test_one_failing_image_does_not_stop_the_rest(self):
+        command = build_image_renditions.Command(stdout=io.StringIO(), stderr=io.StringIO())
+        command.done = command.failed = 0
+        broken, good = Future(), Future()
+        broken.set_exception(ValueError('not an image'))
+        good.set_result(('info', 'outputs'))
+        command.running = {
+            broken: (Listening, 1, 'image', 'listings/broken.jpg'),
+            good: (Listening, 2, 'image', 'listings/good.jpg'),
+        }
+        with mock.patch.object(build_image_renditions, 'store_renditions', return_value='entry'), \
+                mock.patch.object(build_image_renditions, 'save_renditions') as save, \
+                self.assertLogs(build_image_renditions.logger, 'ERROR'):
+            command.collect([broken, good])
+        save.assert_called_once_with(Listening, 2, {'image': 'entry'})
+        self.assertEqual((command.done, command.failed), (1, 1))
+        self.assertIn('listings/broken.jpg: not an image', command.stderr.getvalue())
+
+
+class PersonTouchesTests(TestCase):
+    def touch(self, i, email='', phone=''):
+        return LeadTouch.objects.create(kind='contact', object_id=i, email=email, phone=phone)
+
+    def test_links_are_followed_through_other_touches(self):
+        first = self.touch(1, 'a@example.com', '919800000001')
+        same_phone = self.touch(2, 'b@example.com', '919800000001')
+        same_email = self.touch(3, 'b@example.com', '919800000002')
+        by_second_phone = self.touch(4, phone='919800000002')
+        stranger = self.touch(5, 'c@example.com', '919800000003')
+        person = set(first.person_touches())
+        self.assertEqual(person, {first, same_phone, same_email, by_second_phone})
+        self.assertEqual(set(by_second_phone.person_touches()), person)
+        self.assertEqual(list(stranger.person_touches()), [stranger])
+
+
+class KeywordSearchTests(TestCase):
+    def setUp(self):
+        agent = make_agent()
+        self.in_description = make_listing(agent, 1, title='Family home', description='Has a penthouse style terrace')
+        self.in_title = make_listing(agent, 2, title='Penthouse with terrace')
+        self.other = make_listing(agent, 3, title='Garden cottage')
+
+    def search(self, keyword):
+        return list(search_listings(Listening.objects.all(), keyword))
+
+    def test_title_matches_rank_first_and_prefixes_match(self):
+        self.assertEqual(self.search('penth'), [self.in_title, self.in_description])
+        self.assertEqual(self.search('garden cott'), [self.other])
+        self.assertEqual(self.search('   '), list(Listening.objects.all()))
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.title = 'Garden penthouse'
+        self.other.save()
+        self.assertIn(self.other, self.search('penthouse'))
+        self.in_title.delete()
+        self.assertEqual(self.search('penthouse'), [self.other, self.in_description])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        agent = make_agent()
+        make_listing(agent, 1, location='Goa', bedrooms=1, price=900000)
+        make_listing(agent, 2, location='Goa', bedrooms=3, price=3000000, status='rent')
+        make_listing(agent, 3, location='Mumbai', bedrooms=2, price=12000000)
+
+    def options(self, facets, name):
+        return {option['value']: option for option in next(f for f in facets if f['name'] == name)['options']}
+
+    def test_counts_and_refine_links(self):
+        params = QueryDict('location=Goa&cursor=abc')
+        facets = build_facets(apply_filters(Listening.objects.all(), params), params)
+        self.assertEqual({value: o['count'] for value, o in self.options(facets, 'location').items()}, {'Goa': 2})
+        self.assertTrue(self.options(facets, 'location')['Goa']['selected'])
+        # "Up to N" bedrooms counts are running totals
+        self.assertEqual({value: o['count'] for value, o in self.options(facets, 'bedrooms').items()}, {1: 1, 3: 2})
+        prices = self.options(facets, 'price')
+        self.assertEqual((prices['0-1000000']['count'], prices['2500000-5000000']['count']), (1, 1))
+        self.assertNotIn('cursor', prices['0-1000000']['query'])
+
+    def test_cached_counts_follow_listing_changes(self):
+        def counts():
+            facets = cached_facets(Listening.objects.all(), QueryDict(''))
+            return {value: option['count'] for value, option in self.options(facets, 'location').items()}
+
+        self.assertEqual(counts(), {'Goa': 2, 'Mumbai': 1})
+        make_listing(Agent.objects.get(), 4, location='Mumbai')
+        self.assertEqual(counts(), {'Goa': 2, 'Mumbai': 2})
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        agent = make_agent()
+        # Three prices for seven listings, so pages split runs of equal prices
+        self.listings = [make_listing(agent, i, price=1000000 * (1 + i % 3)) for i in range(7)]
+
+    def walk(self, queryset, page_size=2):
+        ids, cursor = [], None
+        while True:
+            items, cursor = paginate(queryset, cursor, page_size)
+            ids.extend(item.pk for item in items)
+            if cursor is None:
+                return ids
+
+    def test_ties_are_neither_repeated_nor_skipped(self):
+        for sort in ('price', '-price', 'newest', None):
+            with self.subTest(sort=sort):
+                queryset = apply_filters(Listening.objects.all(), QueryDict(f'sort={sort}' if sort else ''))
+                expected = list(queryset.order_by(*sort_keys(queryset)).values_list('pk', flat=True))
+                self.assertEqual(self.walk(queryset), expected)
+
+    def test_malformed_cursors_start_over(self):
+        queryset = Listening.objects.order_by('price')
+        first, _ = paginate(queryset, None, 2)
+        for cursor in ('not-base64!', encode_cursor(self.listings[0], ['price']), 'WyJ4IiwgMV0'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(paginate(queryset, cursor, 2)[0], first)
+
+    def test_page_size_is_bounded(self):
+        self.assertEqual([get_page_size(v) for v in (None, 'x', '0', '6', '1000')], [6, 6, 1, 6, 48])
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = make_agent()
+        self.listing = make_listing(self.agent, 1)
+
+    def page(self, query='location=Goa'):
+        params = QueryDict(query)
+        return cached_page(apply_filters(Listening.objects.all(), params), params)[0]
+
+    def test_equivalent_queries_share_an_entry(self):
+        self.assertEqual(
+            search_cache_key('page6', QueryDict('keyword=Sea%20%20View&format=html&location=')),
+            search_cache_key('page6', QueryDict('keyword=sea+view')),
+        )
+
+    def test_hits_until_a_listing_changes(self):
+        self.assertEqual(self.page(), [self.listing])
+        with self.assertNumQueries(1):
+            self.assertEqual(self.page(), [self.listing])
+        added = make_listing(self.agent, 2)
+        self.assertEqual(set(self.page()), {self.listing, added})
+
+
+
+class GeoSearchTests(TestCase):
+    def setUp(self):
+        agent = make_agent()
+        self.panaji = make_listing(agent, 1, latitude=15.4909, longitude=73.8278)
+        self.mapusa = make_listing(agent, 2, latitude=15.5937, longitude=73.8142)
+        self.mumbai = make_listing(agent, 3, latitude=19.0760, longitude=72.8777)
+        self.unplaced = make_listing(agent, 4)
+
+    def search(self, query):
+        return list(apply_filters(Listening.objects.all(), QueryDict(query)))
+
+    def test_geohash_matches_the_reference_encoding(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744), 'u4pruydqq')
+        self.assertEqual(self.panaji.geohash, geo.encode(15.4909, 73.8278))
+
+    def test_radius_search_sorted_by_distance(self):
+        found = self.search('lat=15.60&lng=73.81&radius_km=20&sort=distance')
+        self.assertEqual(found, [self.mapusa, self.panaji])
+        self.assertAlmostEqual(found[1].distance_km, 12.2, delta=0.5)
+        self.assertEqual(self.search('lat=15.60&lng=73.81&radius_km=1'), [self.mapusa])
+
+    def test_box_search_and_invalid_boxes(self):
+        self.assertEqual(set(self.search('south=15&west=73&north=16&east=74')), {self.panaji, self.mapusa})
+        # South of north is required; an invalid box filters nothing
+        self.assertEqual(len(self.search('south=16&west=73&north=15&east=74')), 4)
+
+
+@override_settings(RATE_LIMIT_CACHE='default')
+class VersionedPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = make_agent()
+        make_listing(self.agent, 1)
+
+    def test_homepage_served_from_cache_until_data_changes(self):
+        url = reverse('index')
+        self.assertContains(self.client.get(url), 'Flat 1')
+        with self.assertNumQueries(0):
+            self.assertContains(self.client.get(url), 'Flat 1')
+        make_listing(self.agent, 2)
+        self.assertContains(self.client.get(url), 'Flat 2')
+
+    def test_visitors_with_a_session_get_a_fresh_page(self):
+        url = reverse('about')
+        self.client.get(url)
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = 'some-session'
+        with mock.patch('shelter.views.render', wraps=render) as rendered:
+            self.client.get(url)
+        rendered.assert_called_once()
+
+
+@override_settings(RATE_LIMIT_CACHE='default')
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # The detail page shows all three photos
+        self.listing = make_listing(make_agent(), 1, image2='listings/test.jpg', image3='listings/test.jpg')
+        self.url = reverse('property_detail', args=[self.listing.slug])
+
+    def test_unchanged_listing_answers_304(self):
+        # The first visit sets the CSRF cookie the ETag includes
+        self.client.get(self.url)
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('no-cache', first['Cache-Control'])
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 304)
+        self.listing.price += 1
+        self.listing.save()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+    def test_agent_change_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        agent = self.listing.agent
+        agent.phone = '9800000000'
+        agent.save()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+
+@override_settings(RATE_LIMIT_CACHE='default')
+class SitemapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        enabled = override_settings(SITEMAP_ROOT=root, SITE_URL='https://homes.example')
+        enabled.enable()
+        self.addCleanup(enabled.disable)
+        patcher = mock.patch.object(sitemap, 'SHARD_SIZE', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        agent = make_agent()
+        self.listings = [make_listing(agent, i) for i in range(5)]
+
+    def test_only_changed_shards_are_rewritten(self):
+        shards = len({listing.pk // 2 for listing in self.listings})
+        self.assertEqual(sitemap.build_sitemaps(), (shards, shards))
+        self.assertEqual(sitemap.build_sitemaps(), (0, shards))
+        # A listing that shares its shard, so the shard stays in the sitemap
+        changed = next(a for a, b in zip(self.listings, self.listings[1:]) if a.pk // 2 == b.pk // 2)
+        changed.available = False
+        changed.save()
+        self.assertEqual(sitemap.build_sitemaps(), (1, shards))
+
+        number = changed.pk // 2
+        response = self.client.get(reverse('sitemap_shard', args=[number]))
+        urls = [loc.text for loc in ElementTree.fromstring(b''.join(response)).iter(f'{{{sitemap.XMLNS}}}loc')]
+        self.assertNotIn(f'https://homes.example/property/{changed.slug}/', urls)
+        self.assertTrue(all(url.startswith('https://homes.example/') for url in urls))
+        index = ElementTree.fromstring(b''.join(self.client.get(reverse('sitemap'))))
+        self.assertEqual(len(index), shards)
+
+
+@override_settings(RATE_LIMIT_CACHE='default')
+class ListingApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.agent = make_agent()
+        self.listings = [make_listing(self.agent, i) for i in range(3)]
+
+    def test_list_pages_by_cursor_with_sparse_fields(self):
+        url = reverse('api-listing-list')
+        first = self.client.get(url, {'page_size': 2, 'fields': 'id,title,agent'}).json()
+        self.assertEqual(len(first['results']), 2)
+        self.assertEqual(set(first['results'][0]), {'id', 'title', 'agent'})
+        rest = self.client.get(first['next']).json()
+        self.assertIsNone(rest['next'])
+        ids = [item['id'] for item in first['results'] + rest['results']]
+        self.assertCountEqual(ids, [listing.pk for listing in self.listings])
+
+    def test_detail_revalidates_until_the_listing_changes(self):
+        listing = self.listings[0]
+        url = reverse('api-listing-detail', args=[listing.slug])
+        first = self.client.get(url)
+        self.assertEqual(first.json()['title'], listing.title)
+        self.assertIn('public', first['Cache-Control'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        listing.title = 'Renamed flat'
+        listing.save()
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['title'], 'Renamed flat')
+
+
+@override_settings(
+    RATE_LIMIT_CACHE='default', RATE_LIMITS={'contact': {'requests': 2, 'seconds': 60, 'methods': ('POST',)}},
+)
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for name, value in (('_rules', None), ('_blocked', {})):
+            patcher = mock.patch.object(ratelimit, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bucket_refills_one_request_per_interval(self):
+        key, now = 'ratelimit:test:10.0.0.1', 1000.0
+        self.assertEqual([ratelimit.take(key, 2, 60, now) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(ratelimit.take(key, 2, 60, now), 30)
+        self.assertEqual(ratelimit.take(key, 2, 60, now + 30), 0)
+
+    @mock.patch('shelter.views.submit_lead')
+    def test_over_budget_posts_get_429_per_client(self, submit_lead):
+        data = {'name': 'Asha', 'email': 'asha@example.com', 'phone': '9812345678', 'message': 'Hello'}
+        url = reverse('contact')
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, data).status_code, 302)
+        refused = self.client.post(url, data, HTTP_ACCEPT='application/json')
+        self.assertEqual(refused.status_code, 429)
+        self.assertEqual(refused['Retry-After'], '30')
+        self.assertFalse(refused.json()['success'])
+        self.assertEqual(submit_lead.call_count, 2)
+        # Reading the page is not limited, nor is another address
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.post(url, data, REMOTE_ADDR='10.0.0.2').status_code, 302)
+
+
+@override_settings(RATE_LIMIT_CACHE='default', LEAD_OUTBOX=False)
+class NewsletterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def signup(self, email, **fields):
+        return self.client.post(reverse('newsletter_signup'), {'email': email, 'name': 'Asha', **fields}).json()
+
+    def test_repeat_signup_reactivates_the_lowercased_address(self):
+        self.assertTrue(self.signup('Asha@Example.COM')['success'])
+        subscribed = Newsletter.objects.get()
+        self.assertEqual(subscribed.email, 'asha@example.com')
+        Newsletter.objects.update(is_active=False)
+
+        self.assertTrue(self.signup('asha@example.com', name='Asha K', whatsapp='on')['success'])
+        again = Newsletter.objects.get()
+        self.assertEqual((again.is_active, again.name, again.whatsapp_updates), (True, 'Asha K', True))
+        self.assertEqual(again.date_subscribed, subscribed.date_subscribed)
+        self.assertFalse(self.signup('not-an-address')['success'])
+
+    def test_staff_bulk_subscribe(self):
+        Newsletter.objects.create(name='Ravi', email='ravi@example.com', is_active=False)
+        upload = SimpleUploadedFile('list.csv', (
+            'email,name,phone,whatsapp_updates\n'
+            'Ravi@Example.com,Ravi,,no\n'
+            'new@example.com,New,9812345678,yes\n'
+            'NEW@example.com,New again,,\n'
+            'broken,Nobody,,\n'
+        ).encode())
+        url = reverse('api-newsletter-import')
+        self.assertEqual(self.client.post(url, {'file': upload}).status_code, 403)
+
+        self.client.force_login(get_user_model().objects.create_user('staff', password='x', is_staff=True))
+        upload.seek(0)
+        result = self.client.post(url, {'file': upload}).json()
+        self.assertEqual((result['created'], result['updated'], result['failed']), (1, 1, 1))
+        self.assertEqual(dict(Newsletter.objects.values_list('email', 'is_active')),
+                         {'ravi@example.com': True, 'new@example.com': True})
+        self.assertEqual(Newsletter.objects.get(email='new@example.com').name, 'New again')
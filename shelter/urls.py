@@ -6,6 +6,7 @@ urlpatterns = [
     path('',views.index,name='index'),
     path('property-detail/<slug:slug>',views.propertyDetail,name='property_detail'),
     path('properties-list/',views.propertiesList,name='properties_list'),
+    path('properties-list/page/',views.listingsPage,name='listings_page'),
     path('contact/',views.contact,name='contact'),
     path('search/',views.searchResult,name='search'),
     path('services/',views.Services,name='services'),
@@ -14,6 +15,11 @@ urlpatterns = [
     path('contact-agent/',views.UserAgentContact,name='agentcontact'),
     path('property-agent-contact/', agent_property_contact, name='agent_property_contact'),
     path('newsletter/signup/', views.newsletter_signup, name='newsletter_signup'),
+    path('csrf/', views.csrf_token_view, name='csrf_token'),
+    path('autocomplete/', views.autocomplete_view, name='autocomplete'),
+    path('sitemap.xml', views.sitemap_index, name='sitemap'),
+    path('sitemaps/listings-<int:number>.xml', views.sitemap_shard, name='sitemap_shard'),
+    path('feed/listings.<str:feed_format>', views.listing_feed, name='listing_feed'),
     path('terms/', views.terms_view, name='terms'),
     path('privacy/', views.privacy_view, name='privacy'),
     path('cookies/', views.cookies_view, name='cookies'),
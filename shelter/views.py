@@ -1,36 +1,97 @@
 from django.shortcuts import render,get_object_or_404,HttpResponse
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.cache import never_cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.urls import reverse
+from django.utils import timezone
 import json
-from .models import Listening,Quickcontact,Newsletter,Contact
-from agents.models import Agent, AgentContact
+import logging
+import os
+from .models import Listening
+from agents.models import Agent
+from agents.views import existing_agent_id
 from  .locations_data import locations
 from .forms import QuickContactForm
+from .search import lazy_filters, parse_int, SORT_CHOICES
+from .facets import cached_facets
+from .pagination import PAGE_SIZE, paginate, cached_page, get_page_size, next_page_query
+from .decorators import conditional_page, public_page, versioned_page
+from .cache import listing_version
+from .ranking import by_relevance
+from .similar import similar_listings
+from .autocomplete import SUGGESTION_LIMIT, MAX_SUGGESTION_LIMIT, suggest
+from .leads import normalize_email, submit_lead
+from . import feed, sitemap
+from .http import accepts_gzip
+
+logger = logging.getLogger(__name__)
+
 # Create your views here.
 
+@versioned_page('listing', 'agent')
 def index(request):
-    homes = Listening.objects.all()[:6]
+    # Querysets stay lazy, cached template fragments never evaluate them
+    homes = by_relevance(Listening.objects.all())[:6]
     agents = Agent.objects.all()[:4]
     
     return render(request,'shelter/index.html',{'homes':homes,'agents':agents})
 
 
+@public_page('listing', 'agent')
 def propertiesList(request):
+    homes, next_cursor = paginate(by_relevance(Listening.objects.filter(available=True)), request.GET.get('cursor'))
+    return render(request,'shelter/properties_list.html',{
+        'homes': homes,
+        'next_query': next_page_query(request.GET, next_cursor)
+    })
 
-    if 'increment' not in request.session :
-        #declare empty variable 
-        counter = 0 
-        request.session['increment'] = 0
-    
-    request.session['increment'] += 6
-    counter = request.session['increment']
-    
-    homes = Listening.objects.all()[:counter]
-    return render(request,'shelter/properties_list.html',{'homes':homes})
+@public_page('listing', 'agent')
+def listingsPage(request):
+    """Next page of listing cards for "Load More", as JSON or a bare HTML fragment"""
+    query_list = lazy_filters(Listening.objects.filter(available=True), request.GET)
+    page_size = get_page_size(request.GET.get('page_size'))
+    homes, next_cursor = cached_page(query_list, request.GET, page_size)
+    html = render_to_string('shelter/listing_cards.html', {'homes': homes}, request=request)
+    next_query = next_page_query(request.GET, next_cursor)
+
+    if request.GET.get('format') == 'html':
+        response = HttpResponse(html)
+        if next_cursor:
+            response['X-Next-Cursor'] = next_cursor
+        return response
 
+    return JsonResponse({
+        'html': html,
+        'count': len(homes),
+        'next_cursor': next_cursor,
+        'next_url': f"{reverse('listings_page')}?{next_query}" if next_query else None,
+        'next_page': f"?{next_query}" if next_query else None,
+    })
+
+@never_cache
+def csrf_token_view(request):
+    """CSRF token for forms on publicly cached pages"""
+    return JsonResponse({'token': get_token(request)})
+
+def _listing_validators(request, slug):
+    row = Listening.objects.filter(slug=slug, available=True).values_list('pk', 'updated', 'agent__updated').first()
+    if row is None:
+        return None
+    pk, updated, agent_updated = row
+    # The similar homes sidebar changes with other listings, the version covers it
+    return (pk, updated.isoformat(), agent_updated.isoformat(), listing_version()), max(updated, agent_updated)
+
+@conditional_page(_listing_validators)
 def propertyDetail(request,slug):
-    sidebar_homes = Listening.objects.all()[:3]
     home = get_object_or_404(Listening,slug=slug,available=True)
+    sidebar_homes = list(similar_listings(home))
+    if not sidebar_homes:
+        # Neighbours not computed yet, e.g. before the first build_similar_listings run
+        sidebar_homes = by_relevance(Listening.objects.filter(available=True).exclude(pk=home.pk))[:3]
     return render(request,'shelter/property_detail.html',{'home':home,'sidebar_homes':sidebar_homes})
 
 from django.contrib import messages
@@ -50,69 +111,105 @@ def contact(request):
                 messages.error(request, 'All fields are required')
                 return redirect('contact')
             
-            # Save to database
-            contact = Contact.objects.create(
-                name=name,
-                email=email,
-                phone=phone,
-                message=message
-            )
+            # Queued, written to the database by the lead flusher
+            submit_lead('contact', name=name, email=email, phone=phone, message=message, created_at=timezone.now())
             
             messages.success(request, 'Thank you! Your message has been sent successfully.')
             return redirect('contact')
         
-        except Exception as e:
-            print(f"Error processing contact form: {str(e)}")
-            messages.error(request, f"An error occurred: {str(e)}")
+        except Exception:
+            logger.exception('Could not queue a contact form submission')
+            messages.error(request, 'Sorry, your message could not be sent. Please try again.')
             return redirect('contact')
     
     return render(request, 'shelter/contact.html')
 
 
 def searchResult(request):
-    query_list = Listening.objects.all()
+    query_list = Listening.objects.filter(available=True)
     search_locations = locations
     
     if not request.GET:
-        return render(request, 'shelter/search.html', {'query_list': query_list, 'search_locations': search_locations})
+        # Ordered like every other listing page, so its cursor fits listings_page
+        homes, next_cursor = cached_page(lazy_filters(query_list, request.GET), request.GET, PAGE_SIZE)
+        return render(request, 'shelter/search.html', {
+            'query_list': homes,
+            'search_locations': search_locations,
+            'facets': cached_facets(query_list, request.GET),
+            'sort_options': SORT_CHOICES,
+            'next_query': next_page_query(request.GET, next_cursor)
+        })
     
-    #location
-    if 'location' in request.GET:
-        location = request.GET['location']
-        if location:
-            query_list = query_list.filter(location__iexact=location)
-    # keyword
-    if 'keyword' in request.GET:
-        keyword = request.GET['keyword']
-        if keyword:
-            query_list = query_list.filter(description__icontains=keyword) 
-    #bedrooms
-    if 'bedrooms' in request.GET:
-        bedrooms = request.GET['bedrooms']
-        if bedrooms:
-            query_list = query_list.filter(bedrooms__lte=bedrooms)    
-
-    #bathrooms
-    if 'bathrooms' in request.GET:
-        bathrooms = request.GET['bathrooms']
-        if bathrooms:
-            query_list = query_list.filter(bathrooms__lte=bathrooms) 
-
-    #price    if 'price' in request.GET:
-        price = request.GET['price']
-        if price:
-            strprice = str(price)
-            # Convert the price string directly to int without dollar sign assumption
-            remove_dollar = int(strprice)
-            if remove_dollar:
-                query_list = query_list.filter(price__lte=remove_dollar)  
+    params = request.GET
+    filtered = lazy_filters(query_list, params)
+    homes, next_cursor = cached_page(filtered, params, PAGE_SIZE)
+
+    # Nothing matched the keyword as typed, retry allowing for misspellings
+    fuzzy_fallback = False
+    if not homes and params.get('keyword') and params.get('match') != 'fuzzy' and not params.get('cursor'):
+        fuzzy_params = params.copy()
+        fuzzy_params['match'] = 'fuzzy'
+        fuzzy = lazy_filters(query_list, fuzzy_params)
+        fuzzy_homes, fuzzy_cursor = cached_page(fuzzy, fuzzy_params, PAGE_SIZE)
+        if fuzzy_homes:
+            params, filtered, homes, next_cursor = fuzzy_params, fuzzy, fuzzy_homes, fuzzy_cursor
+            fuzzy_fallback = True
 
     return render(request,'shelter/search.html',{
-        'query_list': query_list,
+        'query_list': homes,
         'search_locations': search_locations,
-        'values': request.GET
+        'values': request.GET,
+        'fuzzy_fallback': fuzzy_fallback,
+        'facets': cached_facets(filtered, params),
+        'sort_options': SORT_CHOICES,
+        'next_query': next_page_query(params, next_cursor)
     })
 
+def autocomplete_view(request):
+    """Typeahead suggestions for ?q=, answered from the in-memory index"""
+    limit = parse_int(request.GET.get('limit')) or SUGGESTION_LIMIT
+    suggestions = suggest(request.GET.get('q', ''), max(1, min(limit, MAX_SUGGESTION_LIMIT)))
+    response = JsonResponse({'suggestions': suggestions})
+    response['Cache-Control'] = 'public, max-age=60'
+    return response
+
+def _sitemap_file(filename):
+    # Written by `manage.py build_sitemaps`, which should run on a schedule
+    try:
+        response = FileResponse(open(os.path.join(sitemap.get_root(), filename), 'rb'), content_type='application/xml')
+    except FileNotFoundError:
+        raise Http404('Sitemap has not been built yet')
+    response['Cache-Control'] = 'public, max-age=3600'
+    return response
+
+def sitemap_index(request):
+    return _sitemap_file(sitemap.INDEX_FILE)
+
+def sitemap_shard(request, number):
+    return _sitemap_file(sitemap.shard_filename(number))
+
+def listing_feed(request, feed_format):
+    """Inventory feed for partners, streamed; ?since= limits it to listings changed after then"""
+    if feed_format not in feed.FORMATS:
+        raise Http404
+    if not feed.check_feed_key(request.GET.get('key') or request.headers.get('X-Feed-Key')):
+        return HttpResponseForbidden('Unknown feed key')
+    since = feed.parse_since(request.GET.get('since'))
+    if request.GET.get('since') and since is None:
+        return HttpResponseBadRequest('since must be an ISO date or datetime')
+
+    compress = accepts_gzip(request)
+    response = StreamingHttpResponse(
+        feed.encoded(feed.feed_chunks(feed_format, since), compress=compress),
+        content_type=f'{feed.FORMATS[feed_format]}; charset=utf-8',
+    )
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    response['Vary'] = 'Accept-Encoding'
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = f'inline; filename="listings.{feed_format}"'
+    return response
+
 def Services(request):
     return render(request,'shelter/services.html')
 
@@ -121,11 +218,7 @@ def Quick_Contact(request):
         form = QuickContactForm(request.POST)
         if form.is_valid():
             cd = form.cleaned_data
-            saveform = Quickcontact.objects.create(
-                name=cd['name'],
-                email=cd['email'],
-                phone=cd['phone']
-            )
+            submit_lead('quickcontact', name=cd['name'], email=cd['email'], phone=cd['phone'])
             messages.success(request, "Thank you! Your message has been received.")
             return redirect('index')
         else:
@@ -143,7 +236,14 @@ def UserAgentContact(request):
         property_id = request.POST.get('property_id')  # Property ID
         agent_id = request.POST.get('agent_id')  # Agent ID
         
-        agentcontact = AgentContact.objects.create(
+        if property_id and str(property_id).isdigit():
+            # The agent of the listing the visitor was looking at
+            contact_agent_id = Listening.objects.filter(pk=property_id).values_list('agent_id', flat=True).first()
+        else:
+            contact_agent_id = existing_agent_id(agent_id)
+        submit_lead(
+            'agentcontact',
+            agent_id=contact_agent_id,
             agentname=agent_name,
             user_name=user_name,
             user_email=user_email,
@@ -170,43 +270,36 @@ def UserAgentContact(request):
 
 def newsletter_signup(request):
     if request.method == 'POST':
+        email = normalize_email(request.POST.get('email'))
         try:
-            name = request.POST.get('name')
-            email = request.POST.get('email')
-            phone = request.POST.get('phone', '')
-            whatsapp = request.POST.get('whatsapp') == 'on'
-            
-            # Check if email already exists
-            if Newsletter.objects.filter(email=email).exists():
-                return JsonResponse({
-                    'success': False,
-                    'message': 'You are already subscribed to our newsletter!'
-                })
-            
-            # Create new subscriber
-            Newsletter.objects.create(
-                name=name,
-                email=email,
-                phone=phone,
-                whatsapp_updates=whatsapp
-            )
-            
-            return JsonResponse({
-                'success': True,
-                'message': 'Thank you for subscribing to our newsletter!'
-            })
-            
-        except Exception as e:
+            validate_email(email)
+        except ValidationError:
             return JsonResponse({
                 'success': False,
-                'message': 'An error occurred. Please try again.'
+                'message': 'Please enter a valid email address.'
             })
+        
+        # Queued; the flusher upserts on email, so signing up again
+        # reactivates a lapsed subscription instead of failing
+        submit_lead(
+            'newsletter',
+            name=(request.POST.get('name') or '')[:100],
+            email=email,
+            phone=(request.POST.get('phone') or '')[:20],
+            whatsapp_updates=request.POST.get('whatsapp') == 'on'
+        )
+        
+        return JsonResponse({
+            'success': True,
+            'message': 'Thank you for subscribing to our newsletter!'
+        })
             
     return JsonResponse({
         'success': False,
         'message': 'Invalid request method.'
     })
 
+@versioned_page('agent', 'team')
 def about_view(request):
     agents = Agent.objects.all()[:4]
     from team.models import Team
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('team', '0004_alter_team_created_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='updated',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
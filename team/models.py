@@ -55,6 +55,7 @@ class Team(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField()
     photo = models.ImageField(upload_to='photos/%Y/%m/%d/')
+    renditions = models.JSONField(default=dict, blank=True, editable=False, help_text="Resized copies of the photos, see shelter.images")
     phone = models.CharField(max_length=20)
     email = models.EmailField(max_length=50)
     linkedin = models.URLField(blank=True)
@@ -79,6 +80,7 @@ class Team(models.Model):
         help_text="Link to user account if team member has system access"    )
     is_published = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
 
     def work_experience_as_list(self):
         """Returns work_experience as a list of bullet points"""
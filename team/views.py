@@ -7,7 +7,9 @@ from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth import get_user_model
 import csv
 import json
-from .models import Team, TeamContactMessage, TeamRole
+from shelter.decorators import conditional_page
+from shelter.leads import submit_lead
+from .models import Team, TeamRole
 
 User = get_user_model()
 
@@ -18,6 +20,13 @@ def team(request):
     }
     return render(request, 'team/team.html', context)
 
+def _team_validators(request, team_id):
+    updated = Team.objects.filter(pk=team_id).values_list('updated', flat=True).first()
+    if updated is None:
+        return None
+    return (team_id, updated.isoformat()), updated
+
+@conditional_page(_team_validators)
 def team_detail(request, team_id):
     team = get_object_or_404(Team, pk=team_id)
     work_experience = team.work_experience_as_list()
@@ -43,15 +52,15 @@ def team_contact(request, team_id):
             messages.error(request, 'All fields are required.')
             return redirect('team:team_detail', team_id=team_id)
         
-        # Create contact message
-        contact = TeamContactMessage(
-            team=team,
+        # Queue the contact message
+        submit_lead(
+            'teamcontact',
+            team_id=team.pk,
             name=name,
             email=email,
             phone=phone,
             message=message
         )
-        contact.save()
         
         # Add success message and redirect to team detail page
         messages.success(request, 'Your message has been sent successfully. We\'ll get back to you soon.')
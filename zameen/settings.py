@@ -38,6 +38,8 @@ AUTH_USER_MODEL = 'users.User'
 MIDDLEWARE = [
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'shelter.middleware.PrerenderedPageMiddleware',
+    'shelter.middleware.RateLimitMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +96,39 @@ if 'DATABASE_URL' in os.environ:
         default=os.environ.get('DATABASE_URL')
     )
 
+# Cache
+# Version counters used for cache invalidation must be shared by every worker,
+# so production should point REDIS_URL at a shared Redis instance. Without it
+# both caches are SQLite files in /dev/shm that all workers on this host share
+# (see shelter/cache_backends.py); running on several hosts needs Redis.
+if 'REDIS_URL' in os.environ:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        },
+        'ratelimit': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+            'KEY_PREFIX': 'ratelimit',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'shelter.cache_backends.SQLiteCache',
+            'LOCATION': os.environ.get('SHARED_CACHE_PATH', 'cache.sqlite3'),
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        },
+        # A bucket per client IP and endpoint, kept apart from cached pages,
+        # so each limit holds for the host rather than per worker process
+        'ratelimit': {
+            'BACKEND': 'shelter.cache_backends.SQLiteCache',
+            'LOCATION': os.environ.get('RATE_LIMIT_CACHE_PATH', 'ratelimit.sqlite3'),
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -168,10 +203,104 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Seconds clients, CDNs and the server cache keep an API response; data
+# changes retire the server copy at once (see shelter/api.py)
+API_CACHE_SECONDS = 60
+
+# Rows one POST to the listing import API may carry; files beyond that go
+# through `manage.py import_listings`
+LISTING_IMPORT_API_MAX_ROWS = 10000
+
 # CORS Settings (if needed for frontend integration)
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
     "http://127.0.0.1:3000",
 ]
 
-CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only allow all origins in development
\ No newline at end of file
+CORS_ALLOW_ALL_ORIGINS = DEBUG  # Only allow all origins in development
+# Property search
+# Lower bounds (INR) of the price bands counted on the search page
+SEARCH_PRICE_BUCKETS = [0, 1000000, 2500000, 5000000, 10000000]
+# Seconds a cached search result page or facet set is kept (invalidated on any listing change)
+SEARCH_CACHE_SECONDS = 600
+
+# Minimum word similarity (0-1) of a typo tolerant match on title or location
+SEARCH_FUZZY_THRESHOLD = 0.5
+# Seconds before a worker rebuilds its trigram index after other workers changed listings
+SEARCH_FUZZY_REFRESH_SECONDS = 300
+
+# Listing rank boosts, in days of recency (see shelter/ranking.py). Run
+# `manage.py backfill_search_fields` after changing them.
+LISTING_RANK_WEIGHTS = {
+    'featured': 30,
+    'priority': {'low': 0, 'medium': 7, 'high': 14},
+    'text': 60,
+}
+
+# Feature weights for "similar homes" (see shelter/similar.py). Run
+# `manage.py build_similar_listings` after changing them, and schedule
+# `manage.py build_similar_listings --pending` every few minutes for edits.
+SIMILAR_LISTING_WEIGHTS = {
+    'price': 2.0,
+    'bedrooms': 1.0,
+    'bathrooms': 0.5,
+    'area': 1.0,
+    'location': 1.5,
+    'status': 3.0,
+}
+
+# Seconds that CDNs and browsers may reuse public listing pages; the page
+# cache itself drops them as soon as a listing changes
+PUBLIC_PAGE_CACHE_SECONDS = 60
+# Upper bound for pages cached until their data changes (homepage, about page)
+VERSIONED_PAGE_CACHE_SECONDS = 3600
+
+# Background threads per worker that resize uploaded photos (see shelter/images.py).
+# `manage.py build_image_renditions` makes any that are missing.
+IMAGE_RENDITION_WORKERS = 2
+
+# Static pages written to disk as HTML by `manage.py prerender_pages` (see
+# shelter/prerender.py). They are rewritten when templates change; browsers and
+# CDNs keep them for PRERENDER_CACHE_SECONDS, then revalidate by ETag.
+PRERENDER_ROOT = os.path.join(BASE_DIR, 'prerendered')
+PRERENDER_CACHE_SECONDS = 86400
+
+# XML sitemap of the listings, written by `manage.py build_sitemaps` (run it
+# from cron, it only rewrites shards whose listings changed). SITE_URL is the
+# public address the sitemap links to.
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+SITEMAP_ROOT = os.path.join(BASE_DIR, 'sitemaps')
+
+# Keys partners pass (?key= or X-Feed-Key) to read /feed/listings.xml and
+# /feed/listings.jsonl, comma separated. Without keys the feed is closed
+# unless PARTNER_FEED_OPEN=1 opens it to everyone.
+PARTNER_FEED_KEYS = [key for key in os.environ.get('PARTNER_FEED_KEYS', '').split(',') if key]
+PARTNER_FEED_OPEN = os.environ.get('PARTNER_FEED_OPEN') == '1'
+
+# Contact forms and newsletter signups are appended to a journal in
+# LEAD_OUTBOX_ROOT and written to the database in batches every
+# LEAD_FLUSH_SECONDS by a thread in each worker (see shelter/leads.py).
+# LEAD_OUTBOX_FSYNC makes each submission survive a power cut, at a disk
+# flush per request; LEAD_OUTBOX = False inserts during the request instead.
+LEAD_OUTBOX = True
+LEAD_OUTBOX_ROOT = os.path.join(BASE_DIR, 'lead_outbox')
+LEAD_FLUSH_SECONDS = 2
+LEAD_OUTBOX_FSYNC = False
+# Calling code given to national numbers (a leading 0, or just the
+# LEAD_PHONE_NATIONAL_DIGITS of a mobile number) when leads are matched by
+# phone across forms (see shelter.leads.normalize_phone)
+LEAD_PHONE_COUNTRY_CODE = '91'
+LEAD_PHONE_NATIONAL_DIGITS = 10
+
+# Requests a client IP may make to each endpoint (by URL name) per `seconds`,
+# in bursts of up to `requests`; more get a 429 before any database work (see
+# shelter/ratelimit.py). Set RATE_LIMIT_PROXY_COUNT to the number of proxies
+# in front of Django that append to X-Forwarded-For, 0 trusts REMOTE_ADDR.
+RATE_LIMIT_CACHE = 'ratelimit'
+RATE_LIMIT_PROXY_COUNT = int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0))
+RATE_LIMITS = {
+    'newsletter_signup': {'requests': 5, 'seconds': 600, 'methods': ('POST',)},
+    'contact': {'requests': 5, 'seconds': 600, 'methods': ('POST',)},
+    'quickcontact': {'requests': 5, 'seconds': 600, 'methods': ('POST',)},
+    'search': {'requests': 60, 'seconds': 60, 'methods': ('GET',)},
+}
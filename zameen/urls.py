@@ -9,6 +9,7 @@ urlpatterns = [
     path('',include('shelter.urls')),
     path('agents/',include('agents.urls')),
     path('team/', include('team.urls')),
+    path('api/', include('shelter.api_urls')),
 ]
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,24 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'zameen.settings')
 
 application = get_wsgi_application()
 
+# Each worker builds its typeahead index before serving, not on the first keystroke
+from django.db import DatabaseError
+from shelter.autocomplete import warm_index
+
+try:
+    warm_index()
+except DatabaseError:
+    # Database not reachable yet, the index is built on first use instead
+    pass
+
+
+# Static pages are written to disk once per deploy, not by the first visitor
+from shelter.prerender import current_manifest
+
+current_manifest()
+
+
+# Leads queued before a restart are written without waiting for a new one
+from shelter.leads import start_flusher
+
+start_flusher()